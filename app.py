@@ -2,7 +2,8 @@ from flask import Flask, render_template, redirect, url_for
 from config import Config
 from models import db, User
 from flask_login import LoginManager
-from flask_migrate import Migrate
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import inspect
 import os
 
 def create_app(config_class=Config):
@@ -11,7 +12,39 @@ def create_app(config_class=Config):
 
     # Initialize extensions
     db.init_app(app)
-    migrate = Migrate(app, db)
+    migrate = Migrate(app, db, render_as_batch=True)
+
+    from utils import coordination
+    coordination.init_app(app)
+
+    # Session listeners: precomputed rollups, per-country row scoping, listing
+    # count invalidation, article revisions and the audit trail
+    import utils.progress
+    import utils.scoping
+    import utils.counts
+    import utils.revisions
+    from utils import audit
+    audit.init_app(app)
+    from utils import manual_preview
+    manual_preview.init_app(app)
+    from utils import manual_catalog
+    manual_catalog.init_app(app)
+    from utils import booklets
+    booklets.init_app(app)
+    from utils import contacts
+    contacts.init_app(app)
+    from utils import storage
+    storage.init_app(app)
+    from utils import uploads
+    uploads.init_app(app)
+    from utils import images
+    images.init_app(app)
+    from utils import maintenance
+    maintenance.init_app(app)
+    from utils import archive
+    archive.init_app(app)
+    from utils import sharding
+    sharding.init_app(app)
     login = LoginManager(app)
     login.login_view = 'auth.login'
 
@@ -51,14 +84,39 @@ def create_app(config_class=Config):
     from routes.articles import bp as articles_bp
     app.register_blueprint(articles_bp)
 
+    from routes.uploads import bp as uploads_bp
+    app.register_blueprint(uploads_bp)
+
+    from routes.audit import bp as audit_bp
+    app.register_blueprint(audit_bp)
+
+    from routes.api import bp as api_bp
+    app.register_blueprint(api_bp)
+
+    from routes.images import bp as images_bp
+    app.register_blueprint(images_bp)
+
+    from utils.provisioning import import_users_command
+    app.cli.add_command(import_users_command)
+
     @app.route('/')
     def index():
         return redirect(url_for('auth.login'))
 
     return app
 
+def upgrade_database():
+    """Bring the database (inside the current app context) up to the latest migration."""
+    tables = inspect(db.engine).get_table_names()
+    if tables and 'alembic_version' not in tables:
+        # Created with db.create_all() before migrations existed: the baseline is there
+        stamp(revision='0001')
+    upgrade()
+
 if __name__ == '__main__':
+    from utils.coordination import start_background_jobs
     app = create_app()
     with app.app_context():
-        db.create_all()
+        upgrade_database()
+    start_background_jobs(app)
     app.run(debug=True)
@@ -0,0 +1,216 @@
+"""Optional async serving mode.
+
+    uvicorn --factory asgi:create_asgi_app
+
+The JSON calendar API is served natively with SQLAlchemy's asyncio engine
+(aiosqlite / asyncpg), so a request waiting on the database does not hold a
+worker thread. Every other path is handed to the regular Flask app through
+asgiref's WsgiToAsgi adapter, so the HTML views behave exactly as under
+`flask run` or gunicorn.
+
+With SHARD_BY_COUNTRY the events live in per-country databases the async
+engine does not know about, so the calendar API is handed to Flask as well,
+where utils.sharding routes each request to its country's database.
+"""
+import json
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import create_app
+from config import Config
+from models import db, Event, EventException, User, ArchivedEvent, ArchivedEventException
+from routes.calendar import occurrence_to_dict, event_values, parse_window, conflict_response
+from utils.recurrence import window_filter, exception_filter, occurrences
+from utils.scoping import EXEMPT_ROLES, country_criteria
+from utils import audit, conflicts
+from utils.coordination import start_background_jobs
+
+# The native routes only take small JSON bodies
+MAX_BODY_LENGTH = 1024 * 1024
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(flask_app):
+    if flask_app.config.get('ASYNC_DATABASE_URL'):
+        return flask_app.config['ASYNC_DATABASE_URL']
+
+    # Use the URL as resolved by Flask-SQLAlchemy (relative sqlite paths live in instance/)
+    with flask_app.app_context():
+        url = db.engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        if flask_app.config['SHARD_BY_COUNTRY']:
+            self.engine = None
+            self.routes = {}
+            return
+        self.engine = create_async_engine(async_database_url(flask_app))
+        self.routes = {
+            ('GET', '/calendar/api/events'): self.get_events,
+            ('POST', '/calendar/api/events/create'): self.create_event,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http':
+            handler = self.routes.get((scope['method'], scope['path']))
+            if handler:
+                return await handler(scope, receive, send)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def session_user_id(self, scope):
+        # Same cookie and signature Flask-Login relies on in the sync app
+        cookies = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookies.load(value.decode('latin-1'))
+
+        morsel = cookies.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        if not morsel:
+            return None
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            session = self.session_serializer.loads(morsel.value, max_age=max_age)
+        except BadSignature:
+            return None
+        return session.get('_user_id')
+
+    async def load_user(self, conn, scope):
+        user_id = self.session_user_id(scope)
+        if not user_id:
+            return None
+        result = await conn.execute(
+            select(User.id, User.role, User.country_id).where(User.id == int(user_id))
+        )
+        return result.first()
+
+    async def read_body(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_LENGTH:
+                raise ValueError('Request body too large')
+            if not message.get('more_body'):
+                return body
+
+    async def get_events(self, scope, receive, send):
+        async with self.engine.connect() as conn:
+            user = await self.load_user(conn, scope)
+            if user is None:
+                return await send_json(send, {'status': 'error', 'message': 'No autenticado'}, 401)
+
+            try:
+                args = {k: v[0] for k, v in parse_qs(scope['query_string'].decode()).items()}
+                window_start, window_end = parse_window(args)
+            except ValueError as e:
+                return await send_json(send, {'status': 'error', 'message': str(e)}, 400)
+
+            rows, exceptions = [], []
+            # Hot and archived events (utils.archive) have the same columns
+            for model, exception_model in ((Event, EventException), (ArchivedEvent, ArchivedEventException)):
+                query = select(model.__table__).where(window_filter(window_start, window_end, model))
+                if user.role not in EXEMPT_ROLES[model]:
+                    query = query.where(country_criteria(model, user.country_id))
+                found = (await conn.execute(query)).all()
+                rows += found
+
+                recurring_ids = [row.id for row in found if row.rrule]
+                if recurring_ids:
+                    exceptions += (await conn.execute(
+                        select(exception_model.__table__).where(
+                            exception_filter(recurring_ids, window_start, window_end, exception_model))
+                    )).all()
+
+        await send_json(send, [
+            occurrence_to_dict(*occurrence)
+            for occurrence in occurrences(rows, exceptions, window_start, window_end)
+        ])
+
+    async def create_event(self, scope, receive, send):
+        async with self.engine.begin() as conn:
+            user = await self.load_user(conn, scope)
+            if user is None:
+                return await send_json(send, {'status': 'error', 'message': 'No autenticado'}, 401)
+            if user.role not in ['admin', 'coordinator']:
+                return await send_json(send, {'status': 'error', 'message': 'Permiso denegado'}, 403)
+
+            try:
+                data = json.loads(await self.read_body(receive))
+                values = dict(event_values(data), country_id=user.country_id, created_by=user.id)
+                same, other = await self.find_conflicts(conn, values)
+                if same and not data.get('force'):
+                    return await send_json(send, conflict_response(same, other), 409)
+                result = await conn.execute(insert(Event.__table__).values(**values))
+            except Exception as e:
+                return await send_json(send, {'status': 'error', 'message': str(e)}, 400)
+
+        event_id = result.inserted_primary_key[0]
+        # Core writes bypass the session listeners, so audit explicitly
+        with self.flask_app.app_context():
+            audit.record('event', event_id, 'insert', values, user.id)
+            conflicts.note_event(user.country_id, event_id, values['start_time'], values['end_time'], values['rrule'])
+        await send_json(send, {'status': 'success', 'id': event_id, 'conflicts': same, 'overlaps': other})
+
+    async def find_conflicts(self, conn, values):
+        # The same statements as utils.conflicts.event_conflicts, awaited
+        country_id, location = values['country_id'], values['location'] or None
+        spans = conflicts.windows(values['start_time'], values['end_time'], values['rrule'])
+        if not spans:
+            return [], []
+        start, end = conflicts.span(spans)
+        with self.flask_app.app_context():
+            long_ids = conflicts.long_events(country_id)
+        singles = (await conn.execute(conflicts.single_statement(country_id, start, end, long_ids))).all()
+        series = (await conn.execute(conflicts.series_statement(country_id, start, end))).all()
+        exceptions = []
+        if series:
+            exceptions = (await conn.execute(conflicts.exceptions_statement(
+                [row.id for row in series], start, conflicts.window_end(start, end)))).all()
+        return conflicts.clashes_per_window(conflicts.booked(singles, series, exceptions, start, end),
+                                            spans, location)
+
+
+def create_asgi_app(config_class=Config):
+    app = create_app(config_class)
+    start_background_jobs(app)
+    return AsyncApp(app)
@@ -0,0 +1,131 @@
+"""Compare the sync Flask calendar API with the async one from asgi.py.
+
+    python bench_calendar.py --events 2000 --clients 1 10 50 100
+
+Both paths run in this process against the same database. The sync path is
+driven through the WSGI app by a fixed pool of worker threads (one thread is
+a plain sync gunicorn worker); the async path is driven through the ASGI app
+with one asyncio task per client. Pass --database-url to point both at
+Postgres, where DB round trips dominate and the difference is largest.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def report(label, clients, elapsed, latencies):
+    print(f'{label:<6} {clients:>8} {len(latencies) / elapsed:>10.1f} '
+          f'{statistics.median(latencies) * 1000:>9.1f} {percentile(latencies, 95) * 1000:>9.1f}')
+
+
+def bench_sync(flask_app, cookie, clients, requests_per_client, threads):
+    def one_client(submitted):
+        client = flask_app.test_client()
+        client.set_cookie(flask_app.config['SESSION_COOKIE_NAME'], cookie)
+        latencies = []
+        for i in range(requests_per_client):
+            # The first request also pays for the time spent queued behind other clients
+            start = submitted if i == 0 else time.perf_counter()
+            response = client.get('/calendar/api/events')
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    # A sync worker serves at most `threads` clients at once; the rest queue up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one_client, [start] * clients))
+    return time.perf_counter() - start, [l for r in results for l in r]
+
+
+async def bench_async(asgi_app, cookie_header, clients, requests_per_client):
+    async def one_request():
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/calendar/api/events',
+            'query_string': b'', 'headers': [(b'cookie', cookie_header)],
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            pass
+
+        start = time.perf_counter()
+        await asgi_app(scope, receive, send)
+        return time.perf_counter() - start
+
+    async def one_client():
+        return [await one_request() for _ in range(requests_per_client)]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_client() for _ in range(clients)))
+    return time.perf_counter() - start, [l for r in results for l in r]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--requests', type=int, default=5, help='requests per client')
+    parser.add_argument('--threads', type=int, default=1, help='threads in the sync worker')
+    args = parser.parse_args()
+
+    from config import Config
+    from models import db, Country, User, Event
+    from asgi import create_asgi_app
+
+    workdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        MANUALS_FOLDER = os.path.join(workdir, 'manuals')
+
+    asgi_app = create_asgi_app(BenchConfig)
+    flask_app = asgi_app.flask_app
+
+    with flask_app.app_context():
+        db.create_all()
+        country = Country(name='Bench', code='BN')
+        user = User(username='bench', email='bench@amici.com', role='coordinator', country=country)
+        user.set_password('bench')
+        db.session.add_all([country, user])
+        db.session.flush()
+        start = datetime(2024, 1, 1, 9)
+        db.session.add_all([
+            Event(title=f'Evento {i}', start_time=start + timedelta(hours=i), country_id=country.id,
+                  location='Sala', description='Benchmark', created_by=user.id)
+            for i in range(args.events)
+        ])
+        db.session.commit()
+
+    login = flask_app.test_client()
+    login.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+    cookie = login.get_cookie(flask_app.config['SESSION_COOKIE_NAME']).value
+    cookie_header = f"{flask_app.config['SESSION_COOKIE_NAME']}={cookie}".encode()
+
+    print(f'{args.events} events, {args.requests} requests per client, sync threads={args.threads}')
+    print(f"{'mode':<6} {'clients':>8} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    loop = asyncio.new_event_loop()
+    for clients in args.clients:
+        report('sync', clients, *bench_sync(flask_app, cookie, clients, args.requests, args.threads))
+        report('async', clients, *loop.run_until_complete(
+            bench_async(asgi_app, cookie_header, clients, args.requests)))
+    loop.run_until_complete(asgi_app.engine.dispose())
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
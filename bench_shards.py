@@ -0,0 +1,122 @@
+"""Per-tenant latency with one shared database vs one database per country.
+
+    python bench_shards.py --tenants 1 4 16 64 --events 2000 --editions 20
+
+For each tenant count the same data is loaded twice, into a single database
+and with SHARD_BY_COUNTRY, and one country's coordinator requests the calendar
+month, the editions list and the articles list. With a shared database every
+tenant's rows sit in the same tables and indexes; with shards the requesting
+tenant's tables hold only its own rows, so its latency should not move as
+tenants are added. Pass --database-url to run against PostgreSQL (one schema
+per country) instead of throwaway SQLite files.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ENDPOINTS = {
+    'calendar': '/calendar/api/events?start=2024-06-01T00:00:00&end=2024-07-01T00:00:00',
+    'editions': '/editions/',
+    'articles': '/articles/',
+}
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def build(args, tenants, sharded):
+    from config import Config
+    from app import create_app
+    from models import db, Country, User, Edition, Article, Event
+    from sqlalchemy import insert
+    from utils import sharding
+
+    workdir = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        MANUALS_FOLDER = os.path.join(workdir, 'manuals')
+        AUDIT_FOLDER = os.path.join(workdir, 'audit')
+        SHARDS_FOLDER = os.path.join(workdir, 'shards')
+        SHARD_BY_COUNTRY = sharded
+        COORDINATION_BACKEND = 'memory'
+        HOUSEKEEPING_INTERVAL = DB_OPTIMIZE_INTERVAL = ARCHIVE_INTERVAL = 0
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = datetime(2024, 1, 1, 9)
+        for n in range(tenants):
+            country = Country(name=f'Pais {n}', code=f'P{n}')
+            user = User(username=f'coord{n}', email=f'coord{n}@amici.com', role='coordinator', country=country)
+            user.set_password('bench')
+            db.session.add_all([country, user])
+            db.session.commit()
+            with sharding.use(country.id):
+                db.session.execute(insert(Event), [
+                    dict(title=f'Evento {i}', start_time=start + timedelta(hours=4 * i), country_id=country.id,
+                         location='Sala', description='Benchmark', created_by=user.id)
+                    for i in range(args.events)
+                ])
+                editions = [Edition(title=f'Edicion {i}', publication_date=date(2024, 1, 1) + timedelta(days=7 * i),
+                                    country_id=country.id, status='in_progress', drive_folder_id='bench')
+                            for i in range(args.editions)]
+                db.session.add_all(editions)
+                db.session.flush()
+                db.session.execute(insert(Article), [
+                    dict(title=f'Articulo {e.id}-{i}', content='Texto ' * 50, edition_id=e.id,
+                         country_id=country.id, author_id=user.id, status='draft')
+                    for e in editions for i in range(args.articles)
+                ])
+                db.session.commit()
+        db.session.remove()
+    return app
+
+
+def measure(app, requests):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'coord0', 'password': 'bench'})
+    results = {}
+    for name, url in ENDPOINTS.items():
+        client.get(url).get_data()  # warm up: engines, rollups, statement cache
+        latencies = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(url)
+            response.get_data()
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, (url, response.status_code)
+        results[name] = latencies
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to throwaway SQLite files')
+    parser.add_argument('--tenants', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--events', type=int, default=2000, help='events per tenant')
+    parser.add_argument('--editions', type=int, default=20, help='editions per tenant')
+    parser.add_argument('--articles', type=int, default=10, help='articles per edition')
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per endpoint')
+    args = parser.parse_args()
+
+    print(f'{args.events} events, {args.editions} editions x {args.articles} articles per tenant; '
+          f'{args.requests} requests per endpoint as tenant 0')
+    print(f"{'mode':<8} {'tenants':>8} " + ' '.join(f'{name + " p50":>14} {"p95":>7}' for name in ENDPOINTS))
+    for tenants in args.tenants:
+        for label, sharded in (('shared', False), ('sharded', True)):
+            results = measure(build(args, tenants, sharded), args.requests)
+            print(f'{label:<8} {tenants:>8} ' + ' '.join(
+                f'{statistics.median(results[name]) * 1000:>14.1f} {percentile(results[name], 95) * 1000:>7.1f}'
+                for name in ENDPOINTS))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,70 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-amici-magazine-2024'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///amici.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Only used by asgi.py; derived from SQLALCHEMY_DATABASE_URI when unset
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
     
     # Upload folders
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'static', 'uploads')
     MANUALS_FOLDER = os.path.join(os.getcwd(), 'static', 'manuals')
     EMBASSIES_FOLDER = os.path.join(os.getcwd(), 'static', 'embassies')
     USERS_FOLDER = os.path.join(os.getcwd(), 'static', 'users')
+
+    # Resumable uploads are staged here (outside static/) until the form that uses them is submitted
+    CHUNKED_UPLOAD_FOLDER = os.path.join(os.getcwd(), 'instance', 'uploads_tmp')
+    CHUNKED_UPLOAD_MAX_LENGTH = int(os.environ.get('CHUNKED_UPLOAD_MAX_LENGTH') or 64 * 1024 * 1024)
+
+    # Audit trail: 'db' writes to the audit_log table, 'jsonl' to daily segment files
+    AUDIT_SINK = os.environ.get('AUDIT_SINK') or 'db'
+    AUDIT_FOLDER = os.path.join(os.getcwd(), 'instance', 'audit')
+    AUDIT_QUEUE_SIZE = 10000
+    AUDIT_BATCH_SIZE = 200
+
+    # Bulk user provisioning: password hashes are computed in parallel
+    PROVISIONING_HASH_WORKERS = int(os.environ.get('PROVISIONING_HASH_WORKERS') or (os.cpu_count() or 2))
+    PROVISIONING_MAX_ROWS = 1000
+
+    # Shared cache, locks and leader election (utils.coordination): 'database'
+    # shares them between workers and nodes, 'memory' is per process
+    COORDINATION_BACKEND = os.environ.get('COORDINATION_BACKEND') or 'database'
+    COORDINATION_LOCK_TTL = 60
+    COORDINATION_LEADER_TTL = 30
+    # Seconds between purges of expired cache rows and stale staged uploads (0 disables)
+    HOUSEKEEPING_INTERVAL = 3600
+
+    # Seconds a listing's row count (utils.counts) is reused
+    COUNT_CACHE_TTL = 60
+
+    # Manual previews (utils.manual_preview)
+    MANUAL_PREVIEW_WORKERS = int(os.environ.get('MANUAL_PREVIEW_WORKERS') or 2)
+    MANUAL_TEXT_MAX_PAGES = 300
+    MANUAL_TEXT_MAX_CHARS = 500000
+
+    # Manual downloads are counted in memory and written every N seconds (utils.manual_catalog)
+    MANUAL_STATS_FLUSH_INTERVAL = 60
+
+    # Seconds between scheduled `db-maint analyze` + vacuum steps on the leader worker (0 disables)
+    DB_OPTIMIZE_INTERVAL = 24 * 3600
+
+    # Archive tier (utils.archive), run daily by the leader worker (0 disables)
+    ARCHIVE_EDITIONS_AFTER_MONTHS = 12
+    ARCHIVE_EVENTS_AFTER_DAYS = 365
+    ARCHIVE_BATCH_SIZE = 200
+    ARCHIVE_INTERVAL = 24 * 3600
+
+    # One database per country for editions, articles and events (utils.sharding):
+    # SQLite files under SHARDS_FOLDER, or one schema per country on PostgreSQL
+    SHARD_BY_COUNTRY = os.environ.get('SHARD_BY_COUNTRY') == '1'
+    SHARDS_FOLDER = os.path.join(os.getcwd(), 'instance', 'shards')
+    SHARD_QUERY_WORKERS = 8
+
+    # Resized photos served by /img (utils.images), evicted least recently used first
+    IMAGE_CACHE_FOLDER = os.path.join(os.getcwd(), 'instance', 'image_cache')
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+
+    # Rendered embassy booklets (utils.booklets), cached until their lists change
+    EXPORTS_FOLDER = os.path.join(os.getcwd(), 'instance', 'exports')
+    EXPORT_WORKERS = 1
+
+    # Members per chunk for `flask contacts normalize` / `duplicates` (utils.contacts)
+    CONTACTS_BATCH_SIZE = 500
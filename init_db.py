@@ -1,9 +1,9 @@
-from app import db, create_app
-from models import User
+from app import create_app, upgrade_database
+from models import db, User
 
 app = create_app()
 with app.app_context():
-    db.create_all()
+    upgrade_database()
     if not User.query.filter_by(username='admin').first():
         u = User(username='admin', email='admin@amici.com', role='admin')
         u.set_password('admin123')
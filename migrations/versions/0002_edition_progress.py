@@ -0,0 +1,39 @@
+"""Edition progress rollups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 12:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('edition_progress',
+    sa.Column('edition_id', sa.Integer(), nullable=False),
+    sa.Column('total_articles', sa.Integer(), nullable=True),
+    sa.Column('assigned_count', sa.Integer(), nullable=True),
+    sa.Column('draft_count', sa.Integer(), nullable=True),
+    sa.Column('review_count', sa.Integer(), nullable=True),
+    sa.Column('approved_count', sa.Integer(), nullable=True),
+    sa.Column('layout_count', sa.Integer(), nullable=True),
+    sa.Column('done_count', sa.Integer(), nullable=True),
+    sa.Column('overdue_count', sa.Integer(), nullable=True),
+    sa.Column('image_count', sa.Integer(), nullable=True),
+    sa.Column('next_deadline', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['edition_id'], ['edition.id'], ),
+    sa.PrimaryKeyConstraint('edition_id')
+    )
+
+
+def downgrade():
+    op.drop_table('edition_progress')
@@ -0,0 +1,50 @@
+"""Indexes backing the country-scoped queries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 12:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_article_edition_id'), ['edition_id'], unique=False)
+
+    with op.batch_alter_table('edition', schema=None) as batch_op:
+        batch_op.create_index('ix_edition_country_publication', ['country_id', 'publication_date'], unique=False)
+
+    with op.batch_alter_table('embassy', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_embassy_list_id'), ['list_id'], unique=False)
+
+    with op.batch_alter_table('embassy_list', schema=None) as batch_op:
+        batch_op.create_index('ix_embassy_list_country_name', ['country_id', 'name'], unique=False)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index('ix_event_country_start', ['country_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_country_start')
+
+    with op.batch_alter_table('embassy_list', schema=None) as batch_op:
+        batch_op.drop_index('ix_embassy_list_country_name')
+
+    with op.batch_alter_table('embassy', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_embassy_list_id'))
+
+    with op.batch_alter_table('edition', schema=None) as batch_op:
+        batch_op.drop_index('ix_edition_country_publication')
+
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_article_edition_id'))
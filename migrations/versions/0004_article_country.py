@@ -0,0 +1,37 @@
+"""Article.country_id, a copy of the edition's country
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 12:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('country_id', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_article_country_status_id', ['country_id', 'status', 'id'], unique=False)
+        batch_op.create_foreign_key('fk_article_country_id_country', 'country', ['country_id'], ['id'])
+
+    # Existing articles take their edition's country; utils.scoping keeps it in sync from here on
+    op.execute(
+        'UPDATE article SET country_id = '
+        '(SELECT edition.country_id FROM edition WHERE edition.id = article.edition_id) '
+        'WHERE country_id IS NULL'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('article', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_article_country_id_country', type_='foreignkey')
+        batch_op.drop_index('ix_article_country_status_id')
+        batch_op.drop_column('country_id')
@@ -0,0 +1,44 @@
+"""Recurring events and their exceptions
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 12:50:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rrule', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('recurrence_end', sa.DateTime(), nullable=True))
+
+    op.create_table('event_exception',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('original_start', sa.DateTime(), nullable=False),
+    sa.Column('is_cancelled', sa.Boolean(), nullable=True),
+    sa.Column('title', sa.String(length=100), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.Column('end_time', sa.DateTime(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('location', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['event.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id', 'original_start')
+    )
+
+
+def downgrade():
+    op.drop_table('event_exception')
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_column('recurrence_end')
+        batch_op.drop_column('rrule')
@@ -0,0 +1,41 @@
+"""Calendar feed tokens, event change tracking and tombstones
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 13:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('calendar_token', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_user_calendar_token'), ['calendar_token'], unique=True)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_event_country_updated', ['country_id', 'updated_at'], unique=False)
+
+    # Existing events count as changed now, so the first sync token covers them
+    op.execute('UPDATE event SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_country_updated')
+        batch_op.drop_column('deleted_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_calendar_token'))
+        batch_op.drop_column('calendar_token')
@@ -0,0 +1,28 @@
+"""Indexes for the server-side users listing
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 13:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_role'), ['role'], unique=False)
+        batch_op.create_index('ix_user_country_username', ['country_id', 'username'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_country_username')
+        batch_op.drop_index(batch_op.f('ix_user_role'))
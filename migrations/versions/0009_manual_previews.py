@@ -0,0 +1,34 @@
+"""Manual previews: page count, thumbnail and extracted text
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 13:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('manual', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('preview_status', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('page_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('thumbnail', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('text_content', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('processed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('manual', schema=None) as batch_op:
+        batch_op.drop_column('processed_at')
+        batch_op.drop_column('text_content')
+        batch_op.drop_column('thumbnail')
+        batch_op.drop_column('page_count')
+        batch_op.drop_column('preview_status')
@@ -0,0 +1,28 @@
+"""EmbassyList.updated_at, the version of its printable booklet
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 13:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('embassy_list', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute('UPDATE embassy_list SET updated_at = created_at WHERE updated_at IS NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('embassy_list', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
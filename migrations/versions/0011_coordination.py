@@ -0,0 +1,47 @@
+"""Coordination tables: leases and the shared cache
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 13:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('coordination_lease',
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('owner', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('coordination_lease', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_coordination_lease_expires_at'), ['expires_at'], unique=False)
+
+    op.create_table('shared_cache',
+    sa.Column('key', sa.String(length=200), nullable=False),
+    sa.Column('value', sa.Text(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('shared_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_shared_cache_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('shared_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_shared_cache_expires_at'))
+
+    op.drop_table('shared_cache')
+    with op.batch_alter_table('coordination_lease', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_coordination_lease_expires_at'))
+
+    op.drop_table('coordination_lease')
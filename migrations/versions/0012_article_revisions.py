@@ -0,0 +1,39 @@
+"""Article revision history
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 13:50:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('article_revision',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('article_id', sa.Integer(), nullable=False),
+    sa.Column('number', sa.Integer(), nullable=False),
+    sa.Column('snapshot_number', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=140), nullable=True),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('content_hash', sa.String(length=40), nullable=True),
+    sa.Column('content_length', sa.Integer(), nullable=True),
+    sa.Column('chain_size', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['article_id'], ['article.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('article_id', 'number')
+    )
+
+
+def downgrade():
+    op.drop_table('article_revision')
@@ -0,0 +1,143 @@
+"""Archive tables for completed editions and past events
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19 14:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_article',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=140), nullable=True),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('edition_id', sa.Integer(), nullable=True),
+    sa.Column('country_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('deadline', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_article', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_article_edition', ['edition_id'], unique=False)
+
+    op.create_table('archived_article_image',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('article_id', sa.Integer(), nullable=True),
+    sa.Column('filename', sa.String(length=255), nullable=True),
+    sa.Column('uploaded_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_article_image', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_article_image_article', ['article_id'], unique=False)
+
+    op.create_table('archived_article_revision',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('article_id', sa.Integer(), nullable=True),
+    sa.Column('number', sa.Integer(), nullable=True),
+    sa.Column('snapshot_number', sa.Integer(), nullable=True),
+    sa.Column('title', sa.String(length=140), nullable=True),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('content_hash', sa.String(length=40), nullable=True),
+    sa.Column('content_length', sa.Integer(), nullable=True),
+    sa.Column('chain_size', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_article_revision', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_article_revision_article', ['article_id', 'number'], unique=False)
+
+    op.create_table('archived_edition',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=True),
+    sa.Column('publication_date', sa.Date(), nullable=True),
+    sa.Column('drive_folder_id', sa.String(length=100), nullable=True),
+    sa.Column('country_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_edition', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_edition_country_date', ['country_id', 'publication_date'], unique=False)
+
+    op.create_table('archived_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.Column('end_time', sa.DateTime(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('location', sa.String(length=100), nullable=True),
+    sa.Column('country_id', sa.Integer(), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('rrule', sa.String(length=200), nullable=True),
+    sa.Column('recurrence_end', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_event', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_event_country_start', ['country_id', 'start_time'], unique=False)
+
+    op.create_table('archived_event_exception',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=True),
+    sa.Column('original_start', sa.DateTime(), nullable=True),
+    sa.Column('is_cancelled', sa.Boolean(), nullable=True),
+    sa.Column('title', sa.String(length=100), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=True),
+    sa.Column('end_time', sa.DateTime(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('location', sa.String(length=100), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_event_exception', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_event_exception_event', ['event_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('archived_event_exception', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_event_exception_event')
+
+    op.drop_table('archived_event_exception')
+
+    with op.batch_alter_table('archived_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_event_country_start')
+
+    op.drop_table('archived_event')
+
+    with op.batch_alter_table('archived_edition', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_edition_country_date')
+
+    op.drop_table('archived_edition')
+
+    with op.batch_alter_table('archived_article_revision', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_article_revision_article')
+
+    op.drop_table('archived_article_revision')
+
+    with op.batch_alter_table('archived_article_image', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_article_image_article')
+
+    op.drop_table('archived_article_image')
+
+    with op.batch_alter_table('archived_article', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_article_edition')
+
+    op.drop_table('archived_article')
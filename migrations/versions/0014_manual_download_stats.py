@@ -0,0 +1,36 @@
+"""Manual download counters
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19 14:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('manual_download_stat',
+    sa.Column('manual_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('role', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['manual_id'], ['manual.id'], ),
+    sa.PrimaryKeyConstraint('manual_id', 'day', 'role')
+    )
+    with op.batch_alter_table('manual_download_stat', schema=None) as batch_op:
+        batch_op.create_index('ix_manual_download_stat_day', ['day'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('manual_download_stat', schema=None) as batch_op:
+        batch_op.drop_index('ix_manual_download_stat_day')
+
+    op.drop_table('manual_download_stat')
@@ -0,0 +1,26 @@
+"""Event location index for double-booking checks
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19 14:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index('ix_event_country_location_start', ['country_id', 'location', 'start_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_country_location_start')
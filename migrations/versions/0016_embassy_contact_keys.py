@@ -0,0 +1,38 @@
+"""Normalized embassy contact keys
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19 14:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('embassy', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('phone_key', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('email_key', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('instagram_key', sa.String(length=16), nullable=True))
+        batch_op.create_index(batch_op.f('ix_embassy_email_key'), ['email_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_embassy_instagram_key'), ['instagram_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_embassy_phone_key'), ['phone_key'], unique=False)
+
+    # Existing rows get their keys from `flask contacts normalize`
+
+
+def downgrade():
+    with op.batch_alter_table('embassy', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_embassy_phone_key'))
+        batch_op.drop_index(batch_op.f('ix_embassy_instagram_key'))
+        batch_op.drop_index(batch_op.f('ix_embassy_email_key'))
+        batch_op.drop_column('instagram_key')
+        batch_op.drop_column('email_key')
+        batch_op.drop_column('phone_key')
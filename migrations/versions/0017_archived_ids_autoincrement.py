@@ -0,0 +1,73 @@
+"""AUTOINCREMENT on the SQLite tables the archive tier moves rows out of
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19 15:00:00
+
+Without AUTOINCREMENT SQLite hands out max(id) + 1, so once the newest rows
+of a table are archived and the hot copies deleted, new rows take ids the
+archive already holds. Each table is rebuilt with AUTOINCREMENT and its
+sqlite_sequence starts above every id in both the hot and the archived table.
+Per-country SHARDS_FOLDER databases get the same treatment. PostgreSQL
+sequences never hand an id out twice, so there is nothing to do there.
+
+"""
+import glob
+import os
+from alembic import op
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+TABLES = ['edition', 'article', 'article_image', 'article_revision', 'event', 'event_exception']
+
+
+def _rebuild(operations, connection, autoincrement):
+    tables = set(sa.inspect(connection).get_table_names())
+    for table in TABLES:
+        if table not in tables:
+            continue
+        with operations.batch_alter_table(table, recreate='always',
+                                          table_kwargs={'sqlite_autoincrement': autoincrement}):
+            pass
+        if not autoincrement:
+            continue
+        highest = max(
+            connection.exec_driver_sql(f'SELECT max(id) FROM {name}').scalar() or 0
+            for name in (table, f'archived_{table}') if name in tables
+        )
+        if not connection.exec_driver_sql('UPDATE sqlite_sequence SET seq = ? WHERE name = ?',
+                                          (highest, table)).rowcount:
+            connection.exec_driver_sql('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, highest))
+
+
+def _shards():
+    folder = current_app.config.get('SHARDS_FOLDER')
+    return sorted(glob.glob(os.path.join(folder, 'country_*.db'))) if folder else []
+
+
+def _each_database(autoincrement):
+    _rebuild(op, op.get_bind(), autoincrement)
+    for path in _shards():
+        engine = sa.create_engine('sqlite:///' + path)
+        with engine.begin() as connection:
+            _rebuild(Operations(MigrationContext.configure(connection)), connection, autoincrement)
+        engine.dispose()
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        _each_database(True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        _each_database(False)
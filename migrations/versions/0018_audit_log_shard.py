@@ -0,0 +1,28 @@
+"""Audit log shard id
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-19 18:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audit_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('shard_id', sa.Integer(), nullable=True))
+
+    # Rows written before `flask shards split` are tagged by that command
+
+
+def downgrade():
+    with op.batch_alter_table('audit_log', schema=None) as batch_op:
+        batch_op.drop_column('shard_id')
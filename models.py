@@ -1,19 +1,41 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from flask import current_app, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
-db = SQLAlchemy()
+class RoutingSession(Session):
+    # With SHARD_BY_COUNTRY, utils.sharding sends per-country tables to the
+    # current country's database; everything else uses the main one
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get('shard_router')
+            if router is not None:
+                engine = router.bind_for(mapper, clause)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Tables whose rows move to the archive tier keep ids increasing on SQLite even
+# after the highest rows are deleted, so a new row never takes an archived id
+ARCHIVED_IDS = {'sqlite_autoincrement': True}
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, index=True)
     email = db.Column(db.String(120), unique=True, index=True)
     password_hash = db.Column(db.String(128))
-    role = db.Column(db.String(20))  # 'admin', 'coordinator', 'journalist', 'photographer', 'designer', 'community_manager'
+    role = db.Column(db.String(20), index=True)  # 'admin', 'coordinator', 'journalist', 'photographer', 'designer', 'community_manager'
     country_id = db.Column(db.Integer, db.ForeignKey('country.id'))
     profile_photo = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
+    calendar_token = db.Column(db.String(64), unique=True, index=True) # Secret for the personal .ics feed
+
+    # Country-filtered user listings, sorted by username
+    __table_args__ = (db.Index('ix_user_country_username', 'country_id', 'username'),)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -24,6 +46,8 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+USER_ROLES = ['admin', 'coordinator', 'journalist', 'photographer', 'designer', 'community_manager']
+
 class Edition(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100))
@@ -33,18 +57,73 @@ class Edition(db.Model):
     status = db.Column(db.String(20), default='planning')  # planning, in_progress, completed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Country-scoped listings (see utils.scoping) are served straight from this index
+    __table_args__ = (db.Index('ix_edition_country_publication', 'country_id', 'publication_date'), ARCHIVED_IDS)
+
 class Article(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(140))
-    content = db.Column(db.Text)
+    # active_history: utils.revisions needs the replaced value even when it was not loaded before the assignment
+    title = db.column_property(db.Column(db.String(140)), active_history=True)
+    content = db.column_property(db.Column(db.Text), active_history=True)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    edition_id = db.Column(db.Integer, db.ForeignKey('edition.id'))
+    # active_history: utils.progress refreshes the edition an article moves out of as well
+    edition_id = db.column_property(db.Column(db.Integer, db.ForeignKey('edition.id'), index=True), active_history=True)
+    country_id = db.Column(db.Integer, db.ForeignKey('country.id')) # Copy of edition.country_id, maintained by utils.scoping
     status = db.Column(db.String(20), default='draft') # draft, review, approved, layout, done
     deadline = db.Column(db.DateTime)
     
     author = db.relationship('User', backref='articles')
     edition = db.relationship('Edition', backref='articles')
     images = db.relationship('ArticleImage', backref='article', lazy='dynamic', cascade='all, delete-orphan')
+    revisions = db.relationship('ArticleRevision', backref='article', lazy='dynamic', cascade='all, delete-orphan')
+
+    __table_args__ = (db.Index('ix_article_country_status_id', 'country_id', 'status', 'id'), ARCHIVED_IDS)
+
+class ArticleRevision(db.Model):
+    # One row per saved version, written by utils.revisions. Content is either a
+    # full snapshot or a delta against the previous revision (see that module).
+    id = db.Column(db.Integer, primary_key=True)
+    article_id = db.Column(db.Integer, db.ForeignKey('article.id'), nullable=False)
+    number = db.Column(db.Integer, nullable=False) # 1, 2, ... per article
+    snapshot_number = db.Column(db.Integer, nullable=False) # Revision holding the full text this one builds on (itself for snapshots)
+    title = db.Column(db.String(140))
+    data = db.Column(db.Text) # Full content for snapshots, JSON delta otherwise
+    content_hash = db.Column(db.String(40))
+    content_length = db.Column(db.Integer, default=0)
+    chain_size = db.Column(db.Integer, default=0) # Bytes of deltas stored since the snapshot
+    user_id = db.Column(db.Integer) # No FK so history survives user deletion
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('article_id', 'number'), ARCHIVED_IDS)
+
+ARTICLE_STATUSES = ['assigned', 'draft', 'review', 'approved', 'layout', 'done']
+
+class EditionProgress(db.Model):
+    # Per-edition rollup, kept up to date by utils.progress on every flush that touches articles
+    edition_id = db.Column(db.Integer, db.ForeignKey('edition.id'), primary_key=True)
+    total_articles = db.Column(db.Integer, default=0)
+    assigned_count = db.Column(db.Integer, default=0)
+    draft_count = db.Column(db.Integer, default=0)
+    review_count = db.Column(db.Integer, default=0)
+    approved_count = db.Column(db.Integer, default=0)
+    layout_count = db.Column(db.Integer, default=0)
+    done_count = db.Column(db.Integer, default=0)
+    overdue_count = db.Column(db.Integer, default=0)
+    image_count = db.Column(db.Integer, default=0)
+    next_deadline = db.Column(db.DateTime) # Earliest pending deadline still ahead; once it passes overdue_count is stale
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    edition = db.relationship('Edition', backref=db.backref('progress', uselist=False, cascade='all, delete-orphan'))
+
+    @property
+    def completion_pct(self):
+        if not self.total_articles:
+            return 0
+        return round(100 * self.done_count / self.total_articles)
+
+    @property
+    def is_stale(self):
+        return self.next_deadline is not None and self.next_deadline <= datetime.utcnow()
 
 class ArticleImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,6 +131,8 @@ class ArticleImage(db.Model):
     filename = db.Column(db.String(255))
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (ARCHIVED_IDS,)
+
 class Event(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100))
@@ -61,6 +142,34 @@ class Event(db.Model):
     location = db.Column(db.String(100))
     country_id = db.Column(db.Integer, db.ForeignKey('country.id'))
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    rrule = db.Column(db.String(200)) # e.g. 'FREQ=WEEKLY;BYDAY=MO' (see utils.recurrence); NULL for single events
+    recurrence_end = db.Column(db.DateTime) # End of the last occurrence; NULL while the series is unbounded
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime) # Tombstone, kept so feed clients can sync deletions
+
+    exceptions = db.relationship('EventException', backref='event', lazy='dynamic', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_event_country_start', 'country_id', 'start_time'),
+        db.Index('ix_event_country_updated', 'country_id', 'updated_at'),
+        # Bounded range probes for double-booking checks (utils.conflicts)
+        db.Index('ix_event_country_location_start', 'country_id', 'location', 'start_time'),
+        ARCHIVED_IDS,
+    )
+
+class EventException(db.Model):
+    # A cancelled or modified occurrence of a recurring Event, keyed by the occurrence's original start
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    original_start = db.Column(db.DateTime, nullable=False)
+    is_cancelled = db.Column(db.Boolean, default=False)
+    title = db.Column(db.String(100))
+    start_time = db.Column(db.DateTime)
+    end_time = db.Column(db.DateTime)
+    description = db.Column(db.Text)
+    location = db.Column(db.String(100))
+
+    __table_args__ = (db.UniqueConstraint('event_id', 'original_start'), ARCHIVED_IDS)
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -69,6 +178,19 @@ class Notification(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
 
+class AuditLog(db.Model):
+    # Append-only; rows are written in batches by utils.audit, never through the ORM session
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(50), nullable=False) # table name, e.g. 'article'
+    entity_id = db.Column(db.Integer)
+    action = db.Column(db.String(10), nullable=False) # insert, update, delete
+    changes = db.Column(db.Text) # JSON: {column: [old, new]}
+    user_id = db.Column(db.Integer) # No FK so history survives user deletion
+    shard_id = db.Column(db.Integer) # Country whose database holds the row (utils.sharding); ids repeat across shards
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_audit_log_entity', 'entity', 'entity_id', 'id'),)
+
 class Country(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True)
@@ -85,18 +207,40 @@ class Manual(db.Model):
     target_role = db.Column(db.String(50), nullable=False) # 'all', 'journalist', 'photographer', etc.
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Filled in by the background previewer (utils.manual_preview)
+    preview_status = db.Column(db.String(20)) # pending, done, failed
+    page_count = db.Column(db.Integer)
+    thumbnail = db.Column(db.String(255))
+    text_content = db.deferred(db.Column(db.Text)) # Only loaded when searching
+    processed_at = db.Column(db.DateTime)
+
+    download_stats = db.relationship('ManualDownloadStat', backref='manual', cascade='all, delete-orphan')
+
+class ManualDownloadStat(db.Model):
+    # Downloads per manual, day and role, flushed in batches by utils.manual_catalog
+    manual_id = db.Column(db.Integer, db.ForeignKey('manual.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index('ix_manual_download_stat_day', 'day'),)
+
 class EmbassyList(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False) # e.g. "Embajada", "Consulado", "ONG"
     country_id = db.Column(db.Integer, db.ForeignKey('country.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Also bumped when a member changes (utils.booklets); versions the printable booklet
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     country = db.relationship('Country', backref=db.backref('embassy_lists', lazy='dynamic'))
     items = db.relationship('Embassy', backref='list', lazy='dynamic', cascade="all, delete-orphan")
 
+    __table_args__ = (db.Index('ix_embassy_list_country_name', 'country_id', 'name'),)
+
 class Embassy(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    list_id = db.Column(db.Integer, db.ForeignKey('embassy_list.id'), nullable=False)
+    list_id = db.Column(db.Integer, db.ForeignKey('embassy_list.id'), nullable=False, index=True)
     name = db.Column(db.String(150), nullable=False) # "Embajador Juan Perez" or just the name of the entity if different
     ambassador_name = db.Column(db.String(100))
     photo_filename = db.Column(db.String(255))
@@ -104,3 +248,64 @@ class Embassy(db.Model):
     email = db.Column(db.String(120))
     instagram = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Hashes of the normalized phone / email / Instagram, shared by duplicates across lists (utils.contacts)
+    phone_key = db.Column(db.String(16), index=True)
+    email_key = db.Column(db.String(16), index=True)
+    instagram_key = db.Column(db.String(16), index=True)
+
+class CoordinationLease(db.Model):
+    # Locks and leader leases shared by every worker (utils.coordination); written with Core, never the ORM session
+    __tablename__ = 'coordination_lease'
+    name = db.Column(db.String(200), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False) # host:pid:nonce of the holding process
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class SharedCacheEntry(db.Model):
+    # Cross-process cache (utils.coordination); values are JSON
+    __tablename__ = 'shared_cache'
+    key = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.Text)
+    expires_at = db.Column(db.DateTime, index=True) # NULL: never expires
+
+# Archive tier (utils.archive): completed editions and past events are moved
+# out of the hot tables into copies with the same columns. The archive keeps
+# the original ids and has no foreign keys, since the rows it points at may
+# be archived or deleted themselves. Archived rows are read-only.
+
+def _archive_table(model, *indexes):
+    columns = [db.Column(column.name, column.type, primary_key=column.primary_key)
+               for column in model.__table__.columns]
+    return db.Table(f'archived_{model.__table__.name}', *columns,
+                    db.Column('archived_at', db.DateTime), *indexes)
+
+class ArchivedEdition(db.Model):
+    __table__ = _archive_table(Edition, db.Index('ix_archived_edition_country_date', 'country_id', 'publication_date'))
+    is_archived = True
+
+    country = db.relationship('Country', primaryjoin='foreign(ArchivedEdition.country_id) == Country.id', viewonly=True)
+    articles = db.relationship('ArchivedArticle', primaryjoin='foreign(ArchivedArticle.edition_id) == ArchivedEdition.id',
+                               order_by='ArchivedArticle.id', viewonly=True)
+
+class ArchivedArticle(db.Model):
+    __table__ = _archive_table(Article, db.Index('ix_archived_article_edition', 'edition_id'))
+    is_archived = True
+
+    author = db.relationship('User', primaryjoin='foreign(ArchivedArticle.author_id) == User.id', viewonly=True)
+    images = db.relationship('ArchivedArticleImage', primaryjoin='foreign(ArchivedArticleImage.article_id) == ArchivedArticle.id',
+                             order_by='ArchivedArticleImage.id', viewonly=True)
+
+class ArchivedArticleImage(db.Model):
+    __table__ = _archive_table(ArticleImage, db.Index('ix_archived_article_image_article', 'article_id'))
+
+class ArchivedArticleRevision(db.Model):
+    __table__ = _archive_table(ArticleRevision, db.Index('ix_archived_article_revision_article', 'article_id', 'number'))
+
+class ArchivedEvent(db.Model):
+    __table__ = _archive_table(Event, db.Index('ix_archived_event_country_start', 'country_id', 'start_time'))
+    is_archived = True
+
+    exceptions = db.relationship('ArchivedEventException', primaryjoin='foreign(ArchivedEventException.event_id) == ArchivedEvent.id',
+                                 viewonly=True)
+
+class ArchivedEventException(db.Model):
+    __table__ = _archive_table(EventException, db.Index('ix_archived_event_exception_event', 'event_id'))
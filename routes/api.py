@@ -0,0 +1,285 @@
+from flask import Blueprint, request, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import select
+from models import db, Country, Edition, Article, ArticleImage, EmbassyList, Embassy, Manual, Event, User
+from utils.scoping import country_criteria
+import base64
+import binascii
+import json
+
+# Read-only JSON API for the mobile app. Every resource supports
+#   ?fields=a,b        only those columns are SELECTed
+#   ?include=rel       related rows, fetched with one IN query per relationship
+#   ?fields[rel]=a,b   sparse fieldset for an included relationship
+#   ?limit=&cursor=    keyset pagination on id
+#   ?<field>=value     equality filters (value 'null' matches NULL)
+# Rows are read as plain tuples (no ORM objects); country scoping still
+# applies through utils.scoping because the statements select ORM columns.
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+IN_CHUNK_SIZE = 500
+RESERVED_PARAMS = {'fields', 'include', 'limit', 'cursor'}
+MANAGER_ROLES = ('admin', 'coordinator')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class Resource:
+    def __init__(self, model, fields, includes=None, public_fields=None):
+        self.model = model
+        self.fields = fields
+        # name -> (resource, local column, remote column, many)
+        self.includes = includes or {}
+        # What users outside MANAGER_ROLES may see (None: everything)
+        self.public_fields = public_fields
+
+    def column(self, name):
+        return getattr(self.model, name)
+
+    def visible_fields(self):
+        if self.public_fields is not None and current_user.role not in MANAGER_ROLES:
+            return self.public_fields
+        return self.fields
+
+    def access_filters(self):
+        # Filters beyond the country scoping applied to every ORM select
+        model = self.model
+        if model is Event:
+            return [Event.deleted_at.is_(None)]
+        if model is Manual and current_user.role != 'admin':
+            return [Manual.target_role.in_(['all', current_user.role])]
+        if model is User and current_user.role == 'coordinator':
+            return [country_criteria(User, current_user.country_id)]
+        return []
+
+
+RESOURCES = {
+    'countries': Resource(Country, ['id', 'name', 'code']),
+    'editions': Resource(
+        Edition, ['id', 'title', 'publication_date', 'country_id', 'status', 'drive_folder_id', 'created_at'],
+        includes={'country': ('countries', 'country_id', 'id', False),
+                  'articles': ('articles', 'id', 'edition_id', True)}),
+    'articles': Resource(
+        Article, ['id', 'title', 'content', 'author_id', 'edition_id', 'country_id', 'status', 'deadline'],
+        includes={'author': ('users', 'author_id', 'id', False),
+                  'edition': ('editions', 'edition_id', 'id', False),
+                  'images': ('article-images', 'id', 'article_id', True)}),
+    'article-images': Resource(
+        ArticleImage, ['id', 'article_id', 'filename', 'uploaded_at'],
+        includes={'article': ('articles', 'article_id', 'id', False)}),
+    'embassy-lists': Resource(
+        EmbassyList, ['id', 'name', 'country_id', 'created_at', 'updated_at'],
+        includes={'country': ('countries', 'country_id', 'id', False),
+                  'embassies': ('embassies', 'id', 'list_id', True)}),
+    'embassies': Resource(
+        Embassy, ['id', 'list_id', 'name', 'ambassador_name', 'phone', 'email', 'instagram', 'photo_filename', 'created_at'],
+        includes={'list': ('embassy-lists', 'list_id', 'id', False)}),
+    'manuals': Resource(
+        Manual, ['id', 'name', 'filename', 'target_role', 'uploaded_at', 'page_count', 'thumbnail', 'preview_status']),
+    'events': Resource(
+        Event, ['id', 'title', 'start_time', 'end_time', 'description', 'location', 'country_id', 'created_by',
+                'rrule', 'recurrence_end', 'updated_at'],
+        includes={'country': ('countries', 'country_id', 'id', False),
+                  'creator': ('users', 'created_by', 'id', False)}),
+    'users': Resource(
+        User, ['id', 'username', 'email', 'role', 'country_id', 'is_active', 'profile_photo'],
+        includes={'country': ('countries', 'country_id', 'id', False)},
+        public_fields=['id', 'username', 'role', 'country_id', 'profile_photo']),
+}
+
+
+def _converter(column):
+    python_type = None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        pass
+    if python_type is not None and hasattr(python_type, 'isoformat'):
+        return lambda value: value.isoformat() if value is not None else None
+    return None
+
+
+def _fieldset(resource, requested, required=()):
+    """(columns to select, names to output) for a sparse fieldset."""
+    visible = resource.visible_fields()
+    if requested:
+        names = [name for name in requested.split(',') if name]
+        unknown = [name for name in names if name not in visible]
+        if unknown:
+            raise ApiError(f"Campos desconocidos: {', '.join(unknown)}")
+    else:
+        names = list(visible)
+    selected = list(dict.fromkeys(['id', *names, *required]))
+    return selected, names
+
+
+def _rows(resource, selected, stmt_filters, limit=None, after=None):
+    columns = [resource.column(name) for name in selected]
+    stmt = select(*columns).where(*resource.access_filters(), *stmt_filters)
+    if after is not None:
+        stmt = stmt.where(resource.column('id') > after)
+    stmt = stmt.order_by(resource.column('id'))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    converters = [_converter(column) for column in columns]
+    out = []
+    for row in db.session.execute(stmt):
+        item = {}
+        for name, convert, value in zip(selected, converters, row):
+            item[name] = convert(value) if convert else value
+        out.append(item)
+    return out
+
+
+def _attach_includes(resource, items, includes):
+    for name in includes:
+        if name not in resource.includes:
+            raise ApiError(f'Relación desconocida: {name}')
+        target_name, local, remote, many = resource.includes[name]
+        target = RESOURCES[target_name]
+        selected, names = _fieldset(target, request.args.get(f'fields[{name}]'), required=[remote])
+
+        keys = sorted({item[local] for item in items if item.get(local) is not None})
+        related = {}
+        for start in range(0, len(keys), IN_CHUNK_SIZE):
+            chunk = keys[start:start + IN_CHUNK_SIZE]
+            for row in _rows(target, selected, [target.column(remote).in_(chunk)]):
+                key = row[remote]
+                row = {field: row[field] for field in names}
+                if many:
+                    related.setdefault(key, []).append(row)
+                else:
+                    related[key] = row
+
+        for item in items:
+            key = item.get(local)
+            item[name] = related.get(key, []) if many else related.get(key)
+
+
+def _resource(name):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError('Recurso desconocido', 404)
+    if resource.model is User and current_user.role not in MANAGER_ROLES:
+        raise ApiError('Permiso denegado', 403)
+    return resource
+
+
+def _filters(resource):
+    filters = []
+    visible = resource.visible_fields()
+    for key, value in request.args.items():
+        if key in RESERVED_PARAMS or key.startswith('fields['):
+            continue
+        if key not in visible:
+            raise ApiError(f'No se puede filtrar por {key}')
+        column = resource.column(key)
+        if value == 'null':
+            filters.append(column.is_(None))
+        else:
+            filters.append(column == _parse_value(column, value))
+    return filters
+
+
+def _parse_value(column, value):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return value.lower() in ('1', 'true')
+    if python_type is int:
+        try:
+            return int(value)
+        except ValueError:
+            raise ApiError(f'Valor inválido para {column.key}')
+    return value
+
+
+def _includes():
+    return [name for name in request.args.get('include', '').split(',') if name]
+
+
+def _encode_cursor(last_id):
+    return base64.urlsafe_b64encode(f'id:{last_id}'.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        prefix, value = raw.split(':', 1)
+        if prefix != 'id':
+            raise ValueError
+        return int(value)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ApiError('Cursor inválido')
+
+
+def _json(payload, status=200):
+    # json.dumps straight to the response; the rows are already plain values
+    return current_app.response_class(
+        json.dumps(payload, ensure_ascii=False, separators=(',', ':')),
+        status=status, mimetype='application/json')
+
+
+@bp.errorhandler(ApiError)
+def handle_api_error(e):
+    return _json({'status': 'error', 'message': e.message}, e.status)
+
+
+@bp.route('/')
+@login_required
+def root():
+    return _json({'resources': sorted(RESOURCES)})
+
+
+@bp.route('/<name>')
+@login_required
+def collection(name):
+    resource = _resource(name)
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    cursor = request.args.get('cursor')
+    after = _decode_cursor(cursor) if cursor else None
+
+    includes = _includes()
+    locals_needed = [resource.includes[i][1] for i in includes if i in resource.includes]
+    selected, names = _fieldset(resource, request.args.get('fields'), required=locals_needed)
+    items = _rows(resource, selected, _filters(resource), limit=limit + 1, after=after)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = _encode_cursor(items[-1]['id'])
+    _attach_includes(resource, items, includes)
+
+    keep = set(names) | set(includes)
+    data = [{key: value for key, value in item.items() if key in keep} for item in items]
+    return _json({'data': data, 'next_cursor': next_cursor})
+
+
+@bp.route('/<name>/<int:id>')
+@login_required
+def item(name, id):
+    resource = RESOURCES.get(name)
+    if resource is None:
+        raise ApiError('Recurso desconocido', 404)
+    # Everyone may read their own user record
+    if not (resource.model is User and id == current_user.id):
+        resource = _resource(name)
+
+    includes = _includes()
+    locals_needed = [resource.includes[i][1] for i in includes if i in resource.includes]
+    selected, names = _fieldset(resource, request.args.get('fields'), required=locals_needed)
+    items = _rows(resource, selected, [resource.column('id') == id])
+    if not items:
+        raise ApiError('No encontrado', 404)
+    _attach_includes(resource, items, includes)
+
+    keep = set(names) | set(includes)
+    return _json({'data': {key: value for key, value in items[0].items() if key in keep}})
@@ -2,6 +2,9 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from models import db, Article, Edition, Country, ArticleImage, User
 from werkzeug.utils import secure_filename
+from utils.uploads import incoming_files
+from utils.storage import remove_stored_file
+from utils.revisions import list_revisions, get_revision, diff_segments
 import os
 from datetime import datetime
 
@@ -10,15 +13,8 @@ bp = Blueprint('articles', __name__, url_prefix='/articles')
 @bp.route('/')
 @login_required
 def index():
-    query = Article.query.join(Edition)
-    
-    if current_user.role != 'admin':
-        if current_user.country_id:
-            query = query.filter(Edition.country_id == current_user.country_id)
-        else:
-            query = query.filter(db.false()) # Return nothing
-            
-    articles = query.order_by(Article.id.desc()).all()
+    # Country filtering is applied by utils.scoping
+    articles = Article.query.order_by(Article.id.desc()).all()
     return render_template('articles/index.html', articles=articles)
 
 @bp.route('/create', methods=['GET', 'POST'])
@@ -42,6 +38,9 @@ def create():
         if current_user.role == 'admin' and request.form.get('author_id'):
             author_id = request.form.get('author_id')
             
+        # Before the article is saved, so an unusable staged upload sends the form back
+        images = incoming_files('images')
+
         article = Article(
             title=title,
             content=content,
@@ -54,7 +53,6 @@ def create():
         db.session.commit()
         
         # Handle Images
-        images = request.files.getlist('images')
         saved_count = 0
         for image in images:
             if image and image.filename and saved_count < 5:
@@ -99,17 +97,11 @@ def create():
 @bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit(id):
-    article = Article.query.get_or_404(id)
-    
-    # Access Control: Admins or Author logic?
-    # Requirement: "Los periodistas crean lo mismo pero solo para el pais que ellos pertenecen."
-    # Implies they can edit their country's articles? or only their own? 
-    # Usually "Articles can be modified" implies broader access. 
-    # Let's restrict non-admins to their country's articles.
-    if current_user.role != 'admin':
-         if not current_user.country or article.edition.country_id != current_user.country_id:
-             flash('No tienes permiso para editar este artículo.')
-             return redirect(url_for('articles.index'))
+    # Non-admins only ever load their country's articles (utils.scoping)
+    article = db.session.get(Article, id)
+    if not article:
+        flash('Artículo no encontrado.')
+        return redirect(url_for('articles.index'))
 
     if request.method == 'POST':
         title = request.form['title']
@@ -136,7 +128,7 @@ def edit(id):
         
         # Limit total images to 5. Check existing count.
         current_image_count = article.images.count()
-        images = request.files.getlist('images')
+        images = incoming_files('images')
         
         saved_count = 0
         images_to_add = 5 - current_image_count
@@ -172,29 +164,76 @@ def edit(id):
         users = []
     
     # Get all editions for the article's country so the dropdown is populated correctly
-    editions = Edition.query.filter_by(country_id=article.edition.country_id).all()
+    editions = Edition.query.filter_by(country_id=article.country_id).all()
 
     return render_template('articles/edit.html', article=article, countries=countries, editions=editions, users=users)
 
+@bp.route('/<int:id>/history')
+@login_required
+def history(id):
+    article = db.session.get(Article, id)
+    if not article:
+        flash('Artículo no encontrado.')
+        return redirect(url_for('articles.index'))
+
+    revisions = list_revisions(article.id)
+    user_ids = {r.user_id for r in revisions if r.user_id}
+    authors = {u.id: u.username for u in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    return render_template('articles/history.html', article=article, revisions=revisions, authors=authors)
+
+@bp.route('/<int:id>/history/<int:number>')
+@login_required
+def revision(id, number):
+    article = db.session.get(Article, id)
+    if not article:
+        flash('Artículo no encontrado.')
+        return redirect(url_for('articles.index'))
+
+    revision = get_revision(article.id, number)
+    if revision is None:
+        flash('Revisión no encontrada.')
+        return redirect(url_for('articles.history', id=id))
+
+    # Compared with the previous revision unless ?against= names another one
+    against = request.args.get('against', number - 1, type=int)
+    base = get_revision(article.id, against) if against and against != number else None
+    segments = diff_segments(base['content'] if base else '', revision['content'])
+    author = db.session.get(User, revision['user_id']) if revision['user_id'] else None
+    return render_template('articles/revision.html', article=article, revision=revision, base=base,
+                           segments=segments, author=author)
+
+@bp.route('/<int:id>/history/<int:number>/restore', methods=['POST'])
+@login_required
+def restore(id, number):
+    article = db.session.get(Article, id)
+    if not article:
+        flash('Artículo no encontrado.')
+        return redirect(url_for('articles.index'))
+
+    revision = get_revision(article.id, number)
+    if revision is None:
+        flash('Revisión no encontrada.')
+        return redirect(url_for('articles.history', id=id))
+
+    # Restoring is just another save, so it shows up as the newest revision
+    article.title = revision['title']
+    article.content = revision['content']
+    db.session.commit()
+    flash(f'Revisión {number} restaurada.')
+    return redirect(url_for('articles.history', id=id))
+
 @bp.route('/<int:id>/delete', methods=['POST'])
 @login_required
 def delete(id):
-    article = Article.query.get_or_404(id)
-    
-    if current_user.role != 'admin':
-         if not current_user.country or article.edition.country_id != current_user.country_id:
-             flash('No tienes permiso para eliminar este artículo.')
-             return redirect(url_for('articles.index'))
+    article = db.session.get(Article, id)
+    if not article:
+        flash('Artículo no encontrado.')
+        return redirect(url_for('articles.index'))
              
     # Images are cascaded deletion in DB, but files remain on disk.
     # Cleanup files (Optional for now/MVP, but good practice)
     for image in article.images:
-        try:
-            full_path = os.path.join(current_app.root_path, 'static', image.filename)
-            if os.path.exists(full_path):
-                os.remove(full_path)
-        except:
-            pass # Ignore errors during deletion
+        remove_stored_file(os.path.join(current_app.root_path, 'static', image.filename))
             
     db.session.delete(article)
     db.session.commit()
@@ -0,0 +1,67 @@
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required, current_user
+from models import db, AuditLog
+from utils.audit import shard_of
+import json
+import os
+
+bp = Blueprint('audit', __name__, url_prefix='/audit')
+
+def _jsonl_history(entity, entity_id, shard_id, before, limit):
+    # Segments are named by day, so walking them newest-first stops early
+    folder = current_app.config['AUDIT_FOLDER']
+    if not os.path.isdir(folder):
+        return []
+    entries = []
+    for segment in sorted(os.listdir(folder), reverse=True):
+        matches = []
+        with open(os.path.join(folder, segment), encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if (entry['entity'] == entity and entry['entity_id'] == entity_id
+                        and entry.get('shard_id') == shard_id):
+                    matches.append(entry)
+        entries.extend(reversed(matches))
+        if len(entries) >= before + limit:
+            break
+    return entries[before:before + limit]
+
+def _with_dropped(response):
+    # Entries this worker could not hand to the sink; the history may be missing them
+    response.headers['X-Audit-Dropped'] = str(current_app.extensions['audit'].dropped)
+    return response
+
+@bp.route('/<entity>/<int:entity_id>')
+@login_required
+def history(entity, entity_id):
+    if current_user.role != 'admin':
+        return jsonify({'status': 'error', 'message': 'Permiso denegado'}), 403
+
+    if entity not in db.metadata.tables:
+        return jsonify({'status': 'error', 'message': 'Entidad desconocida'}), 404
+
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    # Per-country ids repeat across databases: show the selected country's history
+    shard_id = shard_of(entity)
+
+    if current_app.config['AUDIT_SINK'] == 'jsonl':
+        # 'before' is an offset into the newest-first history here
+        offset = request.args.get('before', 0, type=int)
+        entries = _jsonl_history(entity, entity_id, shard_id, offset, limit)
+        for entry in entries:
+            entry['changes'] = json.loads(entry['changes'])
+        return _with_dropped(jsonify(entries))
+
+    query = AuditLog.query.filter_by(entity=entity, entity_id=entity_id, shard_id=shard_id)
+    before = request.args.get('before', type=int)
+    if before:
+        query = query.filter(AuditLog.id < before)
+    rows = query.order_by(AuditLog.id.desc()).limit(limit).all()
+
+    return _with_dropped(jsonify([{
+        'id': row.id,
+        'action': row.action,
+        'changes': json.loads(row.changes),
+        'user_id': row.user_id,
+        'timestamp': row.timestamp.isoformat(),
+    } for row in rows]))
@@ -1,33 +1,260 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, redirect, url_for, flash, abort, Response, stream_with_context
 from flask_login import login_required, current_user
-from models import db, Event
-from datetime import datetime
+from models import db, Event, EventException, User, ArchivedEvent, ArchivedEventException
+from utils.recurrence import parse_rrule, series_end, window_filter, exception_filter, occurrences
+from utils.scoping import EXEMPT_ROLES, country_criteria
+from utils import conflicts, ics, sharding
+from utils.archive import archived_events_before
+from sqlalchemy import func
+from datetime import datetime, timedelta, timezone
+import secrets
 
 bp = Blueprint('calendar', __name__, url_prefix='/calendar')
 
+# Window used when a client doesn't ask for one (recurring series are unbounded)
+DEFAULT_WINDOW_BEFORE = timedelta(days=90)
+DEFAULT_WINDOW_AFTER = timedelta(days=365)
+
+# Feed deltas re-send changes this close to the client's sync point, so rows
+# whose transaction committed slightly after the token was issued aren't missed
+SYNC_OVERLAP = timedelta(seconds=30)
+FEED_CHUNK_SIZE = 500
+
+def parse_window(args):
+    now = datetime.utcnow()
+    start = datetime.fromisoformat(args['start']) if args.get('start') else now - DEFAULT_WINDOW_BEFORE
+    end = datetime.fromisoformat(args['end']) if args.get('end') else now + DEFAULT_WINDOW_AFTER
+    if end <= start:
+        raise ValueError('El fin de la ventana debe ser posterior al inicio.')
+    return start, end
+
+def event_values(data):
+    # Column values for a new event from the API payload (shared with asgi.py)
+    start_time = datetime.fromisoformat(data['start'])
+    end_time = datetime.fromisoformat(data['end']) if data.get('end') else None
+    rrule = data.get('rrule') or None
+    recurrence_end = None
+    if rrule:
+        parse_rrule(rrule)
+        recurrence_end = series_end(start_time, rrule, (end_time - start_time) if end_time else timedelta(0))
+    return dict(
+        title=data['title'],
+        start_time=start_time,
+        end_time=end_time,
+        description=data.get('description', ''),
+        location=data.get('location', ''),
+        rrule=rrule,
+        recurrence_end=recurrence_end
+    )
+
+def occurrence_to_dict(event, start, end, override=None):
+    # Works for ORM objects and plain result rows (used by the async API in asgi.py)
+    return {
+        'id': event.id,
+        'title': (override and override.title) or event.title,
+        'start': start.isoformat(),
+        'end': end.isoformat() if end else None,
+        'description': (override and override.description) or event.description,
+        'location': (override and override.location) or event.location,
+        'rrule': event.rrule,
+        # Identifies the occurrence within its series (what exceptions are keyed by)
+        'recurrence_id': start.isoformat() if event.rrule and override is None else (
+            override.original_start.isoformat() if override is not None else None)
+    }
+
 @bp.route('/')
 @login_required
 def index():
-    return render_template('calendar/index.html')
+    feed_url = None
+    if current_user.calendar_token:
+        feed_url = url_for('calendar.feed', token=current_user.calendar_token, _external=True)
+    return render_template('calendar/index.html', feed_url=feed_url)
+
+@bp.route('/feed/token', methods=['POST'])
+@login_required
+def reset_feed_token():
+    # Generating a new token also revokes the previous feed URL
+    current_user.calendar_token = secrets.token_urlsafe(32)
+    db.session.commit()
+    flash('Enlace de suscripción al calendario generado.')
+    return redirect(url_for('calendar.index'))
+
+def _event_chunks(query):
+    """Yield (event, exceptions) in id order, one keyset page at a time."""
+    # Keyset pagination keeps memory flat no matter how many events there are
+    last_id = 0
+    while True:
+        events = query.filter(Event.id > last_id).order_by(Event.id).limit(FEED_CHUNK_SIZE).all()
+        if not events:
+            return
+        recurring_ids = [event.id for event in events if event.rrule and not event.deleted_at]
+        exceptions = {}
+        if recurring_ids:
+            for exception in EventException.query.filter(EventException.event_id.in_(recurring_ids)):
+                exceptions.setdefault(exception.event_id, []).append(exception)
+        for event in events:
+            yield event, exceptions.get(event.id, ())
+        last_id = events[-1].id
+
+@bp.route('/feed/<token>.ics')
+def feed(token):
+    # Token-authenticated so calendar apps can subscribe without a session
+    user = User.query.filter_by(calendar_token=token).first()
+    if not user or not user.is_active:
+        abort(404)
+    if sharding.enabled():
+        sharding.route_to(user.country_id)
+
+    # Scoped by the token's owner, not by whoever may be logged in in this browser
+    scope = Event.query.execution_options(skip_country_scope=True)
+    if user.role not in EXEMPT_ROLES[Event]:
+        scope = scope.filter(country_criteria(Event, user.country_id))
+
+    last_modified = scope.with_entities(func.max(Event.updated_at)).scalar()
+    token_now = ics.sync_token(last_modified)
+    headers = {'ETag': f'"{token_now}"', 'X-Sync-Token': token_now, 'Cache-Control': 'private, no-cache'}
+    if last_modified:
+        headers['Last-Modified'] = last_modified.replace(tzinfo=timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+    since = ics.parse_sync_token(request.args.get('sync_token'))
+    if since is None and request.if_modified_since and last_modified:
+        # HTTP dates have whole-second precision
+        if_modified_since = request.if_modified_since.astimezone(timezone.utc).replace(tzinfo=None)
+        if last_modified.replace(microsecond=0) <= if_modified_since:
+            return Response(status=304, headers=headers)
+
+    if since is not None:
+        # The token is the newest updated_at when it was issued: nothing newer, nothing to send
+        if not last_modified or last_modified <= since:
+            return Response(status=304, headers=headers)
+        # Deltas include tombstones (emitted as STATUS:CANCELLED)
+        query = scope.filter(Event.updated_at > since - SYNC_OVERLAP)
+    else:
+        query = scope.filter(Event.deleted_at.is_(None))
+
+    name = f"AMICI - {user.country.name}" if user.country else 'AMICI'
+
+    def generate():
+        yield ics.header(name, token_now)
+        for event, exceptions in _event_chunks(query):
+            yield ics.event_to_ics(event, exceptions)
+        yield ics.footer()
+
+    return Response(stream_with_context(generate()), mimetype='text/calendar', headers=headers)
+
+def series_to_dict(event, exceptions=()):
+    # Unexpanded form for the offline client, which expands recurrences itself
+    return {
+        'id': event.id,
+        'title': event.title,
+        'start': event.start_time.isoformat(),
+        'end': event.end_time.isoformat() if event.end_time else None,
+        'description': event.description,
+        'location': event.location,
+        'rrule': event.rrule,
+        'exceptions': [{
+            'recurrence_id': exception.original_start.isoformat(),
+            'cancelled': exception.is_cancelled,
+            'start': exception.start_time.isoformat() if exception.start_time else None,
+            'end': exception.end_time.isoformat() if exception.end_time else None,
+            'title': exception.title,
+            'description': exception.description,
+            'location': exception.location,
+        } for exception in exceptions],
+    }
+
+@bp.route('/api/events/changes')
+@login_required
+def event_changes():
+    # Delta sync for the offline calendar: everything changed since the
+    # client's version, or the full set when it has none (or a stale scope).
+    # Rows are already limited to the user's country by utils.scoping.
+    scope_key = f'{current_user.id}:{current_user.role}:{current_user.country_id}'
+    if sharding.enabled():
+        # An admin switching country needs a full resync
+        scope_key += f':{sharding.current_shard()}'
+    since = ics.parse_sync_token(request.args.get('since'))
+    if request.args.get('scope') != scope_key:
+        since = None
+
+    version = ics.sync_token(db.session.query(func.max(Event.updated_at)).scalar())
+    if since is None:
+        query = Event.query.filter(Event.deleted_at.is_(None))
+    else:
+        query = Event.query.filter(Event.updated_at > since - SYNC_OVERLAP)
+
+    archived_before = archived_events_before()
+    changed, deleted = [], []
+    for event, exceptions in _event_chunks(query):
+        if event.deleted_at:
+            deleted.append(event.id)
+        else:
+            changed.append(series_to_dict(event, exceptions))
+
+    return jsonify({
+        'version': version,
+        'scope': scope_key,
+        'full': since is None,
+        'events': changed,
+        'deleted': deleted,
+        # Older events live in the archive (utils.archive) and are fetched per window
+        'archived_before': archived_before.isoformat() if archived_before else None,
+    })
+
+def _window_events(model, exception_model, window_start, window_end):
+    events = model.query.filter(window_filter(window_start, window_end, model)).all()
+    recurring_ids = [event.id for event in events if event.rrule]
+    exceptions = []
+    if recurring_ids:
+        exceptions = exception_model.query.filter(
+            exception_filter(recurring_ids, window_start, window_end, exception_model)).all()
+    return events, exceptions
+
+@bp.route('/api/events/archive')
+@login_required
+def archived_events():
+    # Unexpanded archived series overlapping the window; the offline client
+    # asks for months before `archived_before` (see event_changes)
+    try:
+        window_start, window_end = parse_window(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    events = ArchivedEvent.query.filter(window_filter(window_start, window_end, ArchivedEvent)).all()
+    # Whole series go to the client, so all of their exceptions do too
+    by_event = {}
+    for exception in ArchivedEventException.query.filter(
+            ArchivedEventException.event_id.in_([event.id for event in events if event.rrule])):
+        by_event.setdefault(exception.event_id, []).append(exception)
+    return jsonify([series_to_dict(event, by_event.get(event.id, ())) for event in events])
 
 @bp.route('/api/events')
 @login_required
 def get_events():
-    query = Event.query
-    if current_user.country_id:
-        query = query.filter_by(country_id=current_user.country_id)
-    events = query.all()
-    events_data = []
-    for event in events:
-        events_data.append({
-            'id': event.id,
-            'title': event.title,
-            'start': event.start_time.isoformat(),
-            'end': event.end_time.isoformat() if event.end_time else None,
-            'description': event.description,
-            'location': event.location
-        })
-    return jsonify(events_data)
+    try:
+        window_start, window_end = parse_window(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if current_user.role == 'admin' and sharding.enabled():
+        # Every country's database at once; ids are per country, so each occurrence names its shard
+        per_country = sharding.fan_out(lambda: _window_occurrences(window_start, window_end))
+        return jsonify([dict(item, shard=country_id) for country_id, items in per_country.items() for item in items])
+    return jsonify(_window_occurrences(window_start, window_end))
+
+def _window_occurrences(window_start, window_end):
+    # Country filtering is applied by utils.scoping
+    events, exceptions = _window_events(Event, EventException, window_start, window_end)
+    archived_before = archived_events_before()
+    if archived_before and window_start < archived_before:
+        archived, archived_exceptions = _window_events(ArchivedEvent, ArchivedEventException, window_start, window_end)
+        events += archived
+        exceptions += archived_exceptions
+
+    return [
+        occurrence_to_dict(*occurrence)
+        for occurrence in occurrences(events, exceptions, window_start, window_end)
+    ]
 
 @bp.route('/api/events/create', methods=['POST'])
 @login_required
@@ -37,17 +264,107 @@ def create_event():
     
     data = request.json
     try:
-        new_event = Event(
-            title=data['title'],
-            start_time=datetime.fromisoformat(data['start']),
-            end_time=datetime.fromisoformat(data['end']) if data.get('end') else None,
-            description=data.get('description', ''),
-            location=data.get('location', ''),
-            country_id=current_user.country_id,
-            created_by=current_user.id
-        )
+        values = event_values(data)
+        country_id = _event_country()
+        same, other = conflicts.event_conflicts(country_id, values['start_time'], values['end_time'],
+                                                values['rrule'], values['location'])
+        if same and not data.get('force'):
+            return jsonify(conflict_response(same, other)), 409
+        new_event = Event(country_id=country_id, created_by=current_user.id, **values)
         db.session.add(new_event)
         db.session.commit()
-        return jsonify({'status': 'success', 'id': new_event.id})
+        conflicts.note_event(country_id, new_event.id, new_event.start_time, new_event.end_time, new_event.rrule)
+        return jsonify({'status': 'success', 'id': new_event.id, 'conflicts': same, 'overlaps': other})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+def _event_country():
+    # An admin's events belong to the country they are working in (utils.sharding)
+    return current_user.country_id or (sharding.current_shard() if sharding.enabled() else None)
+
+def conflict_response(same, other):
+    # Also used by asgi.py; the client resends with 'force' to book anyway
+    return {
+        'status': 'error',
+        'message': 'El lugar ya está ocupado en ese horario.',
+        'conflicts': same,
+        'overlaps': other,
+    }
+
+@bp.route('/api/freebusy')
+@login_required
+def free_busy():
+    """Busy intervals per location in the window, and the free gaps when a location is given."""
+    try:
+        window_start, window_end = parse_window(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    location = request.args.get('location') or None
+    busy = conflicts.free_busy(_event_country(), window_start, window_end, location)
+
+    def spans(intervals):
+        return [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in intervals]
+
+    payload = {
+        'start': window_start.isoformat(),
+        'end': window_end.isoformat(),
+        'busy': {name: spans(intervals) for name, intervals in busy.items()},
+    }
+    if location:
+        payload['free'] = spans(conflicts.free(busy.get(location, []), window_start, window_end))
+    return jsonify(payload)
+
+@bp.route('/api/events/<int:id>/exceptions', methods=['POST'])
+@login_required
+def create_exception(id):
+    """Cancel or modify a single occurrence of a recurring event."""
+    if current_user.role not in ['admin', 'coordinator']:
+        return jsonify({'status': 'error', 'message': 'Permiso denegado'}), 403
+
+    event = db.session.get(Event, id)
+    if not event or not event.rrule:
+        return jsonify({'status': 'error', 'message': 'Evento recurrente no encontrado'}), 404
+
+    data = request.json
+    try:
+        original_start = datetime.fromisoformat(data['recurrence_id'])
+        exception = EventException.query.filter_by(event_id=event.id, original_start=original_start).first()
+        if not exception:
+            exception = EventException(event_id=event.id, original_start=original_start)
+            db.session.add(exception)
+
+        exception.is_cancelled = bool(data.get('cancelled'))
+        exception.title = data.get('title')
+        exception.start_time = datetime.fromisoformat(data['start']) if data.get('start') else None
+        exception.end_time = datetime.fromisoformat(data['end']) if data.get('end') else None
+        exception.description = data.get('description')
+        exception.location = data.get('location')
+        if not exception.is_cancelled and exception.start_time:
+            duration = (event.end_time - event.start_time) if event.end_time else timedelta(0)
+            end_time = exception.end_time or (exception.start_time + duration)
+            same, other = conflicts.find_conflicts(event.country_id, exception.start_time, end_time,
+                                                   exception.location or event.location, exclude_id=event.id)
+            if same and not data.get('force'):
+                db.session.rollback()
+                return jsonify(conflict_response(same, other)), 409
+        db.session.commit()
+        return jsonify({'status': 'success', 'id': exception.id})
     except Exception as e:
+        db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@bp.route('/api/events/<int:id>', methods=['DELETE'])
+@login_required
+def delete_event(id):
+    if current_user.role not in ['admin', 'coordinator']:
+        return jsonify({'status': 'error', 'message': 'Permiso denegado'}), 403
+
+    event = db.session.get(Event, id)
+    if not event or event.deleted_at:
+        return jsonify({'status': 'error', 'message': 'Evento no encontrado'}), 404
+
+    # Soft delete so feed subscribers learn about it on their next sync
+    event.deleted_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify({'status': 'success'})
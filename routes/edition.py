@@ -1,8 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from models import db, Edition, Article, User
+from werkzeug.utils import secure_filename
+from models import db, Edition, Article, ArticleImage, User, Country, EditionProgress, ArchivedEdition
 from utils.drive_api import drive_service
-from datetime import datetime
+from utils.coordination import coordinator, LockUnavailable
+from utils.progress import editions_with_progress
+from utils.zipstream import stream_zip
+from utils import sharding
+from datetime import datetime, date
+import heapq
+import json
+import os
 
 bp = Blueprint('edition', __name__, url_prefix='/editions')
 
@@ -13,26 +21,157 @@ def index():
         flash('Acceso denegado.')
         return redirect(url_for('dashboard.index'))
     
-    query = Edition.query
-    if current_user.role != 'admin' and current_user.country_id:
-        query = query.filter_by(country_id=current_user.country_id)
-        
-    editions = query.order_by(Edition.publication_date.desc()).all()
-    return render_template('edition/index.html', editions=editions)
+    # Country filtering is applied by utils.scoping
+    list_editions = lambda: editions_with_progress(Edition.query.order_by(Edition.publication_date.desc()))
+    if current_user.role == 'admin' and sharding.enabled():
+        # Every country's database at once; each result is already sorted
+        per_country = sharding.fan_out(list_editions).values()
+        rows = list(heapq.merge(*per_country, key=lambda row: row[0].publication_date or date.min, reverse=True))
+    else:
+        rows = list_editions()
+    return render_template('edition/index.html', rows=rows)
+
+@bp.route('/board')
+@login_required
+def board():
+    if current_user.role not in ['admin', 'coordinator']:
+        flash('Acceso denegado.')
+        return redirect(url_for('dashboard.index'))
+
+    countries = []
+    country_id = current_user.country_id
+    if current_user.role == 'admin':
+        countries = Country.query.order_by(Country.name).all()
+        country_id = request.args.get('country_id', type=int)
+        if country_id not in {country.id for country in countries}:
+            country_id = countries[0].id if countries else None
+
+    rows = []
+    if country_id:
+        with sharding.use(country_id):
+            query = Edition.query.filter(Edition.country_id == country_id)
+            rows = editions_with_progress(query.order_by(Edition.publication_date.desc()))
+
+    return render_template('edition/board.html', rows=rows, countries=countries, country_id=country_id)
 
 @bp.route('/<int:id>')
 @login_required
 def view(id):
+    edition = db.session.get(Edition, id)
+    if not edition:
+        # Completed editions move to the archive tables (utils.archive); read-only there
+        edition = db.session.get(ArchivedEdition, id)
+        if not edition:
+            flash('Edición no encontrada.')
+            return redirect(url_for('edition.index'))
+        return render_template('edition/view.html', edition=edition, progress=_archived_progress(edition), archived=True)
+
+    progress = editions_with_progress(Edition.query.filter(Edition.id == edition.id))[0][1]
+    return render_template('edition/view.html', edition=edition, progress=progress)
+
+def _archived_progress(edition):
+    # Transient rollup for the view; archived editions have no progress row
+    articles = edition.articles
+    return EditionProgress(total_articles=len(articles),
+                           done_count=sum(1 for a in articles if a.status == 'done'),
+                           image_count=sum(len(a.images) for a in articles),
+                           overdue_count=0)
+
+ARCHIVE_PAGE_SIZE = 50
+
+@bp.route('/archive')
+@login_required
+def archive():
+    if current_user.role not in ['admin', 'coordinator']:
+        flash('Acceso denegado.')
+        return redirect(url_for('dashboard.index'))
+
+    # Country filtering is applied by utils.scoping
+    pagination = db.paginate(db.select(ArchivedEdition).order_by(ArchivedEdition.publication_date.desc()),
+                             per_page=ARCHIVE_PAGE_SIZE, error_out=False)
+    return render_template('edition/archive.html', pagination=pagination)
+
+# Statuses a designer can lay out
+READY_STATUSES = ('approved', 'layout')
+EXPORT_CHUNK_SIZE = 100
+
+def _article_markdown(article):
+    lines = [f'# {article.title or "Sin título"}', '']
+    if article.author:
+        lines.append(f'- Autor: {article.author.username}')
+    lines.append(f'- Estado: {article.status}')
+    if article.deadline:
+        lines.append(f'- Fecha límite: {article.deadline:%Y-%m-%d}')
+    lines += ['', article.content or '', '']
+    return '\n'.join(lines)
+
+def _edition_bundle(edition, statuses):
+    # Keyset pages of articles, with their images loaded per page
+    static_root = os.path.join(current_app.root_path, 'static')
+    manifest = []
+    query = Article.query.filter(Article.edition_id == edition.id)
+    if statuses:
+        query = query.filter(Article.status.in_(statuses))
+
+    last_id = 0
+    while True:
+        articles = query.filter(Article.id > last_id).order_by(Article.id).limit(EXPORT_CHUNK_SIZE).all()
+        if not articles:
+            break
+        images = {}
+        for image in ArticleImage.query.filter(ArticleImage.article_id.in_([a.id for a in articles])).order_by(ArticleImage.id):
+            images.setdefault(image.article_id, []).append(image)
+
+        for article in articles:
+            folder = f"articles/{article.id}-{secure_filename(article.title or '')[:60] or 'articulo'}"
+            entry = {
+                'id': article.id,
+                'title': article.title,
+                'author': article.author.username if article.author else None,
+                'status': article.status,
+                'deadline': article.deadline.isoformat() if article.deadline else None,
+                'text': f'{folder}/article.md',
+                'images': [],
+            }
+            yield f'{folder}/article.md', _article_markdown(article)
+            for image in images.get(article.id, []):
+                path = os.path.join(static_root, image.filename)
+                arcname = f'{folder}/images/{os.path.basename(image.filename)}'
+                if os.path.isfile(path):
+                    yield arcname, ('file', path)
+                    entry['images'].append(arcname)
+                else:
+                    entry['images'].append({'file': arcname, 'missing': True})
+            manifest.append(entry)
+        last_id = articles[-1].id
+        # Keep the identity map from growing with the edition
+        for obj in articles + [image for page in images.values() for image in page]:
+            db.session.expunge(obj)
+
+    yield 'manifest.json', json.dumps({
+        'edition': {'id': edition.id, 'title': edition.title,
+                    'publication_date': edition.publication_date.isoformat() if edition.publication_date else None},
+        'statuses': list(statuses) if statuses else 'all',
+        'generated_at': datetime.utcnow().isoformat(),
+        'articles': manifest,
+    }, ensure_ascii=False, indent=2)
+
+@bp.route('/<int:id>/export.zip')
+@login_required
+def export_bundle(id):
+    # Country filtering is applied by utils.scoping
     edition = db.session.get(Edition, id)
     if not edition:
         flash('Edición no encontrada.')
         return redirect(url_for('edition.index'))
-        
-    if current_user.country_id and edition.country_id != current_user.country_id:
-        flash('No tienes permiso para ver esta edición.')
-        return redirect(url_for('edition.index'))
 
-    return render_template('edition/view.html', edition=edition)
+    statuses = READY_STATUSES if request.args.get('only') == 'ready' else None
+    name = secure_filename(edition.title or '') or f'edicion-{edition.id}'
+    return Response(
+        stream_with_context(stream_zip(_edition_bundle(edition, statuses))),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{name}.zip"'},
+    )
 
 @bp.route('/<int:id>/add_article', methods=['GET', 'POST'])
 @login_required
@@ -92,30 +231,37 @@ def create():
         # Determine Country
         country_id = current_user.country_id
         if current_user.role == 'admin':
-            country_id = request.form.get('country_id') # Might be None if not sent
+            country_id = request.form.get('country_id', type=int) # Might be None if not sent
+            if country_id and db.session.get(Country, country_id) is None:
+                country_id = None
             
         if not country_id:
             flash('Error: Debes asignar un país a la edición.')
             return redirect(url_for('edition.create'))
 
         try:
-            # Create Drive Folder
-            drive_id = drive_service.create_edition_folders(title)
-
-            new_edition = Edition(
-                title=title,
-                publication_date=publication_date,
-                drive_folder_id=drive_id,
-                country_id=country_id,
-                status='planning'
-            )
-            
-            db.session.add(new_edition)
-            db.session.commit()
+            # A double submit landing on another worker must not create a second Drive folder
+            with coordinator().lock(f'drive-edition:{country_id}:{title}'):
+                drive_id = drive_service.create_edition_folders(title)
+
+                new_edition = Edition(
+                    title=title,
+                    publication_date=publication_date,
+                    drive_folder_id=drive_id,
+                    country_id=country_id,
+                    status='planning'
+                )
+
+                with sharding.use(country_id):
+                    db.session.add(new_edition)
+                    db.session.commit()
             
             flash(f'Edición "{title}" creada exitosamente. Carpeta en Drive generada.')
             return redirect(url_for('dashboard.index'))
-            
+
+        except LockUnavailable:
+            flash(f'La edición "{title}" ya se está creando.')
+            return redirect(url_for('dashboard.index'))
         except Exception as e:
             db.session.rollback()
             print(f"Error creating edition: {e}") # Log to console
@@ -123,7 +269,6 @@ def create():
             return redirect(url_for('edition.create'))
 
     # Prepare countries for dropdown
-    from models import Country
     countries = []
     if current_user.role == 'admin':
         countries = Country.query.all()
@@ -141,11 +286,6 @@ def edit(id):
     if not edition:
         flash('Edición no encontrada.')
         return redirect(url_for('edition.index'))
-        
-    # Permission Check
-    if current_user.role != 'admin' and current_user.country_id != edition.country_id:
-        flash('No tienes permiso para editar esta edición.')
-        return redirect(url_for('edition.index'))
 
     if request.method == 'POST':
         title = request.form['title']
@@ -159,6 +299,10 @@ def edit(id):
         
         # Admin can change country (careful with existing articles!)
         if current_user.role == 'admin' and request.form.get('country_id'):
+            if sharding.enabled() and int(request.form['country_id']) != edition.country_id:
+                # Each country has its own database (utils.sharding)
+                flash('No se puede mover una edición a otro país.')
+                return redirect(url_for('edition.edit', id=edition.id))
             edition.country_id = request.form.get('country_id')
             
         db.session.commit()
@@ -166,7 +310,6 @@ def edit(id):
         return redirect(url_for('edition.index'))
 
     # Prepare countries for dropdown
-    from models import Country
     countries = []
     if current_user.role == 'admin':
         countries = Country.query.all()
@@ -185,11 +328,6 @@ def delete(id):
         flash('Edición no encontrada.')
         return redirect(url_for('edition.index'))
         
-    # Permission Check
-    if current_user.role != 'admin' and current_user.country_id != edition.country_id:
-        flash('No tienes permiso para eliminar esta edición.')
-        return redirect(url_for('edition.index'))
-        
     # Constraint Check: Cannot delete if it has articles
     if edition.articles:
         flash('No se puede eliminar la edición porque tiene artículos asignados. Elimina los artículos primero.')
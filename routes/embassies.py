@@ -1,6 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, send_file
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from utils.uploads import incoming_file
+from utils.storage import remove_stored_file
+from utils.booklets import available_formats, booklet_version
+from utils import contacts
 import os
 from models import db, Embassy, EmbassyList, Country
 from datetime import datetime
@@ -12,17 +16,9 @@ bp = Blueprint('embassies', __name__, url_prefix='/embassies')
 @bp.route('/')
 @login_required
 def index():
-    # Show all Lists, grouped by Country
-    query = EmbassyList.query
-    
-    if current_user.role not in ['admin', 'coordinator']:
-        if current_user.country_id:
-            query = query.filter_by(country_id=current_user.country_id)
-        else:
-            query = query.filter_by(id=-1) 
-            
-    lists = query.join(Country).order_by(Country.name, EmbassyList.name).all()
-    return render_template('embassies/index.html', lists=lists)
+    # Show all Lists, grouped by Country (country filtering is applied by utils.scoping)
+    lists = EmbassyList.query.join(Country).order_by(Country.name, EmbassyList.name).all()
+    return render_template('embassies/index.html', lists=lists, export_formats=available_formats())
 
 @bp.route('/create_list', methods=['GET', 'POST'])
 @login_required
@@ -52,14 +48,50 @@ def view_list(id):
     if not embassy_list:
         flash('Lista no encontrada.')
         return redirect(url_for('embassies.index'))
-        
-    # Permission Check
-    if current_user.role not in ['admin', 'coordinator']:
-        if current_user.country_id != embassy_list.country_id:
-            flash('Acceso denegado.')
-            return redirect(url_for('embassies.index'))
 
-    return render_template('embassies/view_list.html', embassy_list=embassy_list)
+    return render_template('embassies/view_list.html', embassy_list=embassy_list, export_formats=available_formats())
+
+@bp.route('/export')
+@login_required
+def export():
+    # Printable booklet of one list (?list_id=) or of every list in a country (?country_id=)
+    fmt = request.args.get('format', 'html')
+    if fmt not in available_formats():
+        flash('Formato de exportación no disponible.')
+        return redirect(url_for('embassies.index'))
+
+    list_id = request.args.get('list_id', type=int)
+    country_id = request.args.get('country_id', type=int)
+    if list_id:
+        embassy_list = db.session.get(EmbassyList, list_id)
+        lists = [embassy_list] if embassy_list else []
+        scope = f'list-{list_id}'
+        title = embassy_list.name if embassy_list else ''
+    else:
+        lists = EmbassyList.query.filter_by(country_id=country_id).all()
+        scope = f'country-{country_id}'
+        title = lists[0].country.name if lists else ''
+    if not lists:
+        flash('Lista no encontrada.')
+        return redirect(url_for('embassies.index'))
+
+    builder = current_app.extensions['booklets']
+    version = booklet_version(lists)
+    state = builder.status(scope, version, fmt)
+    if state == 'ready':
+        return send_file(builder.path(scope, version, fmt), as_attachment=(fmt == 'pdf'),
+                         download_name=secure_filename(f'{title}.{fmt}') or f'directorio.{fmt}')
+
+    back = url_for('embassies.view_list', id=list_id) if list_id else url_for('embassies.index')
+    args = {k: v for k, v in request.args.items() if k != 'retry'}
+    if state == 'failed' and not request.args.get('retry', type=int):
+        # No automatic reload here: a failing build is only retried when the user asks
+        return render_template('embassies/export_pending.html', title=title, back=back, failed=True,
+                               retry=url_for('embassies.export', retry=1, **args))
+
+    builder.request(scope, version, fmt, title, [l.id for l in lists])
+    return render_template('embassies/export_pending.html', title=title, back=back,
+                           poll=url_for('embassies.export', **args))
 
 @bp.route('/list/<int:id>/delete', methods=['POST'])
 @login_required
@@ -75,10 +107,7 @@ def delete_list(id):
         # For simplicity, we skip file cleanup for now or iterate.
         for item in embassy_list.items:
              if item.photo_filename:
-                try:
-                    os.remove(os.path.join(current_app.config['EMBASSIES_FOLDER'], item.photo_filename))
-                except:
-                    pass
+                remove_stored_file(os.path.join(current_app.config['EMBASSIES_FOLDER'], item.photo_filename))
 
         db.session.delete(embassy_list)
         db.session.commit()
@@ -87,8 +116,30 @@ def delete_list(id):
     return redirect(url_for('embassies.index'))
 
 
+@bp.route('/duplicates')
+@login_required
+def duplicates():
+    # Members sharing a phone, email or Instagram account across every list (utils.contacts)
+    if current_user.role not in ['admin', 'coordinator']:
+        flash('Acceso denegado.')
+        return redirect(url_for('embassies.index'))
+
+    return render_template('embassies/duplicates.html', groups=contacts.duplicate_groups())
+
+
 # --- ITEMS MANAGEMENT ---
 
+CONTACT_LABELS = {'phone': 'teléfono', 'email': 'email', 'instagram': 'Instagram'}
+
+def _contact_feedback(member):
+    # Contact details kept as typed, and the same contact already in other lists
+    problems = contacts.problems_for(member)
+    if problems:
+        flash('Revisa el formato de: ' + ', '.join(CONTACT_LABELS[p] for p in problems) + '.')
+    others = contacts.duplicates_of(member)
+    if others:
+        flash('Este contacto ya figura en: ' + ', '.join(f'{o.name} ({o.list.name})' for o in others) + '.')
+
 @bp.route('/list/<int:list_id>/create_member', methods=['GET', 'POST'])
 @login_required
 def create_member(list_id):
@@ -109,18 +160,17 @@ def create_member(list_id):
         instagram = request.form['instagram']
         
         photo_filename = None
-        if 'photo' in request.files:
-            file = request.files['photo']
-            if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                timestamp = int(datetime.utcnow().timestamp())
-                unique_filename = f"{timestamp}_{filename}"
-                
-                embassies_dir = current_app.config['EMBASSIES_FOLDER']
-                os.makedirs(embassies_dir, exist_ok=True)
-                
-                file.save(os.path.join(embassies_dir, unique_filename))
-                photo_filename = unique_filename
+        file = incoming_file('photo')
+        if file:
+            filename = secure_filename(file.filename)
+            timestamp = int(datetime.utcnow().timestamp())
+            unique_filename = f"{timestamp}_{filename}"
+            
+            embassies_dir = current_app.config['EMBASSIES_FOLDER']
+            os.makedirs(embassies_dir, exist_ok=True)
+            
+            file.save(os.path.join(embassies_dir, unique_filename))
+            photo_filename = unique_filename
 
         new_item = Embassy(
             list_id=list_id,
@@ -136,6 +186,7 @@ def create_member(list_id):
         db.session.commit()
         
         flash('Registro agregado exitosamente.')
+        _contact_feedback(new_item)
         return redirect(url_for('embassies.view_list', id=list_id))
 
     return render_template('embassies/create_member.html', embassy_list=embassy_list)
@@ -159,23 +210,20 @@ def edit_member(id):
         embassy.email = request.form['email']
         embassy.instagram = request.form['instagram']
         
-        if 'photo' in request.files:
-            file = request.files['photo']
-            if file and file.filename != '':
-                if embassy.photo_filename:
-                    try:
-                        os.remove(os.path.join(current_app.config['EMBASSIES_FOLDER'], embassy.photo_filename))
-                    except:
-                        pass
-                
-                filename = secure_filename(file.filename)
-                timestamp = int(datetime.utcnow().timestamp())
-                unique_filename = f"{timestamp}_{filename}"
-                file.save(os.path.join(current_app.config['EMBASSIES_FOLDER'], unique_filename))
-                embassy.photo_filename = unique_filename
+        file = incoming_file('photo')
+        if file:
+            if embassy.photo_filename:
+                remove_stored_file(os.path.join(current_app.config['EMBASSIES_FOLDER'], embassy.photo_filename))
+            
+            filename = secure_filename(file.filename)
+            timestamp = int(datetime.utcnow().timestamp())
+            unique_filename = f"{timestamp}_{filename}"
+            file.save(os.path.join(current_app.config['EMBASSIES_FOLDER'], unique_filename))
+            embassy.photo_filename = unique_filename
         
         db.session.commit()
         flash('Registro actualizado.')
+        _contact_feedback(embassy)
         return redirect(url_for('embassies.view_list', id=embassy.list_id))
 
     return render_template('embassies/edit.html', embassy=embassy)
@@ -192,10 +240,7 @@ def delete_member(id):
     
     if embassy:
         if embassy.photo_filename:
-            try:
-                os.remove(os.path.join(current_app.config['EMBASSIES_FOLDER'], embassy.photo_filename))
-            except:
-                pass
+            remove_stored_file(os.path.join(current_app.config['EMBASSIES_FOLDER'], embassy.photo_filename))
         db.session.delete(embassy)
         db.session.commit()
         flash('Registro eliminado.')
@@ -0,0 +1,30 @@
+from flask import Blueprint, abort, current_app, request, send_file
+from PIL import Image, UnidentifiedImageError
+from utils.images import FORMATS, WIDTHS, resolve, verify
+
+bp = Blueprint('images', __name__, url_prefix='/img')
+
+# Resized files never change for a given URL (the source's mtime is part of the cache key)
+MAX_AGE = 30 * 24 * 3600
+
+@bp.route('/<source>/<int:width>/<fmt>/<path:filename>')
+def resized(source, width, fmt, filename):
+    # No login: these are the same public files /static serves, and the
+    # signature limits requests to sizes the app rendered links for
+    if width not in WIDTHS or fmt not in FORMATS:
+        abort(404)
+    if not verify(source, filename, width, fmt, request.args.get('s')):
+        abort(403)
+
+    source_path = resolve(source, filename)
+    if source_path is None:
+        abort(404)
+
+    try:
+        path = current_app.extensions['image_cache'].get(source_path, width, fmt)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        # Not an image Pillow can read, or too many pixels to decode safely
+        abort(415)
+    except OSError:
+        abort(404)
+    return send_file(path, mimetype=FORMATS[fmt][1], max_age=MAX_AGE, conditional=True)
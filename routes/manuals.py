@@ -1,24 +1,50 @@
-from flask import Blueprint, render_template, send_from_directory, current_app, request, redirect, url_for, flash
+from flask import Blueprint, render_template, send_from_directory, current_app, request, redirect, url_for, flash, abort
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from utils.uploads import incoming_file
+from utils.storage import remove_stored_file
+from utils.manual_preview import queue_preview, remove_thumbnail, thumbnails_folder
+from utils.manual_catalog import catalog_for, by_id, by_filename, visible_to, record_download, usage_report
 import os
 from models import db, Manual
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 bp = Blueprint('manuals', __name__, url_prefix='/manuals')
 
 @bp.route('/')
 @login_required
 def index():
+    # Search covers the extracted text, so nobody has to open PDFs to find one
+    q = request.args.get('q', '').strip()
+    snippets = {}
+    if not q:
+        # Per-role catalog from utils.manual_catalog
+        return render_template('manuals/index.html', manuals=catalog_for(current_user.role), q=q, snippets=snippets)
+
     query = Manual.query
     
     # Filter by role unless admin
     if current_user.role != 'admin':
         # Show manuals for 'all' or specific role
         query = query.filter(Manual.target_role.in_(['all', current_user.role]))
-        
+
+    pattern = f'%{q}%'
+    query = query.filter(db.or_(Manual.name.ilike(pattern), Manual.text_content.ilike(pattern)))
+    query = query.options(db.undefer(Manual.text_content))
+
     manuals = query.order_by(Manual.name.asc()).all()
-    return render_template('manuals/index.html', manuals=manuals)
+    for manual in manuals:
+        snippets[manual.id] = _snippet(manual.text_content, q)
+    return render_template('manuals/index.html', manuals=manuals, q=q, snippets=snippets)
+
+def _snippet(text, q, context=80):
+    if not text:
+        return None
+    pos = text.lower().find(q.lower())
+    if pos < 0:
+        return None
+    start = max(0, pos - context)
+    return ('…' if start else '') + text[start:pos + len(q) + context] + '…'
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -31,14 +57,10 @@ def create():
         name = request.form['name']
         target_role = request.form['target_role']
         
-        # File Handling
-        if 'file' not in request.files:
-            flash('No se seleccionó ningún archivo.')
-            return redirect(url_for('manuals.create'))
-            
-        file = request.files['file']
+        # File Handling (direct post or a completed chunked upload)
+        file = incoming_file('file')
         
-        if file.filename == '':
+        if not file:
             flash('No se seleccionó ningún archivo.')
             return redirect(url_for('manuals.create'))
             
@@ -62,6 +84,9 @@ def create():
             
             db.session.add(new_manual)
             db.session.commit()
+
+            # Page count, thumbnail and text are extracted in the background
+            queue_preview(new_manual)
             
             flash('Manual subido exitosamente.')
             return redirect(url_for('manuals.index'))
@@ -106,12 +131,8 @@ def delete(id):
     manual = db.session.get(Manual, id)
     if manual:
         # Delete file from disk
-        try:
-            full_path = os.path.join(current_app.root_path, 'static', 'manuals', manual.filename)
-            if os.path.exists(full_path):
-                os.remove(full_path)
-        except Exception as e:
-            print(f"Error deleting file: {e}")
+        remove_stored_file(os.path.join(current_app.root_path, 'static', 'manuals', manual.filename))
+        remove_thumbnail(manual)
 
         db.session.delete(manual)
         db.session.commit()
@@ -119,18 +140,43 @@ def delete(id):
     
     return redirect(url_for('manuals.index'))
 
+@bp.route('/<int:id>/thumbnail')
+@login_required
+def thumbnail(id):
+    manual = by_id(id)
+    if not manual or not manual.thumbnail:
+        abort(404)
+    if not visible_to(manual, current_user.role):
+        abort(403)
+    return send_from_directory(thumbnails_folder(), manual.thumbnail, max_age=86400)
+
 @bp.route('/view/<filename>')
 @login_required
 def view_pdf(filename):
-    # Security: Ensure user has access to this file via DB check?
-    # For now, relying on index filtering. Direct access check is better but optional for MVP if names are guarded.
-    # Ideally: find manual by filename, check role.
-    
-    manual = Manual.query.filter_by(filename=filename).first()
+    # Role check against the cached catalog rather than a query per download
+    manual = by_filename(filename)
     if manual:
-        if current_user.role != 'admin' and manual.target_role not in ['all', current_user.role]:
+        if not visible_to(manual, current_user.role):
              flash('No tienes permiso para ver este documento.')
              return redirect(url_for('manuals.index'))
+        # Buffered in memory; written in batches by utils.manual_catalog
+        record_download(manual.id, current_user.role)
              
     manuals_dir = os.path.join(current_app.root_path, 'static', 'manuals')
     return send_from_directory(manuals_dir, filename)
+
+USAGE_PERIODS = (7, 30, 90, 365)
+
+@bp.route('/usage')
+@login_required
+def usage():
+    if current_user.role != 'admin':
+        flash('Acceso denegado.')
+        return redirect(url_for('manuals.index'))
+
+    days = request.args.get('days', 30, type=int)
+    if days not in USAGE_PERIODS:
+        days = 30
+    report = usage_report(date.today() - timedelta(days=days - 1))
+    roles = sorted({role for _, _, by_role, _ in report for role in by_role})
+    return render_template('manuals/usage.html', report=report, roles=roles, days=days, periods=USAGE_PERIODS)
@@ -0,0 +1,64 @@
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from utils.uploads import UploadError, create_upload, upload_status, append_chunk, cancel_upload
+
+bp = Blueprint('uploads', __name__, url_prefix='/uploads')
+
+@bp.errorhandler(UploadError)
+def handle_upload_error(e):
+    return jsonify({'status': 'error', 'message': str(e)}), e.status
+
+@bp.route('/', methods=['POST'])
+@login_required
+def create():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename', ''))
+    if not filename:
+        return jsonify({'status': 'error', 'message': 'Nombre de archivo inválido.'}), 400
+
+    try:
+        length = int(data.get('size'))
+    except (TypeError, ValueError):
+        length = None
+
+    upload_id = create_upload(filename, length, current_user.id)
+    response = jsonify({'status': 'success', 'id': upload_id, 'offset': 0})
+    response.status_code = 201
+    response.headers['Location'] = url_for('uploads.patch', upload_id=upload_id)
+    return response
+
+@bp.route('/<upload_id>', methods=['HEAD'])
+@login_required
+def head(upload_id):
+    meta = upload_status(upload_id, current_user.id)
+    return '', 200, {
+        'Upload-Offset': str(meta['offset']),
+        'Upload-Length': str(meta['length']),
+        'Cache-Control': 'no-store',
+    }
+
+@bp.route('/<upload_id>', methods=['PATCH'])
+@login_required
+def patch(upload_id):
+    if request.mimetype != 'application/offset+octet-stream':
+        return jsonify({'status': 'error', 'message': 'Content-Type inválido.'}), 415
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Falta el encabezado Upload-Offset.'}), 400
+
+    # Only this blueprint is limited (CHUNKED_UPLOAD_MAX_LENGTH); append_chunk
+    # also stops reading at the length declared when the upload was created
+    if (request.content_length or 0) > current_app.config['CHUNKED_UPLOAD_MAX_LENGTH']:
+        return jsonify({'status': 'error', 'message': 'El archivo excede el tamaño máximo permitido.'}), 413
+
+    new_offset = append_chunk(upload_id, current_user.id, offset, request.stream)
+    return '', 204, {'Upload-Offset': str(new_offset)}
+
+@bp.route('/<upload_id>', methods=['DELETE'])
+@login_required
+def delete(upload_id):
+    cancel_upload(upload_id, current_user.id)
+    return '', 204
@@ -1,21 +1,74 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
+from utils.uploads import incoming_file
+from utils.storage import remove_stored_file
+from utils.provisioning import ProvisioningError, parse_rows, provision_users, summarize
+from utils.counts import cached_count, counted
+from utils.scoping import country_criteria
+from sqlalchemy import or_, select
+from sqlalchemy.orm import contains_eager
 import os
 from datetime import datetime
-from models import db, User, Country
+from models import db, User, Country, USER_ROLES
 
 bp = Blueprint('users', __name__, url_prefix='/users')
 
+USERS_PER_PAGE = 50
+counted(User)
+SORT_COLUMNS = {
+    'username': User.username,
+    'role': User.role,
+    'country': Country.name,
+}
+
 @bp.route('/')
 @login_required
 def index():
     if current_user.role not in ['admin', 'coordinator']:
         flash('Acceso denegado.')
         return redirect(url_for('dashboard.index'))
-    
-    users = User.query.all()
-    return render_template('users/index.html', users=users)
+
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'role': request.args.get('role', ''),
+        'active': request.args.get('active', ''),
+        'country_id': request.args.get('country_id', type=int),
+    }
+    # Coordinators only manage their own country's team
+    if current_user.role != 'admin':
+        filters['country_id'] = current_user.country_id
+
+    # Country names come from the join instead of a lazy load per row
+    stmt = select(User).outerjoin(User.country).options(contains_eager(User.country))
+    if filters['country_id'] or current_user.role != 'admin':
+        stmt = stmt.where(country_criteria(User, filters['country_id']))
+    if filters['role'] in USER_ROLES:
+        stmt = stmt.where(User.role == filters['role'])
+    if filters['active'] in ('1', '0'):
+        stmt = stmt.where(User.is_active.is_(filters['active'] == '1'))
+    if filters['q']:
+        pattern = f"%{filters['q']}%"
+        stmt = stmt.where(or_(User.username.ilike(pattern), User.email.ilike(pattern)))
+
+    sort = request.args.get('sort', 'username')
+    if sort not in SORT_COLUMNS:
+        sort = 'username'
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    column = SORT_COLUMNS[sort]
+    stmt = stmt.order_by(column.desc() if order == 'desc' else column.asc(), User.id)
+
+    pagination = db.paginate(stmt, per_page=USERS_PER_PAGE, max_per_page=200, error_out=False, count=False)
+    # The same filters select different rows for an admin and for a coordinator
+    # (a coordinator without a country sees nobody), so the scope is part of the key
+    is_admin = current_user.role == 'admin'
+    scope = 'all' if is_admin else f'country:{current_user.country_id}'
+    count_key = (scope, *sorted(filters.items()))
+    pagination.total = cached_count(User, stmt, count_key, unfiltered=is_admin and not any(filters.values()))
+
+    countries = Country.query.order_by(Country.name).all() if current_user.role == 'admin' else []
+    return render_template('users/index.html', pagination=pagination, users=pagination.items,
+                           filters=filters, sort=sort, order=order, roles=USER_ROLES, countries=countries)
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -40,18 +93,17 @@ def create():
              return redirect(url_for('users.create'))
 
         profile_photo = None
-        if 'profile_photo' in request.files:
-            file = request.files['profile_photo']
-            if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                timestamp = int(datetime.utcnow().timestamp())
-                unique_filename = f"{timestamp}_{filename}"
-                
-                users_dir = current_app.config['USERS_FOLDER']
-                os.makedirs(users_dir, exist_ok=True)
-                
-                file.save(os.path.join(users_dir, unique_filename))
-                profile_photo = unique_filename
+        file = incoming_file('profile_photo')
+        if file:
+            filename = secure_filename(file.filename)
+            timestamp = int(datetime.utcnow().timestamp())
+            unique_filename = f"{timestamp}_{filename}"
+            
+            users_dir = current_app.config['USERS_FOLDER']
+            os.makedirs(users_dir, exist_ok=True)
+            
+            file.save(os.path.join(users_dir, unique_filename))
+            profile_photo = unique_filename
 
         new_user = User(
             username=username, 
@@ -71,6 +123,52 @@ def create():
     countries = Country.query.all()
     return render_template('users/create.html', countries=countries)
 
+@bp.route('/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk():
+    # Provision many users from CSV/JSON: a form upload, a JSON body or a raw CSV body
+    wants_json = request.is_json or request.mimetype == 'text/csv'
+    if current_user.role != 'admin':
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Permiso denegado'}), 403
+        flash('Solo administradores pueden crear usuarios.')
+        return redirect(url_for('users.index'))
+
+    if request.method == 'GET':
+        return render_template('users/bulk.html', report=None)
+
+    options = request.args.to_dict()
+    try:
+        if request.is_json:
+            payload = request.get_json()
+            if isinstance(payload, dict):
+                options.update({k: v for k, v in payload.items() if k != 'users'})
+                payload = payload.get('users')
+            if not isinstance(payload, list):
+                raise ProvisioningError('Se esperaba una lista de usuarios.')
+            rows = payload
+        elif request.mimetype == 'text/csv':
+            rows = parse_rows(request.get_data())
+        else:
+            options.update(request.form.to_dict())
+            file = request.files.get('file')
+            if not file or not file.filename:
+                raise ProvisioningError('Seleccione un archivo CSV o JSON.')
+            rows = parse_rows(file.read(), file.filename)
+
+        flag = lambda name: str(options.get(name, '')).lower() in ('1', 'true', 'on', 'yes')
+        report = provision_users(rows, update_existing=flag('update_existing'), dry_run=flag('dry_run'),
+                                 all_or_nothing=flag('all_or_nothing'))
+    except ProvisioningError as e:
+        if wants_json:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        flash(str(e))
+        return redirect(url_for('users.bulk'))
+
+    if wants_json:
+        return jsonify({'status': 'success', 'summary': summarize(report), 'results': report})
+    return render_template('users/bulk.html', report=report, summary=summarize(report))
+
 @bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit(id):
@@ -106,25 +204,21 @@ def edit(id):
         user.is_active = is_active
         user.country_id = request.form.get('country_id')
         
-        if 'profile_photo' in request.files:
-            file = request.files['profile_photo']
-            if file and file.filename != '':
-                # Delete old photo
-                if user.profile_photo:
-                    try:
-                        os.remove(os.path.join(current_app.config['USERS_FOLDER'], user.profile_photo))
-                    except:
-                        pass
-                
-                filename = secure_filename(file.filename)
-                timestamp = int(datetime.utcnow().timestamp())
-                unique_filename = f"{timestamp}_{filename}"
-                
-                users_dir = current_app.config['USERS_FOLDER']
-                os.makedirs(users_dir, exist_ok=True)
-                
-                file.save(os.path.join(users_dir, unique_filename))
-                user.profile_photo = unique_filename
+        file = incoming_file('profile_photo')
+        if file:
+            # Delete old photo
+            if user.profile_photo:
+                remove_stored_file(os.path.join(current_app.config['USERS_FOLDER'], user.profile_photo))
+            
+            filename = secure_filename(file.filename)
+            timestamp = int(datetime.utcnow().timestamp())
+            unique_filename = f"{timestamp}_{filename}"
+            
+            users_dir = current_app.config['USERS_FOLDER']
+            os.makedirs(users_dir, exist_ok=True)
+            
+            file.save(os.path.join(users_dir, unique_filename))
+            user.profile_photo = unique_filename
         
         password = request.form['password']
         if password:
@@ -154,10 +248,7 @@ def delete(id):
         return redirect(url_for('users.index'))
 
     if user.profile_photo:
-        try:
-            os.remove(os.path.join(current_app.config['USERS_FOLDER'], user.profile_photo))
-        except:
-            pass
+        remove_stored_file(os.path.join(current_app.config['USERS_FOLDER'], user.profile_photo))
 
     db.session.delete(user)
     db.session.commit()
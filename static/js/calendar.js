@@ -1,14 +1,25 @@
 document.addEventListener('DOMContentLoaded', function () {
     let currentDate = new Date();
-    let events = [];
-
-    // Fetch events
-    fetch('/calendar/api/events')
-        .then(response => response.json())
-        .then(data => {
-            events = data;
-            renderCalendar(currentDate);
+    let selectedEvent = null;
+    const grid = document.getElementById('calendar-grid');
+    const store = CalendarStore.create(grid.dataset.user);
+
+    // Render from the local cache first, then pull only what changed
+    function loadEvents() {
+        return store.sync().then(changed => {
+            if (changed) renderCalendar(currentDate);
         });
+    }
+
+    store.load().then(() => {
+        renderCalendar(currentDate);
+        loadEvents();
+    });
+
+    window.addEventListener('online', loadEvents);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible') loadEvents();
+    });
 
     window.prevMonth = function () {
         currentDate.setMonth(currentDate.getMonth() - 1);
@@ -32,6 +43,13 @@ document.addEventListener('DOMContentLoaded', function () {
         const year = date.getFullYear();
         const month = date.getMonth();
 
+        // Past months may have events in the archive; redraw once they arrive
+        store.loadArchive(year, month).then(added => {
+            if (added && currentDate.getFullYear() === year && currentDate.getMonth() === month) {
+                renderCalendar(currentDate);
+            }
+        });
+
         monthLabel.textContent = new Intl.DateTimeFormat('es-ES', { month: 'long', year: 'numeric' }).format(date);
 
         const firstDay = new Date(year, month, 1);
@@ -56,11 +74,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 dayCell.classList.add('today');
             }
 
-            // Find events for this day
-            const dayEvents = events.filter(e => {
-                const eDate = new Date(e.start);
-                return eDate.getFullYear() === year && eDate.getMonth() === month && eDate.getDate() === i;
-            });
+            const dayEvents = store.eventsOn(new Date(year, month, i));
 
             dayEvents.forEach(evt => {
                 const pill = document.createElement('div');
@@ -94,15 +108,30 @@ document.addEventListener('DOMContentLoaded', function () {
         const end = document.getElementById('eventEnd').value;
         const location = document.getElementById('eventLocation').value;
         const description = document.getElementById('eventDescription').value;
+        const repeat = document.getElementById('eventRepeat').value;
+        const until = document.getElementById('eventUntil').value;
+
+        let rrule = null;
+        if (repeat) {
+            rrule = `FREQ=${repeat}`;
+            if (until) {
+                rrule += `;UNTIL=${until.replaceAll('-', '')}`;
+            }
+        }
 
         const data = {
             title: title,
             start: start,
             end: end,
             location: location,
-            description: description
+            description: description,
+            rrule: rrule
         };
 
+        createEvent(data);
+    }
+
+    function createEvent(data) {
         fetch('/calendar/api/events/create', {
             method: 'POST',
             headers: {
@@ -111,19 +140,20 @@ document.addEventListener('DOMContentLoaded', function () {
             body: JSON.stringify(data)
         })
             .then(response => response.json())
-            .then(data => {
-                if (data.status === 'success') {
+            .then(result => {
+                if (result.status === 'success') {
                     closeModals();
                     document.getElementById('createEventForm').reset();
                     // Refresh events
-                    fetch('/calendar/api/events')
-                        .then(response => response.json())
-                        .then(data => {
-                            events = data;
-                            renderCalendar(currentDate);
-                        });
+                    loadEvents();
+                } else if (result.conflicts && result.conflicts.length) {
+                    // Same place, same time: book anyway only if the user says so
+                    const list = result.conflicts.map(c => `- ${c.title} (${new Date(c.start).toLocaleString('es-ES')})`).join('\n');
+                    if (confirm(`${result.message}\n${list}\n\n¿Crear el evento de todos modos?`)) {
+                        createEvent(Object.assign({}, data, { force: true }));
+                    }
                 } else {
-                    alert('Error al crear evento: ' + data.message);
+                    alert('Error al crear evento: ' + result.message);
                 }
             })
             .catch(error => {
@@ -133,6 +163,7 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     window.showEventDetails = function (event) {
+        selectedEvent = event;
         document.getElementById('viewEventTitle').textContent = event.title;
 
         const options = { weekday: 'long', year: 'numeric', month: 'long', day: 'numeric', hour: '2-digit', minute: '2-digit' };
@@ -144,10 +175,35 @@ document.addEventListener('DOMContentLoaded', function () {
             timeStr += `<br>Fin: ${endDate}`;
         }
 
+        if (event.rrule) {
+            timeStr += '<br><small>🔁 Evento recurrente</small>';
+        }
+
         document.getElementById('viewEventTime').innerHTML = timeStr;
         document.getElementById('viewEventLocation').textContent = event.location ? `📍 ${event.location}` : '';
         document.getElementById('viewEventDescription').textContent = event.description || 'Sin descripción';
 
         document.getElementById('viewEventModal').style.display = 'flex';
     }
+
+    window.deleteEvent = function () {
+        if (!selectedEvent) return;
+        const message = selectedEvent.rrule ? '¿Eliminar toda la serie de eventos?' : '¿Eliminar este evento?';
+        if (!confirm(message)) return;
+
+        fetch(`/calendar/api/events/${selectedEvent.id}`, { method: 'DELETE' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    closeModals();
+                    loadEvents();
+                } else {
+                    alert('Error al eliminar evento: ' + data.message);
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                alert('Error al eliminar evento');
+            });
+    }
 });
@@ -0,0 +1,318 @@
+// Offline-first event store for the calendar page.
+//
+// Series (not expanded occurrences) are kept in IndexedDB and kept current
+// with /calendar/api/events/changes, which only returns what changed since
+// the stored version. Lookups go through a day-bucketed index: single events
+// are bucketed once per sync, recurring series are expanded per month on
+// first view and memoized, so month navigation never touches the network.
+// Months before the sync's `archived_before` also ask the archive endpoint
+// once per session (archived events are read-only and never change).
+window.CalendarStore = (function () {
+    const MAX_OCCURRENCES = 1000;
+    const WEEKDAYS = { MO: 0, TU: 1, WE: 2, TH: 3, FR: 4, SA: 5, SU: 6 };
+
+    const pad = n => String(n).padStart(2, '0');
+
+    // Same shape as Python's datetime.isoformat() for naive values
+    function isoLocal(d) {
+        return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())}` +
+            `T${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+    }
+
+    function dayKey(d) {
+        return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())}`;
+    }
+
+    function addDays(d, days) {
+        const r = new Date(d);
+        r.setDate(r.getDate() + days);
+        return r;
+    }
+
+    function dayDiff(a, b) {
+        return Math.round((Date.UTC(b.getFullYear(), b.getMonth(), b.getDate()) -
+            Date.UTC(a.getFullYear(), a.getMonth(), a.getDate())) / 86400000);
+    }
+
+    // Mirrors utils/recurrence.parse_rrule (the server validates on write)
+    function parseRrule(text) {
+        const parts = {};
+        text.toUpperCase().split(';').filter(Boolean).forEach(chunk => {
+            const [key, value] = chunk.split('=');
+            parts[key] = value;
+        });
+        const rule = { freq: parts.FREQ, interval: parseInt(parts.INTERVAL || '1', 10), count: null, until: null, byday: [] };
+        if (parts.COUNT) rule.count = parseInt(parts.COUNT, 10);
+        if (parts.UNTIL) {
+            const v = parts.UNTIL.replace('Z', '');
+            rule.until = new Date(+v.slice(0, 4), +v.slice(4, 6) - 1, +v.slice(6, 8),
+                v.includes('T') ? +v.slice(9, 11) : 23, v.includes('T') ? +v.slice(11, 13) : 59,
+                v.includes('T') ? +v.slice(13, 15) : 59);
+        }
+        if (parts.BYDAY) {
+            rule.byday = [...new Set(parts.BYDAY.split(',').map(d => WEEKDAYS[d]))].sort();
+        }
+        return rule;
+    }
+
+    // Yields [index, start] from the first occurrence that can reach windowStart
+    function* iterStarts(dtstart, rule, windowStart) {
+        const interval = rule.interval;
+        if (rule.freq === 'DAILY' || (rule.freq === 'WEEKLY' && !rule.byday.length)) {
+            const step = rule.freq === 'DAILY' ? interval : 7 * interval;
+            let index = Math.max(0, Math.floor(dayDiff(dtstart, windowStart) / step));
+            while (true) {
+                yield [index, addDays(dtstart, index * step)];
+                index++;
+            }
+        } else if (rule.freq === 'WEEKLY') {
+            // Python weekday(): Monday is 0
+            const weekday = (dtstart.getDay() + 6) % 7;
+            const week0 = addDays(dtstart, -weekday);
+            const firstWeek = rule.byday.filter(d => d >= weekday);
+            let week = Math.max(0, Math.floor(dayDiff(week0, windowStart) / (7 * interval)));
+            let index = week === 0 ? 0 : firstWeek.length + (week - 1) * rule.byday.length;
+            while (true) {
+                for (const day of (week === 0 ? firstWeek : rule.byday)) {
+                    yield [index, addDays(week0, week * 7 * interval + day)];
+                    index++;
+                }
+                week++;
+            }
+        } else {
+            const months = rule.freq === 'MONTHLY' ? interval : 12 * interval;
+            let index = 0;
+            for (let step = 0; ; step++) {
+                const start = new Date(dtstart);
+                start.setDate(1);
+                start.setMonth(dtstart.getMonth() + step * months);
+                start.setDate(dtstart.getDate());
+                // The 31st in a 30-day month has no occurrence (RFC 5545)
+                if (start.getDate() === dtstart.getDate()) {
+                    yield [index, start];
+                    index++;
+                }
+            }
+        }
+    }
+
+    // Occurrences of a series overlapping [windowStart, windowEnd)
+    function expand(series, windowStart, windowEnd) {
+        const dtstart = new Date(series.start);
+        const duration = series.end ? new Date(series.end) - dtstart : 0;
+        const rule = parseRrule(series.rrule);
+        const overrides = new Map(series.exceptions.map(e => [e.recurrence_id, e]));
+        const result = [];
+        const seen = new Set();
+
+        const occurrence = (start, end, override) => ({
+            id: series.id,
+            title: (override && override.title) || series.title,
+            start: isoLocal(start),
+            end: end ? isoLocal(end) : null,
+            description: (override && override.description) || series.description,
+            location: (override && override.location) || series.location,
+            rrule: series.rrule,
+            recurrence_id: override ? override.recurrence_id : isoLocal(start),
+        });
+
+        for (const [index, start] of iterStarts(dtstart, rule, new Date(windowStart - duration))) {
+            if (start >= windowEnd || result.length >= MAX_OCCURRENCES) break;
+            if (rule.count !== null && index >= rule.count) break;
+            if (rule.until !== null && start > rule.until) break;
+            if (!(start.getTime() + duration > windowStart || (!duration && start >= windowStart))) continue;
+
+            const key = isoLocal(start);
+            seen.add(key);
+            const override = overrides.get(key);
+            if (!override) {
+                result.push(occurrence(start, series.end ? new Date(start.getTime() + duration) : null, null));
+            } else if (!override.cancelled) {
+                const movedStart = override.start ? new Date(override.start) : start;
+                const movedEnd = override.end ? new Date(override.end) : new Date(movedStart.getTime() + duration);
+                if (movedStart < windowEnd && movedEnd >= windowStart) {
+                    result.push(occurrence(movedStart, movedEnd, override));
+                }
+            }
+        }
+
+        // Occurrences moved into the window from outside it
+        overrides.forEach((override, key) => {
+            if (seen.has(key) || override.cancelled || !override.start) return;
+            const movedStart = new Date(override.start);
+            if (movedStart >= windowStart && movedStart < windowEnd) {
+                const movedEnd = override.end ? new Date(override.end) : new Date(movedStart.getTime() + duration);
+                result.push(occurrence(movedStart, movedEnd, override));
+            }
+        });
+        return result;
+    }
+
+    function request(req) {
+        return new Promise((resolve, reject) => {
+            req.onsuccess = () => resolve(req.result);
+            req.onerror = () => reject(req.error);
+        });
+    }
+
+    function create(userId) {
+        const series = new Map();
+        let syncState = null;
+        let singlesByDay = new Map();
+        let recurring = [];
+        const months = new Map();
+        const archived = new Map();
+        const archivedMonths = new Set();
+        let db = null;
+
+        function rebuildIndex() {
+            singlesByDay = new Map();
+            recurring = [];
+            months.clear();
+            // A restored series comes back through sync(); that copy wins
+            const all = [...series.values()].concat([...archived.values()].filter(s => !series.has(s.id)));
+            all.forEach(s => {
+                if (s.rrule) {
+                    recurring.push(s);
+                    return;
+                }
+                const key = dayKey(new Date(s.start));
+                if (!singlesByDay.has(key)) singlesByDay.set(key, []);
+                singlesByDay.get(key).push({ ...s, recurrence_id: null });
+            });
+            singlesByDay.forEach(list => list.sort((a, b) => a.start.localeCompare(b.start)));
+        }
+
+        function monthBuckets(year, month) {
+            const cacheKey = `${year}-${month}`;
+            if (!months.has(cacheKey)) {
+                const buckets = new Map();
+                const windowStart = new Date(year, month, 1);
+                const windowEnd = new Date(year, month + 1, 1);
+                recurring.forEach(s => {
+                    if (new Date(s.start) >= windowEnd) return;
+                    expand(s, windowStart, windowEnd).forEach(o => {
+                        const key = dayKey(new Date(o.start));
+                        if (!buckets.has(key)) buckets.set(key, []);
+                        buckets.get(key).push(o);
+                    });
+                });
+                months.set(cacheKey, buckets);
+            }
+            return months.get(cacheKey);
+        }
+
+        function eventsOn(date) {
+            const key = dayKey(date);
+            const singles = singlesByDay.get(key) || [];
+            const repeated = monthBuckets(date.getFullYear(), date.getMonth()).get(key) || [];
+            if (!repeated.length) return singles;
+            return singles.concat(repeated).sort((a, b) => a.start.localeCompare(b.start));
+        }
+
+        function open() {
+            if (!window.indexedDB) return Promise.resolve(null);
+            // One database per user so a shared browser never shows another user's events
+            const req = indexedDB.open(`amici-calendar-${userId}`, 1);
+            req.onupgradeneeded = () => {
+                req.result.createObjectStore('events', { keyPath: 'id' });
+                req.result.createObjectStore('meta');
+            };
+            return request(req).catch(() => null);
+        }
+
+        function load() {
+            return open().then(handle => {
+                db = handle;
+                if (!db) return;
+                const tx = db.transaction(['events', 'meta'], 'readonly');
+                return Promise.all([
+                    request(tx.objectStore('events').getAll()),
+                    request(tx.objectStore('meta').get('sync')),
+                ]).then(([rows, state]) => {
+                    rows.forEach(row => series.set(row.id, row));
+                    syncState = state || null;
+                    rebuildIndex();
+                });
+            }).catch(error => console.error('Calendar cache unavailable:', error));
+        }
+
+        function persist(data) {
+            if (!db) return Promise.resolve();
+            const tx = db.transaction(['events', 'meta'], 'readwrite');
+            const store = tx.objectStore('events');
+            if (data.full) store.clear();
+            data.events.forEach(row => store.put(row));
+            data.deleted.forEach(id => store.delete(id));
+            tx.objectStore('meta').put(
+                { version: data.version, scope: data.scope, archivedBefore: data.archived_before }, 'sync');
+            return new Promise(resolve => {
+                tx.oncomplete = resolve;
+                tx.onerror = tx.onabort = () => resolve();
+            });
+        }
+
+        // Resolves to true when something changed
+        function sync() {
+            const params = new URLSearchParams();
+            if (syncState) {
+                params.set('since', syncState.version);
+                params.set('scope', syncState.scope);
+            }
+            return fetch(`/calendar/api/events/changes?${params}`)
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(data => {
+                    if (data.full) series.clear();
+                    if (data.full || (syncState && syncState.archivedBefore !== data.archived_before)) {
+                        archived.clear();
+                        archivedMonths.clear();
+                    }
+                    data.events.forEach(row => series.set(row.id, row));
+                    data.deleted.forEach(id => series.delete(id));
+                    syncState = { version: data.version, scope: data.scope, archivedBefore: data.archived_before };
+                    rebuildIndex();
+                    return persist(data).then(() => data.full || data.events.length > 0 || data.deleted.length > 0);
+                })
+                .catch(error => {
+                    // Offline: keep showing what's cached
+                    console.warn('Calendar sync failed:', error);
+                    return false;
+                });
+        }
+
+        // Fetches archived series for a month once; resolves to true when something was added
+        function loadArchive(year, month) {
+            const cacheKey = `${year}-${month}`;
+            const windowStart = new Date(year, month, 1);
+            if (!syncState || !syncState.archivedBefore || archivedMonths.has(cacheKey) ||
+                windowStart >= new Date(syncState.archivedBefore)) {
+                return Promise.resolve(false);
+            }
+            archivedMonths.add(cacheKey);
+            const params = new URLSearchParams({ start: isoLocal(windowStart), end: isoLocal(new Date(year, month + 1, 1)) });
+            return fetch(`/calendar/api/events/archive?${params}`)
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(rows => {
+                    const added = rows.filter(row => !archived.has(row.id));
+                    added.forEach(row => archived.set(row.id, row));
+                    if (added.length) rebuildIndex();
+                    return added.length > 0;
+                })
+                .catch(error => {
+                    archivedMonths.delete(cacheKey);
+                    console.warn('Calendar archive unavailable:', error);
+                    return false;
+                });
+        }
+
+        return { load, sync, eventsOn, loadArchive };
+    }
+
+    return { create, expand };
+})();
@@ -0,0 +1,101 @@
+// Resumable chunked uploads for <input type="file" data-chunked>.
+// Each selected file is sent to /uploads in small PATCH requests before the
+// form is submitted; the form then only carries the upload ids.
+document.addEventListener('DOMContentLoaded', function () {
+    const CHUNK_SIZE = 2 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+
+    async function createUpload(file) {
+        const response = await fetch('/uploads/', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const data = await response.json();
+        if (data.status !== 'success') {
+            throw new Error(data.message);
+        }
+        return data.id;
+    }
+
+    async function currentOffset(uploadId) {
+        const response = await fetch(`/uploads/${uploadId}`, { method: 'HEAD' });
+        return parseInt(response.headers.get('Upload-Offset'), 10);
+    }
+
+    async function sendFile(file, onProgress) {
+        const uploadId = await createUpload(file);
+        let offset = 0;
+        let retries = 0;
+
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + CHUNK_SIZE);
+            try {
+                const response = await fetch(`/uploads/${uploadId}`, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/offset+octet-stream',
+                        'Upload-Offset': String(offset)
+                    },
+                    body: chunk
+                });
+                if (response.status === 204) {
+                    offset = parseInt(response.headers.get('Upload-Offset'), 10);
+                    retries = 0;
+                    onProgress(offset / file.size);
+                    continue;
+                }
+                if (response.status !== 409) {
+                    const data = await response.json();
+                    throw new Error(data.message);
+                }
+            } catch (error) {
+                if (++retries > MAX_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            }
+            // Resume from whatever the server actually has
+            offset = await currentOffset(uploadId);
+        }
+        return uploadId;
+    }
+
+    document.querySelectorAll('input[type="file"][data-chunked]').forEach(input => {
+        const form = input.form;
+        const status = document.createElement('small');
+        status.style.display = 'block';
+        status.style.color = 'var(--text-light)';
+        input.insertAdjacentElement('afterend', status);
+
+        form.addEventListener('submit', async function (e) {
+            if (!input.files.length || input.disabled) {
+                return;
+            }
+            e.preventDefault();
+            const button = form.querySelector('button[type="submit"]');
+            if (button) button.disabled = true;
+
+            try {
+                const files = Array.from(input.files);
+                for (let i = 0; i < files.length; i++) {
+                    const uploadId = await sendFile(files[i], fraction => {
+                        status.textContent = `Subiendo ${files[i].name}: ${Math.round(fraction * 100)}%`;
+                    });
+                    const hidden = document.createElement('input');
+                    hidden.type = 'hidden';
+                    hidden.name = `${input.name}_upload`;
+                    hidden.value = uploadId;
+                    form.appendChild(hidden);
+                }
+                input.disabled = true;
+                form.submit();
+            } catch (error) {
+                console.error('Error:', error);
+                status.textContent = '';
+                alert('Error al subir archivo: ' + error.message);
+                if (button) button.disabled = false;
+            }
+        });
+    });
+});
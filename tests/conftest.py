@@ -0,0 +1,85 @@
+import importlib.util
+import os
+import sys
+import types
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utils.drive_api talks to Google Drive with the deployment's credentials and
+# is not part of the repository; the tests only need folder creation to work
+if importlib.util.find_spec('utils.drive_api') is None:
+    class _DriveService:
+        def create_edition_folders(self, title):
+            return f'test-folder-{title}'
+
+    drive_api = types.ModuleType('utils.drive_api')
+    drive_api.drive_service = _DriveService()
+    sys.modules['utils.drive_api'] = drive_api
+
+from app import create_app
+from config import Config
+from models import db, Country, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SECRET_KEY = 'test'
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        COORDINATION_BACKEND = 'memory'
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        MANUALS_FOLDER = str(tmp_path / 'manuals')
+        EMBASSIES_FOLDER = str(tmp_path / 'embassies')
+        USERS_FOLDER = str(tmp_path / 'users')
+        CHUNKED_UPLOAD_FOLDER = str(tmp_path / 'uploads_tmp')
+        AUDIT_FOLDER = str(tmp_path / 'audit')
+        EXPORTS_FOLDER = str(tmp_path / 'exports')
+        IMAGE_CACHE_FOLDER = str(tmp_path / 'image_cache')
+        SHARDS_FOLDER = str(tmp_path / 'shards')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    app.extensions['audit'].close()
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def ids(app):
+    """Two countries and a user per role of interest; {name: id}."""
+    with app.app_context():
+        panama = Country(name='Panamá', code='PA')
+        chile = Country(name='Chile', code='CL')
+        db.session.add_all([panama, chile])
+        db.session.flush()
+        users = {
+            'admin': User(username='admin', email='admin@test', role='admin'),
+            'coord_pa': User(username='coord_pa', email='coord_pa@test', role='coordinator', country_id=panama.id),
+            'coord_none': User(username='coord_none', email='coord_none@test', role='coordinator'),
+            'journalist_pa': User(username='journalist_pa', email='j_pa@test', role='journalist',
+                                  country_id=panama.id),
+            'journalist_cl': User(username='journalist_cl', email='j_cl@test', role='journalist',
+                                  country_id=chile.id),
+        }
+        for user in users.values():
+            user.set_password('secret')
+        db.session.add_all(users.values())
+        db.session.commit()
+        result = {name: user.id for name, user in users.items()}
+        result.update(panama=panama.id, chile=chile.id)
+        return result
+
+
+@pytest.fixture
+def login(app, ids):
+    def login(username):
+        client = app.test_client()
+        response = client.post('/auth/login', data={'username': username, 'password': 'secret'})
+        assert response.status_code == 302 and 'login' not in response.headers['Location']
+        return client
+    return login
@@ -0,0 +1,73 @@
+from datetime import date
+
+from models import db, Article, Edition
+
+
+def _editions(ids, count=3):
+    editions = [Edition(title=f'Edición {n}', publication_date=date(2024, n, 1), country_id=ids['panama'])
+                for n in range(1, count + 1)]
+    editions.append(Edition(title='Edición de Chile', country_id=ids['chile']))
+    db.session.add_all(editions)
+    db.session.flush()
+    db.session.add_all([Article(title=f'Nota {edition.id}', content='x', edition_id=edition.id, status='draft')
+                        for edition in editions])
+    db.session.commit()
+    return [edition.id for edition in editions]
+
+
+def test_sparse_fieldsets(app, ids, login):
+    with app.app_context():
+        _editions(ids)
+
+    data = login('coord_pa').get('/api/v1/editions?fields=title').json['data']
+    assert data == [{'title': 'Edición 1'}, {'title': 'Edición 2'}, {'title': 'Edición 3'}]
+
+    response = login('coord_pa').get('/api/v1/editions?fields=title,secreto')
+    assert response.status_code == 400
+
+
+def test_includes_with_their_own_fieldsets(app, ids, login):
+    with app.app_context():
+        first = _editions(ids)[0]
+
+    response = login('coord_pa').get(f'/api/v1/editions/{first}?fields=title&include=articles,country'
+                                     '&fields[articles]=title&fields[country]=code')
+    assert response.json['data'] == {'title': 'Edición 1', 'articles': [{'title': f'Nota {first}'}],
+                                     'country': {'code': 'PA'}}
+    assert login('coord_pa').get('/api/v1/editions?include=autor').status_code == 400
+
+
+def test_cursor_pagination(app, ids, login):
+    with app.app_context():
+        _editions(ids)
+
+    client = login('admin')
+    page = client.get('/api/v1/editions?fields=title&limit=3').json
+    assert len(page['data']) == 3 and page['next_cursor']
+    rest = client.get(f"/api/v1/editions?fields=title&limit=3&cursor={page['next_cursor']}").json
+    assert [item['title'] for item in rest['data']] == ['Edición de Chile']
+    assert rest['next_cursor'] is None
+
+    assert client.get('/api/v1/editions?cursor=no-es-un-cursor').status_code == 400
+
+
+def test_filters_and_country_scoping(app, ids, login):
+    with app.app_context():
+        _editions(ids)
+
+    client = login('journalist_cl')
+    data = client.get('/api/v1/editions?fields=title').json['data']
+    assert data == [{'title': 'Edición de Chile'}]
+    data = login('admin').get(f"/api/v1/editions?fields=title&country_id={ids['chile']}").json['data']
+    assert data == [{'title': 'Edición de Chile'}]
+    assert client.get('/api/v1/editions?country_id=abc').status_code == 400
+
+
+def test_users_are_limited_for_non_managers(app, ids, login):
+    client = login('journalist_pa')
+    assert client.get('/api/v1/users').status_code == 403
+    own = client.get(f"/api/v1/users/{ids['journalist_pa']}").json['data']
+    assert own['username'] == 'journalist_pa' and 'email' not in own
+
+    assert 'email' in login('coord_pa').get(f"/api/v1/users/{ids['journalist_pa']}").json['data']
+    assert login('coord_pa').get('/api/v1/nada').status_code == 404
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from models import db, Event
+
+# The async serving mode is optional (asgiref plus aiosqlite for SQLite)
+pytest.importorskip('aiosqlite')
+asgi = pytest.importorskip('asgi')
+
+
+@pytest.fixture
+def asgi_app(app):
+    asgi_app = asgi.AsyncApp(app)
+    yield asgi_app
+    asyncio.run(asgi_app.engine.dispose())
+
+
+def _call(asgi_app, method, path, cookie=None, body=b''):
+    """Run one request through the ASGI app; returns (status, body)."""
+    headers = [(b'cookie', cookie)] if cookie else []
+    scope = {'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(),
+             'root_path': '', 'scheme': 'http', 'query_string': b'', 'headers': headers,
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 1234), 'http_version': '1.1'}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    status = sent[0]['status']
+    return status, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def _cookie(app, login, username):
+    client = login(username)
+    name = app.config['SESSION_COOKIE_NAME']
+    return f'{name}={client.get_cookie(name).value}'.encode()
+
+
+def test_events_need_a_session(asgi_app):
+    status, body = _call(asgi_app, 'GET', '/calendar/api/events')
+    assert status == 401
+    assert _call(asgi_app, 'GET', '/calendar/api/events', cookie=b'session=forged')[0] == 401
+
+
+def test_events_are_scoped_to_the_users_country(app, ids, login, asgi_app):
+    with app.app_context():
+        db.session.add_all([
+            Event(title='Panamá', start_time=datetime(2026, 11, 2, 10), country_id=ids['panama']),
+            Event(title='Chile', start_time=datetime(2026, 11, 2, 10), country_id=ids['chile']),
+        ])
+        db.session.commit()
+
+    status, body = _call(asgi_app, 'GET', '/calendar/api/events', _cookie(app, login, 'coord_pa'))
+    assert status == 200
+    assert [event['title'] for event in json.loads(body)] == ['Panamá']
+
+    status, body = _call(asgi_app, 'GET', '/calendar/api/events', _cookie(app, login, 'admin'))
+    assert sorted(event['title'] for event in json.loads(body)) == ['Chile', 'Panamá']
+
+
+def test_create_event(app, ids, login, asgi_app):
+    payload = json.dumps({'title': 'Cierre', 'start': '2026-11-03T09:00:00'}).encode()
+
+    status, _ = _call(asgi_app, 'POST', '/calendar/api/events/create', _cookie(app, login, 'journalist_pa'), payload)
+    assert status == 403
+
+    status, body = _call(asgi_app, 'POST', '/calendar/api/events/create', _cookie(app, login, 'coord_pa'), payload)
+    assert status == 200
+    with app.app_context():
+        event = db.session.get(Event, json.loads(body)['id'])
+        assert event.title == 'Cierre' and event.country_id == ids['panama']
+
+
+def test_other_paths_go_to_the_flask_app(asgi_app):
+    status, body = _call(asgi_app, 'GET', '/auth/login')
+    assert status == 200
+    assert b'<html' in body
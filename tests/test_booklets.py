@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from models import db, Embassy, EmbassyList
+from utils.booklets import available_formats
+
+
+def _list(ids, name='Embajadas', members=('Embajada de Chile',)):
+    embassy_list = EmbassyList(name=name, country_id=ids['panama'])
+    db.session.add(embassy_list)
+    db.session.flush()
+    db.session.add_all([Embassy(list_id=embassy_list.id, name=member, phone='+507 123') for member in members])
+    db.session.commit()
+    return embassy_list.id
+
+
+def _wait_for_jobs(app):
+    builder = app.extensions['booklets']
+    with builder.lock:
+        futures = list(builder.jobs.values())
+    for future in futures:
+        future.result(timeout=10)
+
+
+def test_export_renders_in_the_background_then_serves_the_file(app, ids, login):
+    with app.app_context():
+        list_id = _list(ids, members=('Embajada de Chile', 'Consulado de España'))
+
+    client = login('coord_pa')
+    url = f'/embassies/export?list_id={list_id}'
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'Estamos generando el directorio' in response.get_data(as_text=True)
+
+    _wait_for_jobs(app)
+    response = client.get(url)
+    booklet = response.get_data(as_text=True)
+    assert response.mimetype == 'text/html'
+    assert 'Embajada de Chile' in booklet and 'Consulado de España' in booklet
+    assert 'Estamos generando' not in booklet
+
+
+def test_member_changes_produce_a_new_version(app, ids, login):
+    with app.app_context():
+        list_id = _list(ids)
+
+    client = login('coord_pa')
+    url = f'/embassies/export?list_id={list_id}'
+    client.get(url)
+    _wait_for_jobs(app)
+    assert 'Embajada de Chile' in client.get(url).get_data(as_text=True)
+    first = os.listdir(app.config['EXPORTS_FOLDER'])
+
+    with app.app_context():
+        db.session.add(Embassy(list_id=list_id, name='Embajada de Italia'))
+        db.session.commit()
+
+    assert 'Estamos generando' in client.get(url).get_data(as_text=True)
+    _wait_for_jobs(app)
+    assert 'Embajada de Italia' in client.get(url).get_data(as_text=True)
+    # The superseded booklet is removed
+    assert len(os.listdir(app.config['EXPORTS_FOLDER'])) == 1
+    assert os.listdir(app.config['EXPORTS_FOLDER']) != first
+
+
+def test_country_booklet_and_scoping(app, ids, login):
+    with app.app_context():
+        _list(ids, 'Embajadas', ('Embajada de Chile',))
+        _list(ids, 'ONG', ('Cruz Roja',))
+
+    client = login('coord_pa')
+    url = f"/embassies/export?country_id={ids['panama']}"
+    client.get(url)
+    _wait_for_jobs(app)
+    booklet = client.get(url).get_data(as_text=True)
+    assert 'Embajada de Chile' in booklet and 'Cruz Roja' in booklet
+
+    # Another country's lists are not found
+    response = login('journalist_cl').get(url)
+    assert response.status_code == 302
+
+
+def test_failed_build_waits_for_the_user_to_retry(app, ids, login, monkeypatch):
+    with app.app_context():
+        list_id = _list(ids)
+    builder = app.extensions['booklets']
+
+    def broken(title, list_ids):
+        raise RuntimeError('render failed')
+    monkeypatch.setattr(builder, '_render', broken)
+
+    client = login('coord_pa')
+    url = f'/embassies/export?list_id={list_id}'
+    client.get(url)
+    with pytest.raises(RuntimeError):
+        _wait_for_jobs(app)
+
+    # The failure is shown without polling and without queueing another build
+    page = client.get(url).get_data(as_text=True)
+    assert 'No se pudo generar el directorio' in page and 'location' not in page
+    failed = list(builder.jobs.values())
+    client.get(url)
+    assert list(builder.jobs.values()) == failed
+
+    monkeypatch.undo()
+    page = client.get(f'{url}&retry=1').get_data(as_text=True)
+    assert 'Estamos generando' in page and f'location.replace("{url}")' in page
+    _wait_for_jobs(app)
+    assert 'Embajada de Chile' in client.get(url).get_data(as_text=True)
+
+
+def test_pdf_is_refused_without_weasyprint(app, ids, login):
+    if 'pdf' in available_formats():
+        pytest.skip('WeasyPrint is installed')
+    with app.app_context():
+        list_id = _list(ids)
+    response = login('coord_pa').get(f'/embassies/export?list_id={list_id}&format=pdf')
+    assert response.status_code == 302
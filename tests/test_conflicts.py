@@ -0,0 +1,143 @@
+from datetime import datetime
+
+from sqlalchemy import event as sa_event
+
+from models import db, Event
+from utils.conflicts import event_conflicts, free, long_events, merge, overlaps
+
+
+def _create(client, title, start, end=None, location='Sala 1', **extra):
+    return client.post('/calendar/api/events/create', json={
+        'title': title, 'start': start, 'end': end, 'location': location, **extra})
+
+
+def test_interval_helpers():
+    nine, ten, eleven, noon = (datetime(2024, 5, 6, hour) for hour in (9, 10, 11, 12))
+    assert overlaps(nine, eleven, ten, noon)
+    assert not overlaps(nine, ten, ten, eleven)  # back to back
+    assert overlaps(ten, None, ten, None)  # same instant
+    assert merge([(ten, eleven), (nine, ten), (noon, noon)]) == [(nine, eleven), (noon, noon)]
+    assert free([(ten, eleven)], nine, noon) == [(nine, ten), (eleven, noon)]
+
+
+def test_same_location_clash_needs_force(app, ids, login):
+    client = login('coord_pa')
+    assert _create(client, 'Entrevista', '2024-05-06T10:00:00', '2024-05-06T11:00:00').status_code == 200
+
+    response = _create(client, 'Sesión de fotos', '2024-05-06T10:30:00', '2024-05-06T12:00:00')
+    assert response.status_code == 409
+    assert [c['title'] for c in response.json['conflicts']] == ['Entrevista']
+
+    # Back to back is fine
+    assert _create(client, 'Después', '2024-05-06T11:00:00', '2024-05-06T12:00:00').status_code == 200
+
+    response = _create(client, 'Sesión de fotos', '2024-05-06T10:30:00', '2024-05-06T12:00:00', force=True)
+    assert response.status_code == 200
+    assert {c['title'] for c in response.json['conflicts']} == {'Entrevista', 'Después'}
+
+
+def test_other_locations_are_only_overlaps(app, ids, login):
+    with app.app_context():
+        # Another country's booking of a room with the same name
+        db.session.add(Event(title='Chile', start_time=datetime(2024, 5, 6, 10), end_time=datetime(2024, 5, 6, 11),
+                             location='Sala 2', country_id=ids['chile']))
+        db.session.commit()
+    client = login('coord_pa')
+    _create(client, 'Entrevista', '2024-05-06T10:00:00', '2024-05-06T11:00:00')
+
+    response = _create(client, 'Reunión', '2024-05-06T10:00:00', '2024-05-06T11:00:00', location='Sala 2')
+    assert response.status_code == 200
+    assert response.json['conflicts'] == []
+    assert [o['title'] for o in response.json['overlaps']] == ['Entrevista']
+
+
+def test_long_events_are_found(app, ids, login):
+    client = login('coord_pa')
+    _create(client, 'Feria', '2024-05-01T09:00:00', '2024-05-10T18:00:00')
+    # Starts long before the new event; found through the cached long event ids
+    response = _create(client, 'Charla', '2024-05-08T10:00:00', '2024-05-08T11:00:00')
+    assert response.status_code == 409
+
+
+def test_long_event_ids_are_cached_per_country(app, ids, login):
+    client = login('coord_pa')
+    with app.app_context():
+        assert long_events(ids['panama']) == []
+    gira = _create(client, 'Gira', '2024-03-01T09:00:00', '2024-04-30T18:00:00').json['id']
+    _create(client, 'Cierre', '2024-03-01T09:00:00', '2024-03-01T18:00:00')  # short, not cached
+    with app.app_context():
+        assert long_events(ids['panama']) == [gira]
+        assert long_events(ids['chile']) == []
+
+    response = _create(client, 'Entrevista', '2024-04-20T10:00:00', '2024-04-20T11:00:00')
+    assert [c['title'] for c in response.json['conflicts']] == ['Gira']
+    # A cancelled long event no longer clashes
+    client.delete(f'/calendar/api/events/{gira}')
+    assert _create(client, 'Otra', '2024-04-21T10:00:00', '2024-04-21T11:00:00').json['conflicts'] == []
+
+
+def test_series_is_checked_with_one_probe(app, ids, login):
+    client = login('coord_pa')
+    _create(client, 'Entrevista', '2024-09-03T15:00:00', '2024-09-03T16:00:00')
+    with app.app_context():
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        sa_event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            same, _ = event_conflicts(ids['panama'], datetime(2024, 5, 1, 15), datetime(2024, 5, 1, 16),
+                                      'FREQ=DAILY', 'Sala 1')
+        finally:
+            sa_event.remove(db.engine, 'before_cursor_execute', listener)
+    assert [c['start'] for c in same] == ['2024-09-03T15:00:00']
+    # The long event ids, singles and series: not one probe per daily occurrence
+    assert len(statements) <= 4
+
+
+def test_series_clashes(app, ids, login):
+    client = login('coord_pa')
+    _create(client, 'Consejo', '2024-05-06T10:00:00', '2024-05-06T11:00:00', rrule='FREQ=WEEKLY;COUNT=5')
+
+    # The fourth occurrence
+    assert _create(client, 'Entrevista', '2024-05-27T10:30:00', '2024-05-27T11:30:00').status_code == 409
+    # A new series clashing with an existing single event weeks later
+    _create(client, 'Entrevista', '2024-06-19T15:00:00', '2024-06-19T16:00:00')
+    response = _create(client, 'Taller', '2024-05-01T15:00:00', '2024-05-01T16:00:00', rrule='FREQ=WEEKLY')
+    assert response.status_code == 409
+    assert [c['start'] for c in response.json['conflicts']] == ['2024-06-19T15:00:00']
+
+
+def test_moving_an_occurrence_is_checked(app, ids, login):
+    client = login('coord_pa')
+    series_id = _create(client, 'Consejo', '2024-05-06T10:00:00', '2024-05-06T11:00:00',
+                        rrule='FREQ=WEEKLY;COUNT=3').json['id']
+    _create(client, 'Entrevista', '2024-05-14T10:00:00', '2024-05-14T11:00:00')
+
+    move = {'recurrence_id': '2024-05-13T10:00:00', 'start': '2024-05-14T10:00:00', 'end': '2024-05-14T11:00:00'}
+    response = client.post(f'/calendar/api/events/{series_id}/exceptions', json=move)
+    assert response.status_code == 409
+    with app.app_context():
+        assert db.session.get(Event, series_id).exceptions.count() == 0
+
+    response = client.post(f'/calendar/api/events/{series_id}/exceptions', json={**move, 'force': True})
+    assert response.status_code == 200
+
+
+def test_free_busy(app, ids, login):
+    client = login('coord_pa')
+    _create(client, 'A', '2024-05-06T09:00:00', '2024-05-06T10:00:00')
+    _create(client, 'B', '2024-05-06T09:30:00', '2024-05-06T11:00:00', force=True)
+    _create(client, 'C', '2024-05-06T14:00:00', '2024-05-06T15:00:00', location='Sala 2')
+    _create(client, 'D', '2024-05-06T07:00:00', '2024-05-06T08:00:00',
+            rrule='FREQ=DAILY;COUNT=2')  # second occurrence is outside the window
+
+    window = 'start=2024-05-06T08:00:00&end=2024-05-06T18:00:00'
+    busy = client.get(f'/calendar/api/freebusy?{window}').json['busy']
+    assert busy == {
+        'Sala 1': [{'start': '2024-05-06T09:00:00', 'end': '2024-05-06T11:00:00'}],
+        'Sala 2': [{'start': '2024-05-06T14:00:00', 'end': '2024-05-06T15:00:00'}],
+    }
+
+    payload = client.get(f'/calendar/api/freebusy?{window}&location=Sala 1').json
+    assert list(payload['busy']) == ['Sala 1']
+    assert payload['free'] == [{'start': '2024-05-06T08:00:00', 'end': '2024-05-06T09:00:00'},
+                               {'start': '2024-05-06T11:00:00', 'end': '2024-05-06T18:00:00'}]
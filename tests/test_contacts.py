@@ -0,0 +1,94 @@
+import pytest
+from models import db, Embassy, EmbassyList
+from utils.contacts import (contact_key, duplicate_groups, duplicates_of, normalize_all, normalize_email,
+                            normalize_instagram, normalize_phone, problems_for)
+
+
+@pytest.mark.parametrize('raw, region, expected', [
+    ('+507 6000-1234', None, '+50760001234'),
+    ('6000-1234', 'PA', '+50760001234'),
+    ('00507 6000 1234', None, '+50760001234'),
+    ('6000-1234', None, None),
+    ('llamar a recepción', 'PA', None),
+    ('', 'PA', None),
+])
+def test_normalize_phone(raw, region, expected):
+    assert normalize_phone(raw, region) == expected
+
+
+@pytest.mark.parametrize('raw, expected', [
+    (' Prensa@Embajada.ORG ', 'prensa@embajada.org'),
+    ('mailto:prensa@embajada.org', 'prensa@embajada.org'),
+    ('prensa@embajada', None),
+])
+def test_normalize_email(raw, expected):
+    assert normalize_email(raw) == expected
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('@EmbajadaPA', '@embajadapa'),
+    ('https://www.instagram.com/embajadapa/?hl=es', '@embajadapa'),
+    ('embajada pa', None),
+])
+def test_normalize_instagram(raw, expected):
+    assert normalize_instagram(raw) == expected
+
+
+def _lists(ids):
+    embassies = EmbassyList(name='Embajadas', country_id=ids['panama'])
+    ngos = EmbassyList(name='ONG', country_id=ids['panama'])
+    db.session.add_all([embassies, ngos])
+    db.session.flush()
+    return embassies, ngos
+
+
+def test_members_are_normalized_when_written(app, ids):
+    with app.app_context():
+        embassies, _ = _lists(ids)
+        member = Embassy(list_id=embassies.id, name='España', phone='6000-1234', email='Info@Embes.PA',
+                         instagram='sin cuenta')
+        db.session.add(member)
+        db.session.commit()
+
+        assert member.phone == '+50760001234'
+        assert member.email == 'info@embes.pa'
+        assert member.phone_key == contact_key('phone', '+50760001234')
+        # Kept as typed, without a key, and reported to the form
+        assert member.instagram == 'sin cuenta'
+        assert member.instagram_key is None
+        assert problems_for(member) == ['instagram']
+
+
+def test_duplicates_across_lists(app, ids):
+    with app.app_context():
+        embassies, ngos = _lists(ids)
+        first = Embassy(list_id=embassies.id, name='Italia', phone='+507 6000-1234')
+        second = Embassy(list_id=ngos.id, name='Fundación', phone='6000 1234', email='f@fundacion.org')
+        third = Embassy(list_id=ngos.id, name='Fundación (prensa)', email='F@Fundacion.org')
+        other = Embassy(list_id=ngos.id, name='Otra', phone='6111-2222')
+        db.session.add_all([first, second, third, other])
+        db.session.commit()
+
+        assert [m.name for m in duplicates_of(first)] == ['Fundación']
+        # Linked through the shared phone and the shared email
+        groups = duplicate_groups()
+        assert [sorted(m.name for m in group) for group in groups] == [['Fundación', 'Fundación (prensa)', 'Italia']]
+
+
+def test_normalize_all_updates_existing_rows(app, ids):
+    with app.app_context():
+        embassies, _ = _lists(ids)
+        # Written around the session, as rows created before normalization existed
+        db.session.execute(Embassy.__table__.insert(), [
+            {'list_id': embassies.id, 'name': f'Miembro {n}', 'phone': f'6000-00{n:02d}', 'email': 'X@Y.COM'}
+            for n in range(5)
+        ])
+        db.session.commit()
+
+        assert normalize_all(batch_size=2, dry_run=True) == (5, 0)
+        assert Embassy.query.filter(Embassy.phone_key.isnot(None)).count() == 0
+
+        assert normalize_all(batch_size=2) == (5, 0)
+        assert {m.email for m in Embassy.query} == {'x@y.com'}
+        assert Embassy.query.filter(Embassy.phone_key.is_(None)).count() == 0
+        assert normalize_all(batch_size=2) == (0, 0)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from utils.coordination import Coordinator, DatabaseBackend, LockUnavailable, MemoryBackend
+
+
+@pytest.fixture(params=['memory', 'database'])
+def backend(request, app):
+    return MemoryBackend() if request.param == 'memory' else DatabaseBackend(app)
+
+
+def test_shared_cache(app, backend):
+    coordinator = Coordinator(app, backend)
+    assert coordinator.get('clave', 'nada') == 'nada'
+    coordinator.set('clave', {'total': 5})
+    assert coordinator.get('clave') == {'total': 5}
+    coordinator.set('clave', [1, 2])
+    assert coordinator.get('clave') == [1, 2]
+
+    assert coordinator.get_or_set('otra', lambda: 7) == 7
+    assert coordinator.get_or_set('otra', lambda: 8) == 7
+    coordinator.delete('otra')
+    assert coordinator.get('otra') is None
+
+    coordinator.set('breve', 1, ttl=0.05)
+    time.sleep(0.1)
+    assert coordinator.get('breve') is None
+
+
+def test_locks_exclude_other_holders(app, backend):
+    first, second = Coordinator(app, backend), Coordinator(app, backend)
+    with first.lock('tarea'):
+        assert first.holder('tarea').startswith(first.owner)
+        with pytest.raises(LockUnavailable):
+            with second.lock('tarea'):
+                pass
+    # Released when the block ends
+    with second.lock('tarea'):
+        assert second.holder('tarea').startswith(second.owner)
+    assert first.holder('tarea') is None
+
+
+def test_expired_leases_can_be_taken_over(app, backend):
+    assert backend.acquire('tarea', 'caido', ttl=0.05)
+    assert not backend.acquire('tarea', 'otro', ttl=10)
+    time.sleep(0.1)
+    assert backend.acquire('tarea', 'otro', ttl=10)
+    assert backend.holder('tarea') == 'otro'
+
+    # Only the holder releases
+    backend.release('tarea', 'caido')
+    assert backend.holder('tarea') == 'otro'
+
+
+def test_one_leader_per_name(app, backend):
+    first, second = Coordinator(app, backend), Coordinator(app, backend)
+    assert first.is_leader('limpieza')
+    assert not second.is_leader('limpieza')
+    assert second.is_leader('otra-tarea')
+
+
+def test_purge_removes_expired_entries(app, backend):
+    coordinator = Coordinator(app, backend)
+    coordinator.set('breve', 1, ttl=0.05)
+    coordinator.set('larga', 2)
+    backend.acquire('tarea', 'caido', ttl=0.05)
+    time.sleep(0.1)
+    backend.purge()
+    assert coordinator.get('larga') == 2
+    assert backend.holder('tarea') is None
+
+
+def test_periodic_jobs_wait_for_start(app):
+    coordinator = Coordinator(app, MemoryBackend())
+    runs = []
+    coordinator.periodic('contar', 0.05, lambda: runs.append(1))
+    time.sleep(0.1)
+    assert runs == []
+
+    coordinator.start()
+    coordinator.start()  # idempotent
+    time.sleep(0.2)
+    assert runs
+    assert [t.name for t in threading.enumerate()].count('periodic-contar') == 1
@@ -0,0 +1,47 @@
+import re
+from models import db, Country, User
+from utils import counts
+
+
+def _total(client, query=''):
+    page = client.get('/users/' + query).get_data(as_text=True)
+    return int(re.search(r'(\d+) usuarios', page).group(1))
+
+
+def test_counts_are_cached_per_scope(app, ids, login):
+    # Same (empty) filters, different rows: the whole team, one country, nobody
+    assert _total(login('admin')) == 5
+    assert _total(login('coord_pa')) == 2
+    assert _total(login('coord_none')) == 0
+    assert _total(login('admin')) == 5
+
+
+def test_filters_are_part_of_the_key(app, ids, login):
+    client = login('admin')
+    assert _total(client, '?role=journalist') == 2
+    assert _total(client, '?role=coordinator') == 2
+
+
+def test_writes_invalidate_the_cached_count(app, ids, login):
+    client = login('admin')
+    assert _total(client) == 5
+    with app.app_context():
+        user = User(username='nuevo', email='nuevo@test', role='journalist', country_id=ids['panama'])
+        user.set_password('secret')
+        db.session.add(user)
+        db.session.commit()
+    assert _total(client) == 6
+    assert _total(login('coord_pa')) == 3
+
+
+def test_only_counted_tables_touch_the_shared_cache(app, ids, monkeypatch):
+    bumped = []
+    monkeypatch.setattr(counts, '_new_generation', bumped.append)
+    with app.app_context():
+        db.session.add(Country(name='Perú', code='PE'))
+        db.session.commit()
+        assert bumped == []
+
+        db.session.get(User, ids['journalist_pa']).is_active = False
+        db.session.commit()
+        assert bumped == ['user']
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from models import db, Event, EventException
+
+
+def _event(country_id, title, hours_ago=2, **values):
+    event = Event(title=title, start_time=datetime(2024, 5, 6, 10), country_id=country_id, **values)
+    db.session.add(event)
+    db.session.flush()
+    # Older than the overlap re-sent before a client's version
+    event.updated_at = datetime.utcnow() - timedelta(hours=hours_ago)
+    db.session.commit()
+    return event.id
+
+
+def _titles(payload):
+    return sorted(event['title'] for event in payload['events'])
+
+
+def test_first_sync_is_full_and_scoped(app, ids, login):
+    with app.app_context():
+        _event(ids['panama'], 'Panamá')
+        _event(ids['chile'], 'Chile')
+
+    payload = login('coord_pa').get('/calendar/api/events/changes').json
+    assert payload['full'] is True
+    assert _titles(payload) == ['Panamá'] and payload['deleted'] == []
+    assert payload['scope'] == f"{ids['coord_pa']}:coordinator:{ids['panama']}"
+
+
+def test_delta_returns_changed_series_and_deleted_ids(app, ids, login):
+    with app.app_context():
+        kept = _event(ids['panama'], 'Sin cambios', hours_ago=3)
+        removed = _event(ids['panama'], 'Se borra')
+        series = _event(ids['panama'], 'Consejo', rrule='FREQ=WEEKLY;COUNT=4')
+
+    client = login('coord_pa')
+    first = client.get('/calendar/api/events/changes').json
+
+    client.delete(f'/calendar/api/events/{removed}')
+    with app.app_context():
+        # Changing an occurrence counts as a change to its series
+        db.session.add(EventException(event_id=series, original_start=datetime(2024, 5, 13, 10), is_cancelled=True))
+        db.session.commit()
+
+    delta = client.get('/calendar/api/events/changes',
+                       query_string={'since': first['version'], 'scope': first['scope']}).json
+    assert delta['full'] is False
+    assert _titles(delta) == ['Consejo']
+    assert delta['events'][0]['exceptions'][0]['cancelled'] is True
+    assert delta['deleted'] == [removed]
+    assert kept not in delta['deleted']
+    assert delta['version'] != first['version']
+
+
+def test_changed_scope_forces_a_full_resync(app, ids, login):
+    with app.app_context():
+        _event(ids['panama'], 'Panamá')
+
+    client = login('coord_pa')
+    first = client.get('/calendar/api/events/changes').json
+    payload = client.get('/calendar/api/events/changes',
+                         query_string={'since': first['version'], 'scope': 'otro:admin:None'}).json
+    assert payload['full'] is True and _titles(payload) == ['Panamá']
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+from models import db, Event, EventException, User
+
+
+def _feed_url(app, login, username):
+    client = login(username)
+    client.post('/calendar/feed/token')
+    with app.app_context():
+        token = User.query.filter_by(username=username).one().calendar_token
+    assert token
+    return f'/calendar/feed/{token}.ics'
+
+
+def _event(country_id, title, **values):
+    event = Event(title=title, start_time=datetime(2024, 5, 6, 10), end_time=datetime(2024, 5, 6, 11),
+                  country_id=country_id, **values)
+    db.session.add(event)
+    db.session.flush()
+    return event
+
+
+def _age_event(event_id, hours):
+    # Move a change out of the overlap that deltas re-send before the sync point
+    db.session.execute(db.update(Event).where(Event.id == event_id)
+                       .values(updated_at=datetime.utcnow() - timedelta(hours=hours)))
+    db.session.commit()
+
+
+def test_feed_is_scoped_to_the_token_owner(app, ids, login):
+    with app.app_context():
+        _event(ids['panama'], 'Cierre Panamá')
+        _event(ids['chile'], 'Cierre Chile')
+        db.session.commit()
+
+    url = _feed_url(app, login, 'coord_pa')
+    # No session needed: calendar apps only have the URL
+    response = app.test_client().get(url)
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/calendar'
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert 'SUMMARY:Cierre Panamá' in body and 'Cierre Chile' not in body
+    assert response.headers['X-Sync-Token'] in body
+
+    assert app.test_client().get('/calendar/feed/no-such-token.ics').status_code == 404
+
+
+def test_new_token_revokes_the_old_url(app, ids, login):
+    old = _feed_url(app, login, 'coord_pa')
+    new = _feed_url(app, login, 'coord_pa')
+    assert old != new
+    assert app.test_client().get(old).status_code == 404
+
+
+def test_sync_token_returns_changes_and_tombstones(app, ids, login):
+    with app.app_context():
+        kept = _event(ids['panama'], 'Sin cambios')
+        deleted = _event(ids['panama'], 'Se borra')
+        db.session.commit()
+        kept_id, deleted_id = kept.id, deleted.id
+        _age_event(kept_id, 2)
+        _age_event(deleted_id, 1)
+
+    url = _feed_url(app, login, 'coord_pa')
+    client = app.test_client()
+    token = client.get(url).headers['X-Sync-Token']
+
+    login('coord_pa').delete(f'/calendar/api/events/{deleted_id}')
+    with app.app_context():
+        _event(ids['panama'], 'Nuevo')
+        db.session.commit()
+
+    response = client.get(url, query_string={'sync_token': token})
+    body = response.get_data(as_text=True)
+    assert f'UID:event-{kept_id}@amici' not in body
+    assert f'UID:event-{deleted_id}@amici' in body and 'STATUS:CANCELLED' in body
+    assert 'SUMMARY:Nuevo' in body
+    assert response.headers['X-Sync-Token'] != token
+
+    # A full download leaves the deleted event out altogether
+    assert f'UID:event-{deleted_id}@amici' not in client.get(url).get_data(as_text=True)
+
+
+def test_unchanged_sync_token_is_not_modified(app, ids, login):
+    with app.app_context():
+        # Changed just now, inside the overlap that deltas re-send
+        _event(ids['panama'], 'Cierre')
+        db.session.commit()
+
+    url = _feed_url(app, login, 'coord_pa')
+    client = app.test_client()
+    token = client.get(url).headers['X-Sync-Token']
+    response = client.get(url, query_string={'sync_token': token})
+    assert response.status_code == 304
+    assert response.headers['X-Sync-Token'] == token
+
+
+def test_if_modified_since(app, ids, login):
+    with app.app_context():
+        _event(ids['panama'], 'Cierre')
+        db.session.commit()
+
+    url = _feed_url(app, login, 'coord_pa')
+    client = app.test_client()
+    last_modified = client.get(url).headers['Last-Modified']
+    assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_series_exceptions_are_exported(app, ids, login):
+    with app.app_context():
+        series = _event(ids['panama'], 'Consejo', rrule='FREQ=WEEKLY;COUNT=4')
+        db.session.add_all([
+            EventException(event_id=series.id, original_start=datetime(2024, 5, 13, 10), is_cancelled=True),
+            EventException(event_id=series.id, original_start=datetime(2024, 5, 20, 10),
+                           start_time=datetime(2024, 5, 21, 10), title='Consejo (martes)'),
+        ])
+        db.session.commit()
+
+    body = app.test_client().get(_feed_url(app, login, 'coord_pa')).get_data(as_text=True)
+    assert 'RRULE:FREQ=WEEKLY;COUNT=4' in body
+    assert 'EXDATE:20240513T100000' in body
+    assert 'RECURRENCE-ID:20240520T100000' in body and 'DTSTART:20240521T100000' in body
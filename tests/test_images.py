@@ -0,0 +1,84 @@
+import io
+import os
+
+from PIL import Image
+
+from utils.images import ResizeCache, _files, image_url
+
+
+def _photo(app, name='face.png', size=(1000, 500)):
+    os.makedirs(app.config['USERS_FOLDER'], exist_ok=True)
+    Image.new('RGB', size, 'red').save(os.path.join(app.config['USERS_FOLDER'], name))
+    return name
+
+
+def _url(app, name, width, fmt='jpeg'):
+    with app.test_request_context():
+        return image_url('users', name, width, fmt)
+
+
+def test_signed_url_serves_resized_image(app):
+    client = app.test_client()
+    name = _photo(app)
+    url = _url(app, name, 200)
+    assert '/img/users/256/jpeg/' in url  # snapped up to the next rendered width
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert img.size == (256, 128)
+
+
+def test_bad_signature_is_forbidden(app):
+    client = app.test_client()
+    name = _photo(app)
+    url = _url(app, name, 256)
+    assert client.get(url[:-2] + 'xx').status_code == 403
+    # A valid signature does not carry over to another width
+    assert client.get(url.replace('/256/', '/512/')).status_code == 403
+
+
+def test_unknown_width_and_missing_file(app):
+    client = app.test_client()
+    name = _photo(app)
+    assert client.get(f'/img/users/100/jpeg/{name}?s=x').status_code == 404
+    assert client.get(_url(app, 'missing.png', 256)).status_code == 404
+
+
+def test_second_request_is_served_from_cache(app):
+    client = app.test_client()
+    name = _photo(app)
+    url = _url(app, name, 256)
+    first = client.get(url).data
+    cached = [entry.path for entry in _files(app.config['IMAGE_CACHE_FOLDER'])]
+    assert len(cached) == 1
+
+    os.utime(cached[0], (0, 0))
+    assert client.get(url).data == first
+    assert os.path.getmtime(cached[0]) > 0  # touched as the LRU clock, not re-rendered
+    assert len(list(_files(app.config['IMAGE_CACHE_FOLDER']))) == 1
+
+
+def test_eviction_keeps_cache_under_limit(app):
+    names = [_photo(app, f'p{i}.png', (400, 400)) for i in range(3)]
+    app.config['IMAGE_CACHE_MAX_BYTES'] = 1
+    cache = ResizeCache(app)
+    with app.app_context():
+        paths = [cache.get(os.path.join(app.config['USERS_FOLDER'], name), 64, 'jpeg') for name in names]
+    remaining = [entry.path for entry in _files(app.config['IMAGE_CACHE_FOLDER'])]
+    assert remaining == [paths[-1]]  # only the file being served survives
+
+
+def test_unreadable_source_is_unsupported(app):
+    os.makedirs(app.config['USERS_FOLDER'], exist_ok=True)
+    with open(os.path.join(app.config['USERS_FOLDER'], 'notas.png'), 'wb') as f:
+        f.write(b'no es una imagen')
+    assert app.test_client().get(_url(app, 'notas.png', 256)).status_code == 415
+
+
+def test_oversized_source_is_unsupported(app, monkeypatch):
+    name = _photo(app)
+    # Pillow raises DecompressionBombError above twice this many pixels
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    assert app.test_client().get(_url(app, name, 256)).status_code == 415
@@ -0,0 +1,76 @@
+import sqlite3
+from contextlib import closing
+
+from models import db
+from utils.maintenance import INCREMENTAL
+
+
+def _run(app, *args):
+    return app.test_cli_runner().invoke(args=['db-maint', *args])
+
+
+def _free_pages(count):
+    # A scratch table outside the audited models, so nothing reuses the pages meanwhile
+    db.session.execute(db.text('CREATE TABLE scratch (data TEXT)'))
+    db.session.execute(db.text('INSERT INTO scratch VALUES (:data)'), [{'data': 'x' * 4000}] * count)
+    db.session.execute(db.text('DROP TABLE scratch'))
+    db.session.commit()
+
+
+def _pragma(app, name):
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            return connection.driver_connection.execute(f'PRAGMA {name}').fetchone()[0]
+        finally:
+            connection.close()
+
+
+def test_backup_copies_the_live_database(app, ids, tmp_path):
+    target = str(tmp_path / 'backups' / 'copy.db')
+    result = _run(app, 'backup', target, '--verify')
+    assert result.exit_code == 0, result.output
+    assert 'backup' in result.output
+
+    with closing(sqlite3.connect(target)) as copy:
+        assert copy.execute('SELECT COUNT(*) FROM user').fetchone()[0] == 5
+    assert not (tmp_path / 'backups' / 'copy.db.tmp').exists()
+
+
+def test_new_database_uses_incremental_vacuum(app, ids):
+    assert _pragma(app, 'auto_vacuum') == INCREMENTAL
+    with app.app_context():
+        _free_pages(200)
+
+    result = _run(app, 'vacuum')
+    assert result.exit_code == 0, result.output
+    assert _pragma(app, 'freelist_count') == 0
+
+
+def test_vacuum_limits_pages(app, ids):
+    with app.app_context():
+        _free_pages(200)
+    free = _pragma(app, 'freelist_count')
+
+    assert _run(app, 'vacuum', '--pages', '10').exit_code == 0
+    assert _pragma(app, 'freelist_count') == free - 10
+
+
+def test_analyze_and_check(app, ids):
+    result = _run(app, 'analyze', '--full')
+    assert result.exit_code == 0, result.output
+
+    result = _run(app, 'check', '--full')
+    assert result.exit_code == 0, result.output
+    assert result.output.strip().endswith('ok')
+
+
+def test_check_reports_broken_foreign_keys(app, ids):
+    with app.app_context():
+        db.session.execute(db.text('PRAGMA foreign_keys = OFF'))
+        db.session.execute(db.text("INSERT INTO article (title, author_id) VALUES ('orphan', 9999)"))
+        db.session.commit()
+
+    result = _run(app, 'check')
+    assert result.exit_code == 1
+    assert 'article row' in result.output and 'missing user' in result.output
@@ -0,0 +1,131 @@
+import os
+from datetime import date, timedelta
+
+from models import db, Manual, ManualDownloadStat
+from utils import manual_catalog
+from utils.manual_catalog import by_filename, catalog_for, usage_report
+
+
+def _manuals():
+    db.session.add_all([
+        Manual(name='Estilo', filename='estilo.pdf', target_role='all'),
+        Manual(name='Fotografía', filename='foto.pdf', target_role='photographer'),
+        Manual(name='Redacción', filename='redaccion.pdf', target_role='journalist'),
+    ])
+    db.session.commit()
+
+
+def test_catalog_is_filtered_by_role(app):
+    with app.app_context():
+        _manuals()
+        assert [m.name for m in catalog_for('journalist')] == ['Estilo', 'Redacción']
+        assert [m.name for m in catalog_for('admin')] == ['Estilo', 'Fotografía', 'Redacción']
+        assert by_filename('foto.pdf').target_role == 'photographer'
+
+
+def test_catalog_is_built_once_per_generation(app, monkeypatch):
+    with app.app_context():
+        _manuals()
+        catalog_for('journalist')
+        builds, build = [], manual_catalog._build
+        monkeypatch.setattr(manual_catalog, '_build', lambda: builds.append(1) or build())
+
+        catalog_for('journalist')
+        assert builds == []
+
+        manual = Manual.query.filter_by(filename='foto.pdf').one()
+        manual.target_role = 'all'
+        db.session.commit()
+        assert [m.name for m in catalog_for('journalist')] == ['Estilo', 'Fotografía', 'Redacción']
+        assert builds == [1]
+
+
+def test_other_workers_changes_are_seen_after_the_check_interval(app, monkeypatch):
+    with app.app_context():
+        _manuals()
+        generation = manual_catalog._generation()
+        reads, get = [], manual_catalog.coordinator().get
+        monkeypatch.setattr(manual_catalog.coordinator(), 'get', lambda key: reads.append(key) or get(key))
+
+        # Another worker's commit only reaches the shared cache
+        manual_catalog.coordinator().set(manual_catalog.GENERATION_KEY, 'other')
+        for _ in range(3):
+            assert manual_catalog._generation() == generation
+        assert reads == []
+
+        monkeypatch.setattr(manual_catalog, 'GENERATION_CHECK_INTERVAL', 0)
+        assert manual_catalog._generation() == 'other'
+
+
+def test_rolled_back_changes_keep_the_catalog(app):
+    with app.app_context():
+        _manuals()
+        generation = manual_catalog._generation()
+        db.session.add(Manual(name='Borrador', filename='borrador.pdf', target_role='all'))
+        db.session.flush()
+        db.session.rollback()
+        assert manual_catalog._generation() == generation
+
+
+def test_downloads_are_counted_in_batches(app, ids, login):
+    with app.app_context():
+        _manuals()
+        manual_id = by_filename('redaccion.pdf').id
+    folder = os.path.join(app.root_path, 'static', 'manuals')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, 'redaccion.pdf')
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4')
+    try:
+        client = login('journalist_pa')
+        for _ in range(3):
+            assert client.get('/manuals/view/redaccion.pdf').status_code == 200
+        # Photographer-only manuals are refused, and not counted
+        assert client.get('/manuals/view/foto.pdf').status_code == 302
+    finally:
+        os.remove(path)
+
+    with app.app_context():
+        assert ManualDownloadStat.query.count() == 0  # still buffered
+        counter = app.extensions['manual_downloads']
+        counter.flush()
+        counter.record(manual_id, 'journalist')
+        counter.flush()
+        stat, = ManualDownloadStat.query.all()
+        assert (stat.manual_id, stat.day, stat.role, stat.count) == (manual_id, date.today(), 'journalist', 4)
+
+
+def test_counts_for_deleted_manuals_are_dropped(app):
+    with app.app_context():
+        _manuals()
+        manual = Manual.query.filter_by(filename='estilo.pdf').one()
+        counter = app.extensions['manual_downloads']
+        counter.record(manual.id, 'journalist')
+        db.session.delete(manual)
+        db.session.commit()
+        counter.flush()
+        assert ManualDownloadStat.query.count() == 0
+        assert counter.pending == {}
+
+
+def test_usage_report(app, ids, login):
+    with app.app_context():
+        _manuals()
+        estilo, foto = by_filename('estilo.pdf').id, by_filename('foto.pdf').id
+        db.session.add_all([
+            ManualDownloadStat(manual_id=estilo, day=date.today(), role='journalist', count=2),
+            ManualDownloadStat(manual_id=estilo, day=date.today() - timedelta(days=3), role='photographer', count=1),
+            ManualDownloadStat(manual_id=foto, day=date.today() - timedelta(days=60), role='photographer', count=9),
+        ])
+        db.session.commit()
+
+        report = usage_report(date.today() - timedelta(days=29))
+        assert [(entry.name, total, by_role) for entry, total, by_role, _ in report] == [
+            ('Estilo', 3, {'journalist': 2, 'photographer': 1}),
+            ('Fotografía', 0, {}),
+            ('Redacción', 0, {}),
+        ]
+        assert report[0][3] == date.today()
+
+    assert login('admin').get('/manuals/usage?days=90').status_code == 200
+    assert login('journalist_pa').get('/manuals/usage').status_code == 302
@@ -0,0 +1,82 @@
+from concurrent.futures import Future
+
+import pytest
+
+from models import db, Manual
+from utils.manual_preview import extract_preview
+
+
+def _pdf(pages):
+    """A minimal PDF with one line of Helvetica text per page."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in pages:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = b'%PDF-1.4\n', []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return out
+
+
+def test_extract_preview_counts_pages_and_text(tmp_path):
+    pytest.importorskip('pypdf')
+    path = tmp_path / 'manual.pdf'
+    path.write_bytes(_pdf(['Guia de estilo', 'Uso de fotografias', 'Cierre de edicion']))
+
+    result = extract_preview(str(path), str(tmp_path / 'thumbs' / '1.jpg'), max_pages=2, max_chars=1000)
+    assert result['page_count'] == 3
+    # No embedded cover image: the generic icon is kept
+    assert result['thumbnail'] is None
+    assert result['text_content'] == 'Guia de estilo\nUso de fotografias'
+
+    result = extract_preview(str(path), str(tmp_path / 'thumbs' / '1.jpg'), max_pages=10, max_chars=5)
+    assert result['text_content'] == 'Guia '
+
+
+def _manual(**values):
+    manual = Manual(name='Estilo', filename='estilo.pdf', target_role='all', **values)
+    db.session.add(manual)
+    db.session.commit()
+    return manual.id
+
+
+def test_results_are_stored_on_the_manual(app):
+    with app.app_context():
+        done_id, failed_id = _manual(preview_status='pending'), _manual(preview_status='pending')
+
+    previewer = app.extensions['manual_previewer']
+    future = Future()
+    future.set_result({'page_count': 12, 'thumbnail': None, 'text_content': 'texto'})
+    previewer._store(done_id, future)
+    future = Future()
+    future.set_exception(ValueError('PDF dañado'))
+    previewer._store(failed_id, future)
+
+    with app.app_context():
+        done = db.session.get(Manual, done_id)
+        assert (done.preview_status, done.page_count, done.text_content) == ('done', 12, 'texto')
+        assert done.processed_at is not None
+        assert db.session.get(Manual, failed_id).preview_status == 'failed'
+
+
+def test_search_matches_extracted_text(app, ids, login):
+    with app.app_context():
+        _manual(text_content='Las fotografías de portada deben tener 300 ppp como mínimo.')
+        db.session.add(Manual(name='Otro', filename='otro.pdf', target_role='all', text_content='Nada que ver'))
+        db.session.commit()
+
+    page = login('journalist_pa').get('/manuals/?q=portada').get_data(as_text=True)
+    assert 'Estilo' in page and 'Otro' not in page
+    assert 'fotografías de portada deben' in page
@@ -0,0 +1,98 @@
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import upgrade
+from sqlalchemy import inspect, text
+
+from app import create_app, upgrade_database
+from config import Config
+from models import db
+
+
+def _app(tmp_path, name='migrated.db'):
+    class MigrationConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / name)
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        MANUALS_FOLDER = str(tmp_path / 'manuals')
+        AUDIT_FOLDER = str(tmp_path / 'audit')
+    return create_app(MigrationConfig)
+
+
+def _differences(app):
+    with app.app_context(), db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'compare_type': True})
+        return compare_metadata(context, db.metadata)
+
+
+def test_migrations_match_the_models(tmp_path):
+    app = _app(tmp_path)
+    with app.app_context():
+        upgrade_database()
+    assert _differences(app) == []
+
+
+def test_create_all_database_is_stamped_and_upgraded(tmp_path):
+    app = _app(tmp_path, 'legacy.db')
+    with app.app_context():
+        # A database from before migrations existed: only the baseline tables
+        upgrade(revision='0001')
+        db.session.execute(text('DROP TABLE alembic_version'))
+        db.session.commit()
+        upgrade_database()
+        tables = inspect(db.engine).get_table_names()
+        version = db.session.execute(text('SELECT version_num FROM alembic_version')).scalar()
+    assert 'edition_progress' in tables
+    assert version == _head(app)
+    assert _differences(app) == []
+
+
+def _upgrade_with_rows(tmp_path, revision, statements):
+    """Upgrade to `revision`, insert rows the old schema allowed, then upgrade to head."""
+    app = _app(tmp_path, 'seeded.db')
+    with app.app_context():
+        upgrade(revision=revision)
+        for statement in statements:
+            db.session.execute(text(statement))
+        db.session.commit()
+        upgrade()
+    return app
+
+
+def _scalar(app, statement):
+    with app.app_context():
+        return db.session.execute(text(statement)).scalar()
+
+
+def test_existing_articles_get_their_edition_country(tmp_path):
+    app = _upgrade_with_rows(tmp_path, '0003', [
+        "INSERT INTO country (id, name, code) VALUES (7, 'Panamá', 'PA')",
+        "INSERT INTO edition (id, title, country_id) VALUES (1, 'Mayo', 7)",
+        "INSERT INTO article (id, title, edition_id) VALUES (1, 'Nota', 1)",
+    ])
+    assert _scalar(app, 'SELECT country_id FROM article WHERE id = 1') == 7
+
+
+def test_existing_events_get_a_sync_timestamp(tmp_path):
+    app = _upgrade_with_rows(tmp_path, '0006', [
+        "INSERT INTO event (id, title, start_time) VALUES (1, 'Cierre', '2024-05-01 10:00:00')",
+    ])
+    assert _scalar(app, 'SELECT updated_at FROM event WHERE id = 1') is not None
+
+
+def test_archived_ids_are_skipped_by_new_rows(tmp_path):
+    app = _upgrade_with_rows(tmp_path, '0016', [
+        "INSERT INTO event (id, title) VALUES (3, 'Vigente')",
+        "INSERT INTO archived_event (id, title) VALUES (9, 'Archivado')",
+    ])
+    assert _scalar(app, "SELECT seq FROM sqlite_sequence WHERE name = 'event'") == 9
+    with app.app_context():
+        db.session.execute(text("INSERT INTO event (title) VALUES ('Nuevo')"))
+        db.session.commit()
+    assert _scalar(app, "SELECT id FROM event WHERE title = 'Nuevo'") == 10
+
+
+def _head(app):
+    from alembic.script import ScriptDirectory
+    with app.app_context():
+        config = app.extensions['migrate'].migrate.get_config()
+    return ScriptDirectory.from_config(config).get_current_head()
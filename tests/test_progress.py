@@ -0,0 +1,123 @@
+from datetime import date, datetime, timedelta
+
+from models import db, Article, ArticleImage, Edition, EditionProgress
+
+
+def _edition(ids, title='Edición 1'):
+    edition = Edition(title=title, publication_date=date(2026, 11, 1), country_id=ids['panama'])
+    db.session.add(edition)
+    db.session.commit()
+    return edition
+
+
+def _progress(edition_id):
+    db.session.expire_all()
+    return db.session.get(EditionProgress, edition_id)
+
+
+def test_rollup_follows_article_changes(app, ids):
+    with app.app_context():
+        edition = _edition(ids)
+        future = datetime.utcnow() + timedelta(days=3)
+        articles = [Article(title=f'A{n}', edition_id=edition.id, status='draft', deadline=future) for n in range(3)]
+        db.session.add_all(articles)
+        db.session.commit()
+
+        progress = _progress(edition.id)
+        assert progress.total_articles == 3 and progress.draft_count == 3
+        assert progress.next_deadline == future and progress.completion_pct == 0
+
+        articles[0].status = 'done'
+        db.session.commit()
+        progress = _progress(edition.id)
+        assert progress.draft_count == 2 and progress.done_count == 1
+        assert progress.completion_pct == 33
+
+        db.session.delete(articles[1])
+        db.session.commit()
+        progress = _progress(edition.id)
+        assert progress.total_articles == 2 and progress.draft_count == 1
+
+
+def test_moving_an_article_refreshes_both_editions(app, ids):
+    with app.app_context():
+        old, new = _edition(ids, 'Edición 1').id, _edition(ids, 'Edición 2').id
+        article = Article(title='A', edition_id=old, status='draft')
+        db.session.add(article)
+        db.session.commit()
+        article_id = article.id
+        db.session.remove()
+
+        # Loaded fresh, as in the edit form: the replaced edition_id was never read
+        article = db.session.get(Article, article_id, options=[db.defer(Article.edition_id)])
+        article.edition_id = new
+        db.session.commit()
+        assert _progress(old).total_articles == 0
+        assert _progress(new).total_articles == 1
+
+
+def test_refresh_replaces_existing_rollup_rows(app, ids):
+    from utils.progress import refresh_edition_progress
+    with app.app_context():
+        edition = _edition(ids)
+        db.session.add(Article(title='A', edition_id=edition.id, status='review'))
+        db.session.commit()
+
+        # A second worker refreshing the same edition updates the row in place
+        for _ in range(2):
+            refresh_edition_progress(db.session.connection(), [edition.id])
+        db.session.commit()
+        assert db.session.scalar(db.select(db.func.count()).select_from(EditionProgress)) == 1
+        assert _progress(edition.id).review_count == 1
+
+
+def test_rollup_counts_images(app, ids):
+    with app.app_context():
+        edition = _edition(ids)
+        article = Article(title='A', edition_id=edition.id, status='layout')
+        db.session.add(article)
+        db.session.commit()
+
+        image = ArticleImage(article_id=article.id, filename='foto.jpg')
+        db.session.add_all([image, ArticleImage(article_id=article.id, filename='otra.jpg')])
+        db.session.commit()
+        assert _progress(edition.id).image_count == 2
+
+        db.session.delete(image)
+        db.session.commit()
+        assert _progress(edition.id).image_count == 1
+
+
+def test_passed_deadline_is_refreshed_on_read(app, ids):
+    with app.app_context():
+        edition = _edition(ids)
+        db.session.add(Article(title='A', edition_id=edition.id, status='draft',
+                               deadline=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+        assert _progress(edition.id).overdue_count == 0
+
+        # The deadline passes without any write touching the edition
+        db.session.execute(db.update(Article).values(deadline=datetime.utcnow() - timedelta(days=1)))
+        db.session.execute(db.update(EditionProgress).values(next_deadline=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+        from utils.progress import editions_with_progress
+        (_, progress), = editions_with_progress(Edition.query.filter(Edition.id == edition.id))
+        assert progress.overdue_count == 1 and progress.next_deadline is None
+
+
+def test_board_lists_rollups(app, ids, login):
+    with app.app_context():
+        edition = _edition(ids, 'Edición de noviembre')
+        db.session.add(Article(title='A', edition_id=edition.id, status='approved'))
+        db.session.commit()
+
+    response = login('admin').get(f"/editions/board?country_id={ids['panama']}")
+    assert response.status_code == 200
+    assert 'Edición de noviembre' in response.get_data(as_text=True)
+
+    response = login('coord_pa').get('/editions/board')
+    assert 'Edición de noviembre' in response.get_data(as_text=True)
+
+    response = login('journalist_pa').get('/editions/board')
+    assert response.status_code == 302
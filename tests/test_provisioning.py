@@ -0,0 +1,99 @@
+import io
+
+from models import db, User
+
+
+def _bulk(client, users, **options):
+    return client.post('/users/bulk', json=dict(options, users=users))
+
+
+def _statuses(response):
+    return [(entry['username'], entry['status'], entry['message']) for entry in response.json['results']]
+
+
+def test_batch_reports_conflicts_per_row(app, ids, login):
+    response = _bulk(login('admin'), [
+        {'username': 'ana', 'email': 'ana@test', 'password': 'secret', 'role': 'journalist', 'country': 'PA'},
+        {'username': 'journalist_pa', 'email': 'otro@test'},
+        {'username': 'luis', 'email': 'j_cl@test'},
+        {'username': 'ana', 'email': 'ana2@test'},
+        {'username': 'eva', 'email': 'ana@test'},
+        {'username': 'rosa', 'email': 'rosa@test', 'role': 'editor'},
+        {'username': 'pia', 'email': 'pia@test', 'country': 'Atlántida'},
+        {'username': 'tomas', 'email': 'tomas@test', 'country': 'Chile'},
+    ])
+    assert response.status_code == 200
+    assert _statuses(response) == [
+        ('ana', 'created', None),
+        ('journalist_pa', 'skipped', 'El nombre de usuario ya existe.'),
+        ('luis', 'error', 'El email ya está registrado.'),
+        ('ana', 'error', 'Nombre de usuario repetido en el lote.'),
+        ('eva', 'error', 'Email repetido en el lote.'),
+        ('rosa', 'error', 'Rol desconocido: editor.'),
+        ('pia', 'error', 'País desconocido: Atlántida.'),
+        ('tomas', 'created', None),
+    ]
+    assert response.json['summary'] == {'created': 2, 'skipped': 1, 'error': 5}
+
+    results = response.json['results']
+    assert 'password' not in results[0]
+    # No password given: one is generated and shown only in the report
+    assert results[-1]['password']
+    with app.app_context():
+        ana = User.query.filter_by(username='ana').one()
+        assert ana.country_id == ids['panama'] and ana.check_password('secret')
+        tomas = User.query.filter_by(username='tomas').one()
+        assert tomas.country_id == ids['chile'] and tomas.check_password(results[-1]['password'])
+
+
+def test_dry_run_and_all_or_nothing_write_nothing(app, ids, login):
+    client = login('admin')
+    rows = [{'username': 'ana', 'email': 'ana@test'}, {'username': 'luis', 'email': 'admin@test'}]
+
+    response = _bulk(client, rows, dry_run=True)
+    assert [status for _, status, _ in _statuses(response)] == ['valid', 'error']
+
+    response = _bulk(client, rows, all_or_nothing=True)
+    assert [status for _, status, _ in _statuses(response)] == ['skipped', 'error']
+    with app.app_context():
+        assert db.session.query(User.id).filter_by(username='ana').first() is None
+
+
+def test_update_existing(app, ids, login):
+    response = _bulk(login('admin'), [{'username': 'journalist_pa', 'email': 'j_pa@test', 'role': 'designer',
+                                       'country': 'CL', 'is_active': 'no'}], update_existing=True)
+    assert _statuses(response) == [('journalist_pa', 'updated', None)]
+    with app.app_context():
+        user = db.session.get(User, ids['journalist_pa'])
+        assert (user.role, user.country_id, user.is_active) == ('designer', ids['chile'], False)
+
+
+def test_csv_body_and_form_upload(app, ids, login):
+    client = login('admin')
+    csv = 'username,email,role\nana,ana@test,photographer\n'
+    response = client.post('/users/bulk', data=csv, content_type='text/csv')
+    assert response.json['summary'] == {'created': 1}
+
+    response = client.post('/users/bulk', data={'file': (io.BytesIO(b'username,email\nluis,luis@test\n'), 'equipo.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200 and 'luis' in response.get_data(as_text=True)
+    with app.app_context():
+        assert User.query.filter_by(username='ana').one().role == 'photographer'
+        assert User.query.filter_by(username='luis').one().role == 'journalist'
+
+
+def test_only_admins_provision(app, ids, login):
+    assert _bulk(login('coord_pa'), [{'username': 'ana', 'email': 'ana@test'}]).status_code == 403
+
+
+def test_cli_import(app, ids, tmp_path):
+    source = tmp_path / 'equipo.json'
+    source.write_text('[{"username": "ana", "email": "ana@test", "password": "x"}, '
+                      '{"username": "admin", "email": "admin@test"}]')
+    result = app.test_cli_runner().invoke(args=['users-import', str(source)])
+    assert result.exit_code == 0
+    assert 'created: 1, skipped: 1' in result.output
+
+    source.write_text('no es json ni csv')
+    result = app.test_cli_runner().invoke(args=['users-import', str(source)])
+    assert result.exit_code != 0
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Event
+from utils.recurrence import parse_rrule, expand, series_end
+
+HOUR = timedelta(hours=1)
+
+
+def test_daily_expansion_jumps_to_the_window():
+    start = datetime(2024, 1, 1, 9)
+    starts = expand(start, 'FREQ=DAILY', HOUR, datetime(2025, 3, 10), datetime(2025, 3, 13))
+    assert starts == (datetime(2025, 3, 10, 9), datetime(2025, 3, 11, 9), datetime(2025, 3, 12, 9))
+
+
+def test_weekly_byday():
+    start = datetime(2024, 5, 1, 10)  # a Wednesday
+    starts = expand(start, 'FREQ=WEEKLY;BYDAY=MO,WE', HOUR, datetime(2024, 5, 1), datetime(2024, 5, 15))
+    assert [s.day for s in starts] == [1, 6, 8, 13]
+
+
+def test_monthly_skips_short_months():
+    start = datetime(2024, 1, 31, 12)
+    starts = expand(start, 'FREQ=MONTHLY', HOUR, datetime(2024, 1, 1), datetime(2024, 6, 1))
+    assert [s.month for s in starts] == [1, 3, 5]
+
+
+def test_count_and_until_end_the_series():
+    start = datetime(2024, 1, 1, 9)
+    assert len(expand(start, 'FREQ=DAILY;COUNT=3', HOUR, start, start + timedelta(days=30))) == 3
+    assert series_end(start, 'FREQ=DAILY;COUNT=3', HOUR) == datetime(2024, 1, 3, 10)
+
+    starts = expand(start, 'FREQ=WEEKLY;UNTIL=20240115', HOUR, start, start + timedelta(days=60))
+    assert starts[-1] == datetime(2024, 1, 15, 9)
+    assert series_end(start, 'FREQ=DAILY', HOUR) is None
+
+
+def test_occurrence_overlapping_the_window_start_is_included():
+    start = datetime(2024, 1, 1, 23)
+    starts = expand(start, 'FREQ=DAILY', 2 * HOUR, datetime(2024, 1, 3), datetime(2024, 1, 4))
+    assert starts == (datetime(2024, 1, 2, 23), datetime(2024, 1, 3, 23))
+
+
+@pytest.mark.parametrize('rule', ['FREQ=HOURLY', 'FREQ=DAILY;INTERVAL=0', 'FREQ=DAILY;COUNT=2;UNTIL=20240101',
+                                  'FREQ=DAILY;BYDAY=MO', 'FREQ=WEEKLY;BYDAY=XX', 'FREQ'])
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        parse_rrule(rule)
+
+
+def _window(client, start, end):
+    events = client.get(f'/calendar/api/events?start={start.isoformat()}&end={end.isoformat()}').json
+    return [(event['title'], event['start']) for event in events]
+
+
+def test_api_expands_series_and_applies_exceptions(app, ids, login):
+    client = login('coord_pa')
+    response = client.post('/calendar/api/events/create', json={
+        'title': 'Consejo', 'start': '2024-05-06T10:00:00', 'end': '2024-05-06T11:00:00',
+        'rrule': 'FREQ=WEEKLY;COUNT=5',
+    })
+    event_id = response.json['id']
+    with app.app_context():
+        assert db.session.get(Event, event_id).recurrence_end == datetime(2024, 6, 3, 11)
+
+    window = datetime(2024, 5, 1), datetime(2024, 6, 1)
+    assert [start for _, start in _window(client, *window)] == [
+        '2024-05-06T10:00:00', '2024-05-13T10:00:00', '2024-05-20T10:00:00', '2024-05-27T10:00:00']
+
+    # Cancel one occurrence, move another a day later
+    client.post(f'/calendar/api/events/{event_id}/exceptions',
+                json={'recurrence_id': '2024-05-13T10:00:00', 'cancelled': True})
+    client.post(f'/calendar/api/events/{event_id}/exceptions',
+                json={'recurrence_id': '2024-05-27T10:00:00', 'title': 'Consejo (movido)',
+                      'start': '2024-05-28T10:00:00', 'end': '2024-05-28T11:00:00'})
+
+    assert [start for _, start in _window(client, *window)] == [
+        '2024-05-06T10:00:00', '2024-05-20T10:00:00', '2024-05-28T10:00:00']
+    # Found from a window that does not contain its original start
+    assert _window(client, datetime(2024, 5, 28), datetime(2024, 6, 1)) == [('Consejo (movido)', '2024-05-28T10:00:00')]
+
+
+def test_occurrence_moved_past_the_end_of_the_series(app, ids, login):
+    client = login('coord_pa')
+    event_id = client.post('/calendar/api/events/create', json={
+        'title': 'Taller', 'start': '2024-05-06T10:00:00', 'end': '2024-05-06T11:00:00',
+        'rrule': 'FREQ=WEEKLY;COUNT=2',
+    }).json['id']
+    client.post(f'/calendar/api/events/{event_id}/exceptions',
+                json={'recurrence_id': '2024-05-13T10:00:00',
+                      'start': '2024-06-20T10:00:00', 'end': '2024-06-20T12:00:00'})
+
+    with app.app_context():
+        assert db.session.get(Event, event_id).recurrence_end == datetime(2024, 6, 20, 12)
+    assert _window(client, datetime(2024, 6, 1), datetime(2024, 7, 1)) == [('Taller', '2024-06-20T10:00:00')]
+
+
+def test_api_rejects_bad_rules_and_windows(app, ids, login):
+    client = login('coord_pa')
+    response = client.post('/calendar/api/events/create',
+                           json={'title': 'X', 'start': '2024-05-06T10:00:00', 'rrule': 'FREQ=SECONDLY'})
+    assert response.status_code == 400
+    assert client.get('/calendar/api/events?start=2024-06-01T00:00:00&end=2024-05-01T00:00:00').status_code == 400
@@ -0,0 +1,115 @@
+from datetime import date
+
+from models import db, Article, ArticleRevision, Edition
+from utils.revisions import MAX_CHAIN, apply_delta, get_revision, list_revisions, make_delta
+
+TEXT = 'La revista dedica este número a las embajadas de Panamá y a su trabajo cultural. '
+
+
+def test_delta_round_trip():
+    old = TEXT * 3
+    new = old.replace('embajadas', 'misiones diplomáticas', 1) + 'Fin.'
+    delta = make_delta(old, new)
+    assert apply_delta(old, delta) == new
+    # Unchanged runs are stored as lengths, not text
+    assert sum(len(op) for op in delta if isinstance(op, str)) < 40
+
+
+def _article(ids, content=TEXT):
+    edition = Edition(title='Mayo', publication_date=date(2024, 5, 1), country_id=ids['panama'])
+    article = Article(title='Embajadas', content=content, edition=edition, status='draft')
+    db.session.add(article)
+    db.session.commit()
+    return article
+
+
+def _rows(article_id):
+    return ArticleRevision.query.filter_by(article_id=article_id).order_by(ArticleRevision.number).all()
+
+
+def test_every_revision_can_be_rebuilt(app, ids):
+    with app.app_context():
+        article = _article(ids)
+        versions = [TEXT]
+        for n in range(1, 8):
+            article.content = versions[-1] + f'Párrafo {n}. '
+            versions.append(article.content)
+            db.session.commit()
+
+        rows = _rows(article.id)
+        assert [row.number for row in rows] == list(range(1, 9))
+        # Only the first is a full copy; the rest are deltas against it
+        assert [row.number == row.snapshot_number for row in rows] == [True] + [False] * 7
+        for number, text in enumerate(versions, start=1):
+            assert get_revision(article.id, number)['content'] == text
+
+
+def test_snapshot_once_deltas_outgrow_the_text(app, ids):
+    with app.app_context():
+        article = _article(ids, 'corto')
+        article.content = 'un texto completamente distinto y mucho más largo que el anterior'
+        db.session.commit()
+        assert [row.snapshot_number for row in _rows(article.id)] == [1, 2]
+
+
+def test_chains_are_bounded(app, ids):
+    with app.app_context():
+        article = _article(ids, TEXT * 20)
+        for n in range(MAX_CHAIN + 1):
+            article.content = article.content + str(n)
+            db.session.commit()
+        rows = _rows(article.id)
+        assert max(row.number - row.snapshot_number for row in rows) < MAX_CHAIN
+        assert get_revision(article.id, rows[-1].number)['content'] == article.content
+
+
+def test_saves_that_change_nothing_add_no_revision(app, ids):
+    with app.app_context():
+        article = _article(ids)
+        article.status = 'review'
+        db.session.commit()
+        article.content = TEXT
+        db.session.commit()
+        assert len(list_revisions(article.id)) == 1
+
+
+def test_history_diff_and_restore(app, ids, login):
+    with app.app_context():
+        article = _article(ids)
+        article.title = 'Embajadas y consulados'
+        article.content = TEXT + 'Nuevo cierre.'
+        db.session.commit()
+        article_id = article.id
+
+    client = login('coord_pa')
+    assert 'Embajadas y consulados' in client.get(f'/articles/{article_id}/history').get_data(as_text=True)
+    diff = client.get(f'/articles/{article_id}/history/2').get_data(as_text=True)
+    assert 'Nuevo cierre.' in diff
+
+    client.post(f'/articles/{article_id}/history/1/restore')
+    with app.app_context():
+        article = db.session.get(Article, article_id)
+        assert (article.title, article.content) == ('Embajadas', TEXT)
+        # Restoring adds a revision instead of rewinding history
+        assert [r.number for r in list_revisions(article_id)] == [3, 2, 1]
+        assert get_revision(article_id, 3)['content'] == TEXT
+
+
+def test_first_edit_of_a_legacy_article_keeps_the_replaced_text(app, ids):
+    with app.app_context():
+        # Written before revision history existed
+        article_id = db.session.execute(Article.__table__.insert().values(
+            title='Antigua', content=TEXT, status='draft')).inserted_primary_key[0]
+        db.session.commit()
+
+        # Loaded with its text expired, then overwritten without reading it
+        article = db.session.get(Article, article_id)
+        db.session.expire(article, ['title', 'content'])
+        article.content = TEXT + 'Nuevo párrafo.'
+        db.session.commit()
+
+        rows = _rows(article_id)
+        assert [row.number for row in rows] == [1, 2]
+        first = get_revision(article_id, 1)
+        assert (first['title'], first['content']) == ('Antigua', TEXT)
+        assert get_revision(article_id, 2)['content'] == TEXT + 'Nuevo párrafo.'
@@ -0,0 +1,69 @@
+from datetime import date, datetime
+from models import db, Article, Edition, Event
+
+
+def _edition(country_id, title):
+    edition = Edition(title=title, publication_date=date(2024, 5, 1), country_id=country_id, status='planning')
+    db.session.add(edition)
+    db.session.flush()
+    return edition
+
+
+def test_article_takes_its_edition_country(app, ids):
+    with app.app_context():
+        edition = _edition(ids['panama'], 'Mayo')
+        by_id = Article(title='Por id', content='x', edition_id=edition.id)
+        by_relationship = Article(title='Por relación', content='x', edition=edition)
+        db.session.add_all([by_id, by_relationship])
+        db.session.commit()
+        assert by_id.country_id == ids['panama']
+        assert by_relationship.country_id == ids['panama']
+
+
+def test_moving_an_edition_moves_its_articles(app, ids):
+    with app.app_context():
+        edition = _edition(ids['panama'], 'Mayo')
+        db.session.add(Article(title='Nota', content='x', edition=edition))
+        db.session.commit()
+
+        edition.country_id = ids['chile']
+        db.session.commit()
+        db.session.expire_all()
+        assert Article.query.one().country_id == ids['chile']
+
+
+def test_article_listing_is_scoped_to_the_users_country(app, ids, login):
+    with app.app_context():
+        db.session.add(Article(title='Nota de Panamá', content='x', edition=_edition(ids['panama'], 'PA')))
+        db.session.add(Article(title='Nota de Chile', content='x', edition=_edition(ids['chile'], 'CL')))
+        db.session.commit()
+
+    page = login('journalist_pa').get('/articles/').get_data(as_text=True)
+    assert 'Nota de Panamá' in page
+    assert 'Nota de Chile' not in page
+
+    page = login('admin').get('/articles/').get_data(as_text=True)
+    assert 'Nota de Panamá' in page and 'Nota de Chile' in page
+
+
+def test_other_countries_editions_are_not_found(app, ids, login):
+    with app.app_context():
+        chile_id = _edition(ids['chile'], 'Edición de Chile').id
+        db.session.commit()
+
+    client = login('coord_pa')
+    response = client.get(f'/editions/{chile_id}')
+    assert response.status_code == 302
+    assert 'Edición de Chile' not in client.get('/editions/').get_data(as_text=True)
+
+
+def test_calendar_api_is_scoped(app, ids, login):
+    with app.app_context():
+        db.session.add_all([
+            Event(title='Evento PA', start_time=datetime(2024, 5, 2, 10), country_id=ids['panama']),
+            Event(title='Evento CL', start_time=datetime(2024, 5, 2, 10), country_id=ids['chile']),
+        ])
+        db.session.commit()
+
+    events = login('coord_pa').get('/calendar/api/events?start=2024-05-01T00:00:00&end=2024-06-01T00:00:00').json
+    assert [event['title'] for event in events] == ['Evento PA']
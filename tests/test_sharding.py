@@ -0,0 +1,187 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import select
+
+from models import db, ArchivedEdition, Article, AuditLog, Edition, EditionProgress, Event, User
+from utils import sharding
+from utils.sharding import ShardRequired, UnknownShard
+
+
+@pytest.fixture
+def app(app):
+    app.config['SHARD_BY_COUNTRY'] = True
+    sharding.init_app(app)
+    yield app
+    for engine in app.extensions['shard_router'].engines.values():
+        engine.dispose()
+
+
+def _shard_file(app, country_id):
+    return os.path.join(app.config['SHARDS_FOLDER'], f'country_{country_id}.db')
+
+
+def _count(path, table):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def _edition(country_id, title, published=date(2024, 5, 1)):
+    with sharding.use(country_id):
+        edition = Edition(title=title, publication_date=published, country_id=country_id)
+        db.session.add(edition)
+        db.session.flush()
+        db.session.add(Article(title=f'Nota {title}', edition_id=edition.id, status='draft'))
+        db.session.commit()
+        return edition.id
+
+
+def test_per_country_rows_go_to_the_country_database(app, ids):
+    with app.app_context():
+        _edition(ids['panama'], 'Panamá 1')
+        _edition(ids['chile'], 'Chile 1')
+
+        with sharding.use(ids['panama']):
+            assert [e.title for e in Edition.query.all()] == ['Panamá 1']
+            # Rollups are written next to their editions
+            assert db.session.get(EditionProgress, 1).total_articles == 1
+        with pytest.raises(ShardRequired):
+            Edition.query.all()
+
+    main = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    assert _count(main, 'edition') == 0
+    assert _count(_shard_file(app, ids['panama']), 'edition') == 1
+    assert _count(_shard_file(app, ids['chile']), 'article') == 1
+
+
+def test_shards_read_users_from_the_main_database(app, ids):
+    with app.app_context():
+        with sharding.use(ids['panama']):
+            edition_id = _edition(ids['panama'], 'Panamá 1')
+            article = Article.query.filter_by(edition_id=edition_id).one()
+            article.author_id = ids['journalist_pa']
+            db.session.commit()
+            # Routed to the shard by `article`; `user` resolves in the attached main database
+            joined = db.session.execute(
+                select(User.username).join(Article, Article.author_id == User.id)).scalar()
+            assert joined == 'journalist_pa'
+
+
+def test_requests_use_the_users_country(app, ids, login):
+    with app.app_context():
+        _edition(ids['panama'], 'Edición Panamá')
+        _edition(ids['chile'], 'Edición Chile')
+
+    page = login('coord_pa').get('/editions/').get_data(as_text=True)
+    assert 'Edición Panamá' in page and 'Edición Chile' not in page
+
+    admin = login('admin')
+    page = admin.get(f'/editions/1?shard={ids["chile"]}').get_data(as_text=True)
+    assert 'Edición Chile' in page
+    # The picked country sticks for the session
+    assert 'Edición Chile' in admin.get('/editions/1').get_data(as_text=True)
+
+
+def test_admin_listing_fans_out_to_every_country(app, ids, login):
+    with app.app_context():
+        _edition(ids['panama'], 'Primera', date(2024, 1, 1))
+        _edition(ids['chile'], 'Segunda', date(2024, 2, 1))
+        _edition(ids['panama'], 'Tercera', date(2024, 3, 1))
+
+    page = login('admin').get('/editions/').get_data(as_text=True)
+    positions = [page.index(title) for title in ('Tercera', 'Segunda', 'Primera')]
+    assert positions == sorted(positions)
+
+
+def test_admin_calendar_api_fans_out(app, ids, login):
+    with app.app_context():
+        for country_id in (ids['panama'], ids['chile']):
+            with sharding.use(country_id):
+                db.session.add(Event(title=f'Evento {country_id}', start_time=datetime(2024, 5, 10, 9),
+                                     end_time=datetime(2024, 5, 10, 10), country_id=country_id))
+                db.session.commit()
+
+    window = 'start=2024-05-01T00:00:00&end=2024-06-01T00:00:00'
+    assert len(login('admin').get(f'/calendar/api/events?{window}').json) == 2
+    assert [e['title'] for e in login('coord_pa').get(f'/calendar/api/events?{window}').json] == \
+        [f'Evento {ids["panama"]}']
+
+
+def test_editions_cannot_move_between_countries(app, ids, login):
+    with app.app_context():
+        edition_id = _edition(ids['panama'], 'Panamá 1')
+
+    admin = login('admin')
+    admin.get(f'/editions/?shard={ids["panama"]}')
+    admin.post(f'/editions/{edition_id}/edit', data={'title': 'Panamá 1', 'country_id': ids['chile']})
+    with app.app_context(), sharding.use(ids['panama']):
+        assert db.session.get(Edition, edition_id).country_id == ids['panama']
+
+
+def test_split_moves_existing_rows(app, ids):
+    # Rows written before sharding was turned on
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for country_id in (ids['panama'], ids['chile']):
+                edition_id = conn.execute(Edition.__table__.insert().values(
+                    title=f'Vieja {country_id}', country_id=country_id)).inserted_primary_key[0]
+                conn.execute(Article.__table__.insert().values(
+                    title='Nota', edition_id=edition_id, country_id=country_id))
+            conn.execute(ArchivedEdition.__table__.insert().values(id=5, title='Archivada', country_id=ids['panama']))
+
+    result = app.test_cli_runner().invoke(args=['shards', 'split', '--delete'])
+    assert result.exit_code == 0, result.output
+    assert 'article 1' in result.output
+    # Editions land before the articles that reference them
+    assert result.output.index('edition 1') < result.output.index('article 1')
+
+    main = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+    assert _count(main, 'edition') == _count(main, 'article') == 0
+    for country_id in (ids['panama'], ids['chile']):
+        assert _count(_shard_file(app, country_id), 'edition') == 1
+        assert _count(_shard_file(app, country_id), 'article') == 1
+
+    # New rows in a shard start above the copied ids, archived ones included
+    with app.app_context():
+        assert _edition(ids['panama'], 'Nueva') == 6
+
+
+def test_unknown_countries_get_no_database(app, ids, login):
+    admin = login('admin')
+    assert admin.get('/editions/?shard=999').status_code == 404
+    # Falls back to the first country, as for a missing id
+    assert admin.get('/editions/board?country_id=999').status_code == 200
+    assert not os.path.exists(_shard_file(app, 999))
+
+    with app.app_context(), pytest.raises(UnknownShard):
+        app.extensions['shard_router'].engine(999)
+
+
+def test_audit_history_is_per_country(app, ids, login):
+    with app.app_context():
+        for country_id, title in ((ids['panama'], 'Panamá 1'), (ids['chile'], 'Chile 1')):
+            _edition(country_id, title)
+    app.extensions['audit'].close()
+
+    # Both editions have id 1, each in its own database
+    admin = login('admin')
+    for country_id, title in ((ids['panama'], 'Panamá 1'), (ids['chile'], 'Chile 1')):
+        history = admin.get(f'/audit/edition/1?shard={country_id}').json
+        assert [entry['changes']['title'][1] for entry in history] == [title]
+
+
+def test_split_tags_earlier_audit_history(app, ids):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            edition_id = conn.execute(Edition.__table__.insert().values(
+                title='Vieja', country_id=ids['chile'])).inserted_primary_key[0]
+            conn.execute(AuditLog.__table__.insert().values(
+                entity='edition', entity_id=edition_id, action='insert', changes='{}'))
+
+    result = app.test_cli_runner().invoke(args=['shards', 'split'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert db.session.scalars(select(AuditLog.shard_id).filter_by(entity='edition')).all() == [ids['chile']]
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+
+from models import db, User
+from utils.storage import reconcile, remove_stored_file
+
+
+def _file(folder, name, age=7200):
+    os.makedirs(os.path.dirname(os.path.join(folder, name)), exist_ok=True)
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'foto')
+    then = time.time() - age
+    os.utime(path, (then, then))
+    return path
+
+
+def _photos(app, ids):
+    folder = app.config['USERS_FOLDER']
+    with app.app_context():
+        db.session.get(User, ids['coord_pa']).profile_photo = 'coord.jpg'
+        db.session.get(User, ids['journalist_pa']).profile_photo = 'perdida.jpg'
+        db.session.commit()
+    kept = _file(folder, 'coord.jpg')
+    orphan = _file(folder, 'viejo/huerfana.jpg')
+    fresh = _file(folder, 'recien_subida.jpg', age=10)
+    return kept, orphan, fresh
+
+
+def test_reconcile_reports_orphans_and_missing_files(app, ids):
+    kept, orphan, fresh = _photos(app, ids)
+    with app.app_context():
+        findings = list(reconcile('users'))
+
+    assert [(f['kind'], f['path']) for f in findings if f['kind'] == 'orphan'] == [('orphan', orphan)]
+    missing, = [f for f in findings if f['kind'] == 'missing']
+    assert (missing['table'], missing['id']) == ('user', ids['journalist_pa'])
+    assert os.path.exists(orphan)
+
+
+def test_delete_removes_only_old_orphans(app, ids):
+    kept, orphan, fresh = _photos(app, ids)
+    with app.app_context():
+        findings = list(reconcile('users', delete=True))
+
+    assert [f['deleted'] for f in findings if f['kind'] == 'orphan'] == [True]
+    assert not os.path.exists(orphan)
+    assert os.path.exists(kept) and os.path.exists(fresh)
+
+
+def test_cli_json_output(app, ids):
+    _photos(app, ids)
+    result = app.test_cli_runner().invoke(args=['storage-reconcile', '--store', 'users', '--json'])
+    assert result.exit_code == 0
+    kinds = sorted(json.loads(line)['kind'] for line in result.output.splitlines())
+    assert kinds == ['missing', 'orphan']
+
+    result = app.test_cli_runner().invoke(args=['storage-reconcile', '--store', 'nada'])
+    assert result.exit_code != 0
+
+
+def test_remove_stored_file_ignores_missing_files(tmp_path):
+    assert remove_stored_file(str(tmp_path / 'no-existe.jpg')) is True
+    path = tmp_path / 'foto.jpg'
+    path.write_bytes(b'x')
+    assert remove_stored_file(str(path)) is True and not path.exists()
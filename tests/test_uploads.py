@@ -0,0 +1,118 @@
+import os
+import time
+from models import db, User
+from utils.uploads import STALE_UPLOAD_SECONDS, purge_stale_uploads
+
+CHUNK = 'application/offset+octet-stream'
+
+
+def _start(client, size, filename='foto.png'):
+    response = client.post('/uploads/', json={'filename': filename, 'size': size})
+    assert response.status_code == 201
+    return response.json['id']
+
+
+def _patch(client, upload_id, offset, data):
+    return client.patch(f'/uploads/{upload_id}', data=data, content_type=CHUNK,
+                        headers={'Upload-Offset': str(offset)})
+
+
+def test_upload_resumes_from_the_reported_offset(app, login):
+    client = login('admin')
+    upload_id = _start(client, 10)
+
+    response = _patch(client, upload_id, 0, b'01234')
+    assert response.status_code == 204
+    assert response.headers['Upload-Offset'] == '5'
+    # A resumed client asks where to continue from
+    assert client.head(f'/uploads/{upload_id}').headers['Upload-Offset'] == '5'
+
+    assert _patch(client, upload_id, 5, b'56789').headers['Upload-Offset'] == '10'
+    with open(os.path.join(app.config['CHUNKED_UPLOAD_FOLDER'], f'{upload_id}.part'), 'rb') as f:
+        assert f.read() == b'0123456789'
+
+
+def test_chunk_at_the_wrong_offset_is_rejected(app, login):
+    client = login('admin')
+    upload_id = _start(client, 10)
+    _patch(client, upload_id, 0, b'01234')
+
+    assert _patch(client, upload_id, 2, b'23456').status_code == 409
+    assert client.head(f'/uploads/{upload_id}').headers['Upload-Offset'] == '5'
+
+
+def test_chunk_beyond_the_declared_length_is_cut(app, login):
+    client = login('admin')
+    upload_id = _start(client, 4)
+
+    assert _patch(client, upload_id, 0, b'0123456').status_code == 413
+    assert client.head(f'/uploads/{upload_id}').headers['Upload-Offset'] == '4'
+
+
+def test_uploads_belong_to_their_user(app, login):
+    upload_id = _start(login('admin'), 4)
+
+    other = login('coord_pa')
+    assert other.head(f'/uploads/{upload_id}').status_code == 404
+    assert _patch(other, upload_id, 0, b'0123').status_code == 404
+
+
+def test_request_over_the_upload_limit_is_refused(app, login):
+    app.config['CHUNKED_UPLOAD_MAX_LENGTH'] = 8
+    client = login('admin')
+    assert client.post('/uploads/', json={'filename': 'grande.png', 'size': 9}).status_code == 413
+
+    upload_id = _start(client, 8)
+    assert _patch(client, upload_id, 0, b'0123456789').status_code == 413
+
+
+def _create_user(client, upload_id):
+    return client.post('/users/create', data={
+        'username': 'nuevo', 'email': 'nuevo@test', 'password': 'secret', 'role': 'journalist',
+        'profile_photo_upload': upload_id,
+    })
+
+
+def test_form_uses_a_completed_upload(app, login):
+    client = login('admin')
+    upload_id = _start(client, 4)
+    _patch(client, upload_id, 0, b'\x89PNG')
+
+    response = _create_user(client, upload_id)
+    assert response.status_code == 302
+    with app.app_context():
+        photo = User.query.filter_by(username='nuevo').one().profile_photo
+    with open(os.path.join(app.config['USERS_FOLDER'], photo), 'rb') as f:
+        assert f.read() == b'\x89PNG'
+    assert os.listdir(app.config['CHUNKED_UPLOAD_FOLDER']) == []
+
+
+def test_form_with_an_incomplete_upload_is_sent_back(app, login):
+    client = login('admin')
+    upload_id = _start(client, 4)
+    _patch(client, upload_id, 0, b'\x89P')
+
+    response = _create_user(client, upload_id)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/users/create')
+    with client.session_transaction() as session:
+        assert ('message', 'La subida del archivo no se completó.') in session['_flashes']
+    with app.app_context():
+        assert db.session.query(User.id).filter_by(username='nuevo').first() is None
+
+
+def test_purge_keeps_uploads_still_receiving_chunks(app, login):
+    client = login('admin')
+    active, abandoned = _start(client, 10), _start(client, 10)
+    folder = app.config['CHUNKED_UPLOAD_FOLDER']
+    old = time.time() - STALE_UPLOAD_SECONDS - 60
+    for name in os.listdir(folder):
+        os.utime(os.path.join(folder, name), (old, old))
+    # The sidecar is written once; only the .part shows the upload is alive
+    assert _patch(client, active, 0, b'01234').status_code == 204
+
+    with app.app_context():
+        purge_stale_uploads()
+    assert sorted(os.listdir(folder)) == [f'{active}.json', f'{active}.part']
+    assert _patch(client, active, 5, b'56789').headers['Upload-Offset'] == '10'
+    assert client.head(f'/uploads/{abandoned}').status_code == 404
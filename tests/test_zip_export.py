@@ -0,0 +1,68 @@
+import io
+import json
+import zipfile
+from datetime import date
+
+from models import db, Article, ArticleImage, Edition
+from utils.zipstream import stream_zip
+
+
+def test_stream_zip_copies_files_in_blocks(tmp_path):
+    photo = tmp_path / 'portada.jpg'
+    photo.write_bytes(b'\xff\xd8' + b'x' * 200000)
+    chunks = list(stream_zip([('texto.md', '# Título'), ('img/portada.jpg', ('file', str(photo)))]))
+
+    assert len(chunks) > 2
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.read('texto.md').decode() == '# Título'
+    assert archive.read('img/portada.jpg') == photo.read_bytes()
+    # Already-compressed images are stored as they are
+    assert archive.getinfo('img/portada.jpg').compress_type == zipfile.ZIP_STORED
+
+
+def _edition(ids):
+    edition = Edition(title='Mayo 2024', publication_date=date(2024, 5, 1), country_id=ids['panama'])
+    db.session.add(edition)
+    db.session.flush()
+    draft = Article(title='Borrador', content='Aún no', edition_id=edition.id, status='draft')
+    ready = Article(title='Entrevista', content='Texto final', edition_id=edition.id, status='approved',
+                    author_id=ids['journalist_pa'])
+    db.session.add_all([draft, ready])
+    db.session.flush()
+    db.session.add(ArticleImage(article_id=ready.id, filename='uploads/articles/no-existe.jpg'))
+    db.session.commit()
+    return edition.id
+
+
+def _archive(response):
+    assert response.status_code == 200 and response.mimetype == 'application/zip'
+    return zipfile.ZipFile(io.BytesIO(response.get_data()))
+
+
+def test_edition_bundle(app, ids, login):
+    with app.app_context():
+        edition_id = _edition(ids)
+
+    client = login('coord_pa')
+    archive = _archive(client.get(f'/editions/{edition_id}/export.zip'))
+    manifest = json.loads(archive.read('manifest.json'))
+    assert [article['title'] for article in manifest['articles']] == ['Borrador', 'Entrevista']
+
+    entry = manifest['articles'][1]
+    assert entry['author'] == 'journalist_pa'
+    text = archive.read(entry['text']).decode()
+    assert text.startswith('# Entrevista') and 'Texto final' in text
+    # The image row exists but its file doesn't
+    assert entry['images'][0]['missing'] is True
+
+    archive = _archive(client.get(f'/editions/{edition_id}/export.zip?only=ready'))
+    manifest = json.loads(archive.read('manifest.json'))
+    assert [article['title'] for article in manifest['articles']] == ['Entrevista']
+    assert manifest['statuses'] == ['approved', 'layout']
+
+
+def test_other_countries_cannot_export(app, ids, login):
+    with app.app_context():
+        edition_id = _edition(ids)
+    response = login('journalist_cl').get(f'/editions/{edition_id}/export.zip')
+    assert response.status_code == 302
@@ -0,0 +1,270 @@
+import logging
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func, insert, literal, select, update
+from models import (db, Edition, Article, ArticleImage, ArticleRevision, EditionProgress, Event, EventException,
+                    ArchivedEdition, ArchivedArticle, ArchivedArticleImage, ArchivedArticleRevision,
+                    ArchivedEvent, ArchivedEventException)
+from utils import audit, sharding
+from utils.coordination import coordinator, LockUnavailable
+
+# Archive tier: completed editions older than ARCHIVE_EDITIONS_AFTER_MONTHS
+# (with their articles, images and revisions) and events that ended more than
+# ARCHIVE_EVENTS_AFTER_DAYS ago (with their exceptions) are moved into the
+# archived_* tables, so the hot tables every listing scans only hold live
+# work. Rows are copied and deleted with INSERT ... SELECT in batches of
+# ARCHIVE_BATCH_SIZE, one short transaction per batch. Archived editions and
+# events stay readable through the edition and calendar views. Ids are never
+# handed out twice (AUTOINCREMENT on SQLite, see ARCHIVED_IDS in models.py),
+# and a restore refuses rows whose id the hot table holds again anyway.
+
+log = logging.getLogger(__name__)
+
+
+class RestoreConflict(Exception):
+    # Hot rows created since the archive run hold the ids being restored
+    pass
+
+ARCHIVE_OF = {
+    Edition: ArchivedEdition,
+    Article: ArchivedArticle,
+    ArticleImage: ArchivedArticleImage,
+    ArticleRevision: ArchivedArticleRevision,
+    Event: ArchivedEvent,
+    EventException: ArchivedEventException,
+}
+
+
+def _engine():
+    # The current country's database when each has its own (utils.sharding)
+    return db.session.get_bind(mapper=Edition)
+
+
+def _events_before_key():
+    if sharding.enabled():
+        return f'archive:events-before:{sharding.current_shard()}'
+    return 'archive:events-before'
+
+
+def _copy(conn, source, target, predicate, archived_at=None):
+    names = [column.name for column in source.columns]
+    if 'archived_at' in target.columns:
+        columns = [source.c[name] for name in names] + [literal(archived_at)]
+        names = names + ['archived_at']
+    else:
+        columns = [source.c[name] for name in names if name in target.columns]
+        names = [name for name in names if name in target.columns]
+    conn.execute(insert(target).from_select(names, select(*columns).where(predicate)))
+
+
+def _move(conn, model, predicate, now):
+    """Copy the rows of `model` matching predicate into its archive table and delete them."""
+    table = model.__table__
+    _copy(conn, table, ARCHIVE_OF[model].__table__, predicate, now)
+    return conn.execute(delete(table).where(predicate)).rowcount
+
+
+def _restore(conn, model, predicate):
+    table = ARCHIVE_OF[model].__table__
+    _copy(conn, table, model.__table__, predicate)
+    return conn.execute(delete(table).where(predicate)).rowcount
+
+
+def _taken(conn, model, predicate):
+    """Whether an archived row of `model` matching predicate has an id the hot table uses again."""
+    hot, archived = model.__table__, ARCHIVE_OF[model].__table__
+    return conn.execute(
+        select(hot.c.id).where(hot.c.id.in_(select(archived.c.id).where(predicate))).limit(1)
+    ).first() is not None
+
+
+def edition_candidates(cutoff):
+    e = Edition.__table__
+    return (e.c.status == 'completed') & (e.c.publication_date < cutoff)
+
+
+def event_candidates(cutoff):
+    ev = Event.__table__
+    # Single events end at end_time (or start_time); a series at recurrence_end,
+    # which stays NULL (never archived) while it is unbounded
+    ended = case((ev.c.rrule.is_(None), func.coalesce(ev.c.end_time, ev.c.start_time)), else_=ev.c.recurrence_end)
+    return ev.c.deleted_at.is_(None) & (ended < cutoff)
+
+
+def archive_editions(cutoff, batch_size, dry_run=False):
+    e, a = Edition.__table__, Article.__table__
+    total = 0
+    predicate = edition_candidates(cutoff)
+    if dry_run:
+        with _engine().connect() as conn:
+            return conn.execute(select(func.count()).select_from(e).where(predicate)).scalar()
+
+    while True:
+        now = datetime.utcnow()
+        with _engine().begin() as conn:
+            ids = conn.execute(select(e.c.id).where(predicate).order_by(e.c.id).limit(batch_size)).scalars().all()
+            if not ids:
+                return total
+            article_ids = select(a.c.id).where(a.c.edition_id.in_(ids))
+            # Children first: their predicates read the hot article rows
+            _move(conn, ArticleImage, ArticleImage.__table__.c.article_id.in_(article_ids), now)
+            _move(conn, ArticleRevision, ArticleRevision.__table__.c.article_id.in_(article_ids), now)
+            conn.execute(delete(EditionProgress.__table__).where(EditionProgress.__table__.c.edition_id.in_(ids)))
+            _move(conn, Article, a.c.edition_id.in_(ids), now)
+            _move(conn, Edition, e.c.id.in_(ids), now)
+        for edition_id in ids:
+            audit.record('edition', edition_id, 'archive', {})
+        total += len(ids)
+
+
+def archive_events(cutoff, batch_size, dry_run=False):
+    ev, ex = Event.__table__, EventException.__table__
+    total = 0
+    predicate = event_candidates(cutoff)
+    if dry_run:
+        with _engine().connect() as conn:
+            return conn.execute(select(func.count()).select_from(ev).where(predicate)).scalar()
+
+    while True:
+        now = datetime.utcnow()
+        with _engine().begin() as conn:
+            ids = conn.execute(select(ev.c.id).where(predicate).order_by(ev.c.id).limit(batch_size)).scalars().all()
+            if not ids:
+                return total
+            _move(conn, EventException, ex.c.event_id.in_(ids), now)
+            _move(conn, Event, ev.c.id.in_(ids), now)
+        coordinator().delete(_events_before_key())
+        for event_id in ids:
+            audit.record('event', event_id, 'archive', {})
+        total += len(ids)
+
+
+def restore_edition(edition_id):
+    """Move an archived edition back; False when it is not archived, RestoreConflict when its ids are in use."""
+    e, a = ArchivedEdition.__table__, ArchivedArticle.__table__
+    with _engine().begin() as conn:
+        article_ids = select(a.c.id).where(a.c.edition_id == edition_id)
+        rows = {
+            Edition: e.c.id == edition_id,
+            Article: a.c.edition_id == edition_id,
+            ArticleImage: ArchivedArticleImage.__table__.c.article_id.in_(article_ids),
+            ArticleRevision: ArchivedArticleRevision.__table__.c.article_id.in_(article_ids),
+        }
+        for model, predicate in rows.items():
+            if _taken(conn, model, predicate):
+                raise RestoreConflict(f'{model.__table__.name} ids of edition {edition_id} are in use again')
+        if not _restore(conn, Edition, rows[Edition]):
+            return False
+        # Children before the articles their predicates read
+        for model in (ArticleImage, ArticleRevision, Article):
+            _restore(conn, model, rows[model])
+    # The rollup row is rebuilt on the next read (utils.progress)
+    audit.record('edition', edition_id, 'restore', {})
+    return True
+
+
+def restore_event(event_id):
+    """Move an archived event back; False when it is not archived, RestoreConflict when its ids are in use."""
+    ev = Event.__table__
+    rows = {
+        Event: ArchivedEvent.__table__.c.id == event_id,
+        EventException: ArchivedEventException.__table__.c.event_id == event_id,
+    }
+    with _engine().begin() as conn:
+        for model, predicate in rows.items():
+            if _taken(conn, model, predicate):
+                raise RestoreConflict(f'{model.__table__.name} ids of event {event_id} are in use again')
+        if not _restore(conn, Event, rows[Event]):
+            return False
+        _restore(conn, EventException, rows[EventException])
+        # Newer than every client's sync version, so it reappears on their next delta
+        conn.execute(update(ev).where(ev.c.id == event_id).values(updated_at=datetime.utcnow()))
+    coordinator().delete(_events_before_key())
+    audit.record('event', event_id, 'restore', {})
+    return True
+
+
+def _newest_archived_event():
+    ev = ArchivedEvent.__table__
+    ended = func.coalesce(ev.c.recurrence_end, ev.c.end_time, ev.c.start_time)
+    with _engine().connect() as conn:
+        newest = conn.execute(select(func.max(ended))).scalar()
+    return newest.isoformat() if newest else ''
+
+
+def archived_events_before():
+    """End of the newest archived event (None when nothing is archived); the calendar asks the archive for earlier windows."""
+    # Cached: asked on every calendar request, and the max is not indexed
+    value = coordinator().get_or_set(_events_before_key(), _newest_archived_event)
+    return datetime.fromisoformat(value) if value else None
+
+
+def run_archive(edition_months=None, event_days=None, dry_run=False):
+    config = current_app.config
+    edition_months = config['ARCHIVE_EDITIONS_AFTER_MONTHS'] if edition_months is None else edition_months
+    event_days = config['ARCHIVE_EVENTS_AFTER_DAYS'] if event_days is None else event_days
+    batch_size = config['ARCHIVE_BATCH_SIZE']
+    today = datetime.utcnow()
+    # Months approximated as 30 days; the cutoff only needs to be roughly right
+    edition_cutoff = (today - timedelta(days=30 * edition_months)).date()
+    event_cutoff = today - timedelta(days=event_days)
+    editions = events = 0
+    for _ in sharding.each_shard():
+        editions += archive_editions(edition_cutoff, batch_size, dry_run)
+        events += archive_events(event_cutoff, batch_size, dry_run)
+    return editions, events
+
+
+def _scheduled_archive():
+    with coordinator().lock('archive'):
+        editions, events = run_archive()
+    if editions or events:
+        log.info('Archived %d editions and %d events', editions, events)
+
+
+@click.group('archive')
+def archive_cli():
+    """Move completed editions and past events to the archive tables."""
+
+
+@archive_cli.command('run')
+@click.option('--months', type=int, help='Archive completed editions published more than this many months ago.')
+@click.option('--event-days', type=int, help='Archive events that ended more than this many days ago.')
+@click.option('--dry-run', is_flag=True, help='Only count what would be archived.')
+@with_appcontext
+def run_command(months, event_days, dry_run):
+    try:
+        with coordinator().lock('archive'):
+            editions, events = run_archive(months, event_days, dry_run)
+    except LockUnavailable:
+        raise click.ClickException('Another archive run is in progress.')
+    verb = 'Would archive' if dry_run else 'Archived'
+    click.echo(f'{verb} {editions} editions and {events} events.')
+
+
+@archive_cli.command('restore')
+@click.option('--edition', 'edition_id', type=int, help='Edition id to move back to the hot tables.')
+@click.option('--event', 'event_id', type=int, help='Event id to move back to the hot tables.')
+@click.option('--country', 'country_id', type=int, help="The row's country, when each has its own database.")
+@with_appcontext
+def restore_command(edition_id, event_id, country_id):
+    if not edition_id and not event_id:
+        raise click.UsageError('Pass --edition or --event.')
+    if sharding.enabled() and not country_id:
+        raise click.UsageError('Pass --country: ids are per country with SHARD_BY_COUNTRY.')
+    with sharding.use(country_id):
+        try:
+            if edition_id:
+                click.echo(f'Edition {edition_id}: ' + ('restored' if restore_edition(edition_id) else 'not in the archive'))
+            if event_id:
+                click.echo(f'Event {event_id}: ' + ('restored' if restore_event(event_id) else 'not in the archive'))
+        except RestoreConflict as e:
+            raise click.ClickException(f'Not restored: {e}.')
+
+
+def init_app(app):
+    app.cli.add_command(archive_cli)
+    if app.config['ARCHIVE_INTERVAL']:
+        app.extensions['coordination'].periodic('archive', app.config['ARCHIVE_INTERVAL'], _scheduled_archive)
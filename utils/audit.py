@@ -0,0 +1,206 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, date
+from flask import current_app, g, has_request_context
+from sqlalchemy import event, insert, inspect
+from models import db, AuditLog, EditionProgress, ArticleRevision, ManualDownloadStat
+from utils import sharding
+
+# Change-data-capture for every model. Changed columns are collected per
+# flush, handed to a bounded queue when the transaction commits, and written
+# in batches by a background thread, so request handlers never wait on the
+# audit table (or JSONL segment) themselves. When the queue is full the
+# request appends the overflow to the day's JSONL segment (the database sink
+# counts those as `dropped`, reported by /audit in X-Audit-Dropped).
+
+log = logging.getLogger(__name__)
+
+NOT_AUDITED = {AuditLog, EditionProgress, ArticleRevision, ManualDownloadStat}
+REDACTED_COLUMNS = {'password_hash'}
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _acting_user_id():
+    if not has_request_context():
+        return None
+    user = g.get('_login_user')
+    if user is None or not user.is_authenticated:
+        return None
+    return user.id
+
+
+def shard_of(entity):
+    """The country whose database holds `entity` rows, or None for main-database tables."""
+    if not sharding.enabled() or db.metadata.tables.get(entity) not in sharding.SHARDED_TABLES:
+        return None
+    return sharding.current_shard()
+
+
+def _column_changes(obj, action):
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        history = state.attrs[key].history
+        if action == 'update' and not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else (history.unchanged[0] if history.unchanged else None)
+        new = history.added[0] if history.added else (history.unchanged[0] if history.unchanged else None)
+        if action == 'insert':
+            old = None
+        elif action == 'delete':
+            new = None
+        if key in REDACTED_COLUMNS:
+            old, new = ('***' if old else None), ('***' if new else None)
+        changes[key] = [_json_value(old), _json_value(new)]
+    return changes
+
+
+def _entries(session):
+    user_id = _acting_user_id()
+    now = datetime.utcnow()
+    for action, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if type(obj) in NOT_AUDITED:
+                continue
+            if action == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            changes = _column_changes(obj, action)
+            if action == 'update' and not changes:
+                continue
+            yield {
+                'entity': obj.__table__.name,
+                'entity_id': inspect(obj).mapper.primary_key_from_instance(obj)[0],
+                'action': action,
+                'changes': json.dumps(changes),
+                'user_id': user_id,
+                'shard_id': shard_of(obj.__table__.name),
+                'timestamp': now,
+            }
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flush_context):
+    session.info.setdefault('audit_pending', []).extend(_entries(session))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _enqueue_changes(session):
+    pending = session.info.pop('audit_pending', None)
+    if pending:
+        current_app.extensions['audit'].enqueue(pending)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('audit_pending', None)
+
+
+def record(entity, entity_id, action, changes, user_id=None):
+    """Audit a write that bypassed the ORM session (e.g. the async API)."""
+    current_app.extensions['audit'].enqueue([{
+        'entity': entity,
+        'entity_id': entity_id,
+        'action': action,
+        'changes': json.dumps({k: [None, _json_value(v)] for k, v in changes.items()}),
+        'user_id': user_id,
+        'shard_id': shard_of(entity),
+        'timestamp': datetime.utcnow(),
+    }])
+
+
+class AuditWriter:
+    def __init__(self, app):
+        self.app = app
+        self.sink = app.config['AUDIT_SINK']
+        self.folder = app.config['AUDIT_FOLDER']
+        self.batch_size = app.config['AUDIT_BATCH_SIZE']
+        self.queue = queue.Queue(maxsize=app.config['AUDIT_QUEUE_SIZE'])
+        self.dropped = 0 # Entries that missed the sink: spilled to a JSONL segment, or lost
+        self.lock = threading.Lock()
+        self.segment_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, entries):
+        # Runs inside after_commit: never wait for the writer. What does not fit
+        # is appended to the day's JSONL segment here instead
+        overflow = []
+        for entry in entries:
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                overflow.append(entry)
+        if not overflow:
+            return
+        try:
+            self._append_segment(overflow)
+        except OSError:
+            log.exception('Audit queue full and the segment is not writable, lost %d entries', len(overflow))
+        else:
+            if self.sink == 'jsonl':
+                return
+            log.error('Audit queue full, wrote %d entries to %s instead of the database', len(overflow), self.folder)
+        with self.lock:
+            self.dropped += len(overflow)
+
+    def close(self, timeout=5):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            batch = [] if entry is None else [entry]
+            stop = entry is None
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    entry = self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    log.exception('Failed to write %d audit entries', len(batch))
+            if stop:
+                return
+
+    def _append_segment(self, batch):
+        os.makedirs(self.folder, exist_ok=True)
+        segment = os.path.join(self.folder, f"audit-{datetime.utcnow():%Y%m%d}.jsonl")
+        lines = ''.join(json.dumps(dict(entry, timestamp=entry['timestamp'].isoformat())) + '\n' for entry in batch)
+        # The writer thread and overflowing requests append to the same file
+        with self.segment_lock, open(segment, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def _write(self, batch):
+        if self.sink == 'jsonl':
+            self._append_segment(batch)
+            return
+
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(insert(AuditLog.__table__), batch)
+
+
+def init_app(app):
+    app.extensions['audit'] = AuditWriter(app)
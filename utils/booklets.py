@@ -0,0 +1,165 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import render_template
+from sqlalchemy import event
+from models import db, Embassy, EmbassyList
+
+# Printable embassy directories. A booklet (one EmbassyList or every list of
+# a country) is rendered in a background thread to a self-contained HTML file
+# with downscaled, inlined photos, or to PDF when WeasyPrint is installed.
+# Files are cached under a version derived from the lists' updated_at, which
+# changes whenever a member is added, edited or removed, so a booklet is only
+# re-rendered after its contents change.
+
+log = logging.getLogger(__name__)
+
+FORMATS = ('html', 'pdf')
+PHOTO_SIZE = 240
+CARDS_PER_PAGE = 8
+# Seconds to wait for a build of the same booklet running in another worker
+BUILD_WAIT = 600
+
+try:
+    from weasyprint import HTML as WeasyHTML
+except ImportError:  # PDF export is optional
+    WeasyHTML = None
+
+
+def available_formats():
+    return FORMATS if WeasyHTML is not None else ('html',)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _touch_lists(session, flush_context, instances):
+    # Member changes make the list's cached booklets stale
+    now = datetime.utcnow()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Embassy):
+            continue
+        embassy_list = obj.list or (obj.list_id and session.get(EmbassyList, obj.list_id))
+        if embassy_list is not None:
+            embassy_list.updated_at = now
+
+
+def booklet_version(lists):
+    digest = hashlib.sha1()
+    for embassy_list in sorted(lists, key=lambda l: l.id):
+        stamp = embassy_list.updated_at or embassy_list.created_at
+        digest.update(f'{embassy_list.id}:{stamp.isoformat() if stamp else ""};'.encode())
+    return digest.hexdigest()[:16]
+
+
+def _photo_data_uri(folder, filename):
+    from PIL import Image
+    try:
+        with Image.open(os.path.join(folder, filename)) as img:
+            img = img.convert('RGB')
+            img.thumbnail((PHOTO_SIZE, PHOTO_SIZE))
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=75)
+    except (OSError, ValueError):
+        return None
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def _pages(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class BookletBuilder:
+    def __init__(self, app):
+        self.app = app
+        self.folder = app.config['EXPORTS_FOLDER']
+        self.executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'], thread_name_prefix='booklet')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def path(self, scope, version, fmt):
+        return os.path.join(self.folder, f'{scope}-{version}.{fmt}')
+
+    def status(self, scope, version, fmt):
+        """'ready', 'pending', 'failed' or None (never requested)."""
+        if os.path.exists(self.path(scope, version, fmt)):
+            return 'ready'
+        with self.lock:
+            future = self.jobs.get((scope, version, fmt))
+        if future is None:
+            return None
+        if not future.done():
+            return 'pending'
+        return 'failed' if future.exception() else 'ready'
+
+    def request(self, scope, version, fmt, title, list_ids):
+        key = (scope, version, fmt)
+        with self.lock:
+            future = self.jobs.get(key)
+            if future is None or (future.done() and future.exception()):
+                self.jobs[key] = self.executor.submit(self._build, scope, version, fmt, title, list_ids)
+
+    def _build(self, scope, version, fmt, title, list_ids):
+        # Another worker may already be rendering the same booklet; wait for it
+        # instead of rendering it twice
+        target = self.path(scope, version, fmt)
+        with self.app.extensions['coordination'].lock(f'booklet:{scope}-{version}.{fmt}', wait=BUILD_WAIT):
+            if os.path.exists(target):
+                return target
+            return self._write(scope, fmt, target, title, list_ids)
+
+    def _write(self, scope, fmt, target, title, list_ids):
+        with self.app.app_context():
+            try:
+                html = self._render(title, list_ids)
+            finally:
+                db.session.remove()
+
+        os.makedirs(self.folder, exist_ok=True)
+        tmp = f'{target}.{threading.get_ident()}.tmp'
+        if fmt == 'pdf':
+            WeasyHTML(string=html).write_pdf(tmp)
+        else:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(html)
+        os.replace(tmp, target)
+
+        # Older versions of the same booklet are no longer reachable
+        prefix = f'{scope}-'
+        for name in os.listdir(self.folder):
+            if name.startswith(prefix) and name.endswith(f'.{fmt}') and name != os.path.basename(target):
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except OSError:
+                    pass
+        return target
+
+    def _render(self, title, list_ids):
+        photos_folder = self.app.config['EMBASSIES_FOLDER']
+        lists = (EmbassyList.query.filter(EmbassyList.id.in_(list_ids))
+                 .order_by(EmbassyList.name).all())
+        members = Embassy.query.filter(Embassy.list_id.in_(list_ids)).order_by(Embassy.name).all()
+        by_list = {}
+        for member in members:
+            by_list.setdefault(member.list_id, []).append({
+                'name': member.name,
+                'ambassador_name': member.ambassador_name,
+                'phone': member.phone,
+                'email': member.email,
+                'instagram': member.instagram,
+                'photo': _photo_data_uri(photos_folder, member.photo_filename) if member.photo_filename else None,
+            })
+        sections = [{
+            'name': embassy_list.name,
+            'country': embassy_list.country.name,
+            'pages': _pages(by_list.get(embassy_list.id, []), CARDS_PER_PAGE),
+        } for embassy_list in lists]
+        return render_template('embassies/booklet.html', title=title, sections=sections,
+                               generated_at=datetime.utcnow())
+
+
+def init_app(app):
+    app.extensions['booklets'] = BookletBuilder(app)
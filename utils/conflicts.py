@@ -0,0 +1,258 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from sqlalchemy import func, or_, select, union_all
+from models import db, Event, EventException
+from utils.coordination import coordinator
+from utils.recurrence import expand, exception_filter, occurrences
+
+# Double-booking checks and free/busy for the calendar. A single event of at
+# most LONG_EVENT can only overlap [start, end) if it starts in
+# [start - LONG_EVENT, end), so each probe is a bounded range scan of
+# ix_event_country_start (of ix_event_country_location_start for one
+# location's free/busy), however large the event table grows. The few longer
+# events (multi-day fairs, trips) would stretch that range for everyone; their
+# ids are kept per country in the shared cache instead and fetched by primary
+# key next to the range. Recurring series are few per country; the ones still
+# running in the window are expanded there (utils.recurrence), exceptions
+# included.
+#
+# A new series is checked with one probe over all of its windows up to
+# SERIES_HORIZON, intersected with each occurrence in Python.
+#
+# A clash in the same location blocks a new event unless the caller forces
+# it; other events of the country at the same time are reported as overlaps.
+# Events without an end only clash with events covering their start time.
+# Statements are plain Core so the async API (asgi.py) runs the same ones.
+
+# How far ahead the occurrences of a new unbounded series are checked
+SERIES_HORIZON = timedelta(days=365)
+
+# Single events longer than this are looked up by id rather than by the start_time range
+LONG_EVENT = timedelta(days=1)
+
+# Bounds the staleness of the cached long event ids when events are written
+# around the session (shards split, archive restore)
+LONG_EVENTS_TTL = 24 * 3600
+
+
+def _country(table, country_id):
+    return table.c.country_id.is_(None) if country_id is None else table.c.country_id == country_id
+
+
+def _long_events_key(country_id):
+    return f'conflicts:long:{country_id}'
+
+
+def _duration_seconds(table, dialect):
+    if dialect == 'postgresql':
+        return func.extract('epoch', table.c.end_time - table.c.start_time)
+    return (func.julianday(table.c.end_time) - func.julianday(table.c.start_time)) * 86400
+
+
+def long_events_statement(country_id, dialect):
+    ev = Event.__table__
+    where = (_country(ev, country_id), ev.c.rrule.is_(None), ev.c.deleted_at.is_(None), ev.c.end_time.isnot(None))
+    if dialect in ('postgresql', 'sqlite'):
+        return select(ev.c.id).where(*where, _duration_seconds(ev, dialect) > LONG_EVENT.total_seconds())
+    # Elsewhere the durations are compared in Python
+    return select(ev.c.id, ev.c.start_time, ev.c.end_time).where(*where)
+
+
+def long_events_from(result, dialect):
+    if dialect in ('postgresql', 'sqlite'):
+        return sorted(result.scalars())
+    return sorted(event_id for event_id, start, end in result if end - start > LONG_EVENT)
+
+
+def long_events(country_id):
+    """Ids of the country's single events longer than LONG_EVENT (one scan, then cached)."""
+    def compute():
+        dialect = db.session.get_bind(mapper=Event).dialect.name
+        return long_events_from(db.session.execute(long_events_statement(country_id, dialect)), dialect)
+    return coordinator().get_or_set(_long_events_key(country_id), compute, LONG_EVENTS_TTL)
+
+
+def note_event(country_id, event_id, start_time, end_time, rrule=None):
+    """Add a newly created long event to the cached ids."""
+    if rrule or not end_time or end_time - start_time <= LONG_EVENT:
+        return
+    cached = coordinator().get(_long_events_key(country_id))
+    if cached is not None and event_id not in cached:
+        coordinator().set(_long_events_key(country_id), sorted(cached + [event_id]), LONG_EVENTS_TTL)
+
+
+def single_statement(country_id, start, end, long_ids=(), location=None, exclude_id=None):
+    """Single events that may overlap [start, end]: a bounded range of start_time, plus the long ones by id."""
+    ev = Event.__table__
+
+    def rows(*where):
+        stmt = select(ev.c.id, ev.c.title, ev.c.start_time, ev.c.end_time, ev.c.location).where(
+            _country(ev, country_id), ev.c.rrule.is_(None), ev.c.deleted_at.is_(None), *where)
+        if location:
+            stmt = stmt.where(ev.c.location == location)
+        if exclude_id is not None:
+            stmt = stmt.where(ev.c.id != exclude_id)
+        return stmt
+
+    stmt = rows(ev.c.start_time >= start - LONG_EVENT, ev.c.start_time <= end)
+    if long_ids:
+        # Only the ones the range above does not already return
+        stmt = union_all(stmt, rows(ev.c.id.in_(long_ids), ev.c.start_time < start - LONG_EVENT,
+                                    ev.c.end_time >= start))
+    return stmt
+
+
+def series_statement(country_id, start, end, exclude_id=None):
+    # Not filtered by location: an exception can move an occurrence elsewhere
+    ev = Event.__table__
+    stmt = select(ev.c.id, ev.c.title, ev.c.description, ev.c.start_time, ev.c.end_time, ev.c.location,
+                  ev.c.rrule).where(
+        _country(ev, country_id),
+        ev.c.rrule.isnot(None),
+        ev.c.deleted_at.is_(None),
+        ev.c.start_time <= end,
+        or_(ev.c.recurrence_end.is_(None), ev.c.recurrence_end >= start),
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(ev.c.id != exclude_id)
+    return stmt
+
+
+def exceptions_statement(series_ids, start, end):
+    ex = EventException.__table__
+    return select(ex).where(exception_filter(series_ids, start, end, ex.c))
+
+
+def overlaps(start, end, other_start, other_end):
+    end = end or start
+    other_end = other_end or other_start
+    return start == other_start or (start < other_end and other_start < end)
+
+
+def booked(singles, series, exceptions, start, end):
+    """(id, title, start, end, location) of every occurrence in the window, from the rows above."""
+    for row in singles:
+        yield row.id, row.title, row.start_time, row.end_time, row.location or ''
+    for event, occurrence_start, occurrence_end, override in occurrences(series, exceptions, start,
+                                                                         window_end(start, end)):
+        location = (override is not None and override.location) or event.location or ''
+        title = (override is not None and override.title) or event.title
+        yield event.id, title, occurrence_start, occurrence_end, location
+
+
+def clashes(booked_rows, start, end, location=None):
+    """(same location, elsewhere in the country) lists of occurrences overlapping [start, end)."""
+    same, other = [], []
+    for event_id, title, other_start, other_end, other_location in booked_rows:
+        if not overlaps(start, end, other_start, other_end):
+            continue
+        item = {
+            'id': event_id,
+            'title': title,
+            'start': other_start.isoformat(),
+            'end': other_end.isoformat() if other_end else None,
+            'location': other_location,
+        }
+        (same if location and other_location == location else other).append(item)
+    return same, other
+
+
+def window_end(start, end):
+    # Expansion windows must not be empty for a point in time
+    return max(end, start + timedelta(microseconds=1))
+
+
+def _booked(country_id, start, end, location=None, exclude_id=None):
+    singles = db.session.execute(
+        single_statement(country_id, start, end, long_events(country_id), location, exclude_id)).all()
+    series = db.session.execute(series_statement(country_id, start, end, exclude_id)).all()
+    exceptions = []
+    if series:
+        exceptions = db.session.execute(
+            exceptions_statement([row.id for row in series], start, window_end(start, end))).all()
+    return booked(singles, series, exceptions, start, end)
+
+
+def find_conflicts(country_id, start, end, location=None, exclude_id=None):
+    """Occurrences overlapping [start, end): (in `location`, elsewhere in the country)."""
+    end = end or start
+    # The whole country's probe: other locations come back as overlaps
+    return clashes(_booked(country_id, start, end, None, exclude_id), start, end, location)
+
+
+def windows(start_time, end_time, rrule=None):
+    """[(start, end)] a new event will occupy: each occurrence within SERIES_HORIZON for a series."""
+    end_time = end_time or start_time
+    if not rrule:
+        return [(start_time, end_time)]
+    duration = end_time - start_time
+    return [(start, start + duration)
+            for start in expand(start_time, rrule, duration, start_time, start_time + SERIES_HORIZON)]
+
+
+def span(spans):
+    """(first start, last end) covering every window from windows()."""
+    return spans[0][0], max(end for _, end in spans)
+
+
+def clashes_per_window(booked_rows, spans, location=None):
+    """clashes() summed over every window, against rows booked once for their whole span()."""
+    short, long = [], []
+    for row in booked_rows:
+        _, _, row_start, row_end, _ = row
+        (long if row_end is not None and row_end - row_start > LONG_EVENT else short).append(row)
+    short.sort(key=lambda row: row[2])
+    starts = [row[2] for row in short]
+
+    same, other = [], []
+    for start, end in spans:
+        # Short rows overlapping [start, end] start in [start - LONG_EVENT, end]
+        nearby = short[bisect_left(starts, start - LONG_EVENT):bisect_right(starts, end)]
+        here, elsewhere = clashes(nearby + long, start, end, location)
+        same += here
+        other += elsewhere
+    return same, other
+
+
+def event_conflicts(country_id, start_time, end_time, rrule=None, location=None, exclude_id=None):
+    """find_conflicts() over every window of a new event (see windows()), from a single probe."""
+    spans = windows(start_time, end_time, rrule)
+    if not spans:
+        return [], []
+    first, last = span(spans)
+    return clashes_per_window(_booked(country_id, first, last, None, exclude_id), spans, location)
+
+
+def free_busy(country_id, start, end, location=None):
+    """{location: [(start, end)]} merged busy intervals clipped to the window."""
+    # Series are expanded without location; single events use the location index
+    intervals = {}
+    for _, _, busy_start, busy_end, busy_location in _booked(country_id, start, end, location or None):
+        if busy_end is None or busy_end <= start or busy_start >= end:
+            continue
+        if location and busy_location != location:
+            continue
+        intervals.setdefault(busy_location, []).append((max(busy_start, start), min(busy_end, end)))
+    return {name: merge(spans) for name, spans in intervals.items()}
+
+
+def merge(spans):
+    merged = []
+    for span_start, span_end in sorted(spans):
+        if merged and span_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], span_end))
+        else:
+            merged.append((span_start, span_end))
+    return merged
+
+
+def free(busy, start, end):
+    """Gaps of [start, end) between the merged `busy` intervals."""
+    gaps, cursor = [], start
+    for busy_start, busy_end in busy:
+        if busy_start > cursor:
+            gaps.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
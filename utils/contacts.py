@@ -0,0 +1,278 @@
+import hashlib
+import re
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event, func, or_, select, update
+from models import db, Country, Embassy, EmbassyList
+
+# Embassy contact details are normalized when they are written: phones to
+# E.164 (using the list's country for numbers typed without a prefix),
+# emails lowercased, Instagram accounts to '@handle'. Values that cannot be
+# normalized are kept as typed. Each normalized value also gets a short hash
+# in phone_key / email_key / instagram_key (indexed), which is how the same
+# contact is found across every EmbassyList without comparing free text.
+#
+# `flask contacts normalize` brings existing rows up to date and
+# `flask contacts duplicates` lists the groups of members sharing a key; both
+# walk the table in keyset chunks of CONTACTS_BATCH_SIZE, so memory stays flat.
+# Duplicates are reported (also at /embassies/duplicates), never merged
+# automatically: the same person can belong in several lists.
+
+try:
+    import phonenumbers
+except ImportError:  # optional: full per-region validation
+    phonenumbers = None
+
+# Country calling codes used without phonenumbers, by Country.code
+CALLING_CODES = {
+    'AR': '54', 'BO': '591', 'BR': '55', 'CL': '56', 'CO': '57', 'CR': '506', 'CU': '53', 'DO': '1',
+    'EC': '593', 'ES': '34', 'GT': '502', 'HN': '504', 'IT': '39', 'MX': '52', 'NI': '505', 'PA': '507',
+    'PE': '51', 'PR': '1', 'PY': '595', 'SV': '503', 'US': '1', 'UY': '598', 'VE': '58',
+}
+
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[a-z]{2,}$')
+HANDLE_RE = re.compile(r'^[a-z0-9._]{1,30}$')
+INSTAGRAM_URL_RE = re.compile(r'^(?:https?://)?(?:www\.)?(?:instagram\.com|instagr\.am)/([^/?#]+)', re.I)
+
+KEY_COLUMNS = {'phone': 'phone_key', 'email': 'email_key', 'instagram': 'instagram_key'}
+
+
+def normalize_phone(raw, region=None):
+    """E.164 ('+50760001234'), or None when the number is not recognizable."""
+    raw = (raw or '').strip()
+    if not raw:
+        return None
+    if phonenumbers is not None:
+        try:
+            number = phonenumbers.parse(raw, (region or '').upper() or None)
+        except phonenumbers.NumberParseException:
+            return None
+        if not phonenumbers.is_possible_number(number):
+            return None
+        return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+    # Extensions and notes ("ext. 12", "(oficina)") are not part of the number
+    digits = re.sub(r'\D', '', re.split(r'[a-zA-Z]', raw, maxsplit=1)[0])
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        code = CALLING_CODES.get((region or '').upper())
+        if code is None:
+            return None
+        if not (digits.startswith(code) and len(digits) >= 10):
+            digits = code + digits.lstrip('0')
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def normalize_email(raw):
+    value = (raw or '').strip().lower()
+    if value.startswith('mailto:'):
+        value = value[len('mailto:'):]
+    return value if EMAIL_RE.match(value) else None
+
+
+def normalize_instagram(raw):
+    """'@handle' from a handle or a profile URL, or None."""
+    value = (raw or '').strip()
+    match = INSTAGRAM_URL_RE.match(value)
+    if match:
+        value = match.group(1)
+    value = value.lstrip('@').lower()
+    return '@' + value if HANDLE_RE.match(value) else None
+
+
+def contact_key(kind, value):
+    return hashlib.sha1(f'{kind}:{value}'.encode()).hexdigest()[:16] if value else None
+
+
+def normalized(phone, email, instagram, region=None):
+    """(column values, problems): display values and keys for one member."""
+    clean = {
+        'phone': normalize_phone(phone, region),
+        'email': normalize_email(email),
+        'instagram': normalize_instagram(instagram),
+    }
+    typed = {'phone': phone, 'email': email, 'instagram': instagram}
+    values, problems = {}, []
+    for kind, value in clean.items():
+        raw = (typed[kind] or '').strip()
+        if raw and value is None:
+            problems.append(kind)
+        values[kind] = value or raw or None
+        values[KEY_COLUMNS[kind]] = contact_key(kind, value)
+    return values, problems
+
+
+def _list_region(connection, list_id):
+    # Plain Core on the flush connection: no autoflush and no scoping criteria
+    lists, countries = EmbassyList.__table__, Country.__table__
+    return connection.execute(
+        select(countries.c.code).select_from(lists.join(countries, countries.c.id == lists.c.country_id))
+        .where(lists.c.id == int(list_id))
+    ).scalar()
+
+
+@event.listens_for(db.session, 'before_flush')
+def _normalize_members(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Embassy):
+            continue
+        state = db.inspect(obj)
+        if obj in session.dirty and not any(state.attrs[name].history.has_changes()
+                                            for name in ('phone', 'email', 'instagram', 'list_id')):
+            continue
+        region = _list_region(session.connection(bind_arguments={'mapper': EmbassyList}), obj.list_id)
+        values, problems = normalized(obj.phone, obj.email, obj.instagram, region)
+        for name, value in values.items():
+            if getattr(obj, name) != value:
+                setattr(obj, name, value)
+        # Read back by the member forms to warn about what was kept as typed
+        session.info.setdefault('contact_problems', {})[obj] = problems
+
+
+def problems_for(member):
+    """Fields of `member` that were kept as typed in the last flush."""
+    return db.session.info.get('contact_problems', {}).pop(member, [])
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_problems(session):
+    session.info.pop('contact_problems', None)
+
+
+def duplicates_of(member):
+    """Other members sharing a phone, email or Instagram key with `member`."""
+    keys = [(getattr(Embassy, column), getattr(member, column))
+            for column in KEY_COLUMNS.values() if getattr(member, column)]
+    if not keys:
+        return []
+    return Embassy.query.filter(Embassy.id != member.id, or_(*(column == key for column, key in keys))) \
+        .order_by(Embassy.name).all()
+
+
+def _chunks(query, batch_size):
+    """Keyset pages of a Core select over the embassy table, in id order."""
+    table = Embassy.__table__
+    last_id = 0
+    while True:
+        rows = db.session.execute(query.where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def normalize_all(batch_size, dry_run=False):
+    """Normalize every member; returns (members changed, fields kept as typed)."""
+    table, lists = Embassy.__table__, EmbassyList.__table__
+    regions = dict(db.session.execute(
+        select(lists.c.id, Country.__table__.c.code).join(Country.__table__, Country.__table__.c.id == lists.c.country_id)
+    ).all())
+    columns = ['phone', 'email', 'instagram', *KEY_COLUMNS.values()]
+    changed = unparsed = 0
+    query = select(table.c.id, table.c.list_id, *(table.c[name] for name in columns))
+    for rows in _chunks(query, batch_size):
+        updates, touched_lists = [], set()
+        for row in rows:
+            values, problems = normalized(row.phone, row.email, row.instagram, regions.get(row.list_id))
+            unparsed += len(problems)
+            if any(getattr(row, name) != values[name] for name in columns):
+                updates.append(dict(values, member_id=row.id))
+                touched_lists.add(row.list_id)
+        changed += len(updates)
+        if updates and not dry_run:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('member_id'))
+                .values({name: bindparam(f'new_{name}') for name in columns}),
+                [{'member_id': row['member_id'], **{f'new_{name}': row[name] for name in columns}} for row in updates])
+            # Core updates skip the booklet listener; cached booklets show the old text
+            db.session.execute(update(lists).where(lists.c.id.in_(touched_lists)).values(updated_at=datetime.utcnow()))
+            db.session.commit()
+        db.session.expunge_all()
+    return changed, unparsed
+
+
+def duplicate_groups(batch_size=None):
+    """[[members]] sharing any contact key (transitively), largest first."""
+    batch_size = batch_size or current_app.config['CONTACTS_BATCH_SIZE']
+    table = Embassy.__table__
+    shared = {}
+    for column in KEY_COLUMNS.values():
+        # Only keys held by more than one member; served by the key indexes
+        keys = db.session.execute(
+            select(table.c[column]).where(table.c[column].isnot(None))
+            .group_by(table.c[column]).having(func.count() > 1)
+        ).scalars().all()
+        if keys:
+            shared[column] = keys
+
+    # Union-find over the members holding a shared key
+    parent = {}
+
+    def find(member_id):
+        while parent.setdefault(member_id, member_id) != member_id:
+            parent[member_id] = parent[parent[member_id]]
+            member_id = parent[member_id]
+        return member_id
+
+    for column, keys in shared.items():
+        for start in range(0, len(keys), batch_size):
+            first_by_key = {}
+            rows = db.session.execute(
+                select(table.c.id, table.c[column]).where(table.c[column].in_(keys[start:start + batch_size]))
+            ).all()
+            for member_id, key in rows:
+                if key in first_by_key:
+                    parent[find(member_id)] = find(first_by_key[key])
+                else:
+                    first_by_key[key] = member_id
+                    find(member_id)
+
+    groups = {}
+    for member_id in parent:
+        groups.setdefault(find(member_id), []).append(member_id)
+    members = {}
+    ids = list(parent)
+    for start in range(0, len(ids), batch_size):
+        for member in Embassy.query.filter(Embassy.id.in_(ids[start:start + batch_size])):
+            members[member.id] = member
+    result = [sorted((members[i] for i in group if i in members), key=lambda m: (m.list.name, m.name))
+              for group in groups.values()]
+    return sorted((group for group in result if len(group) > 1), key=lambda group: (-len(group), group[0].name))
+
+
+@click.group('contacts')
+def contacts_cli():
+    """Embassy contact normalization and duplicate detection."""
+
+
+@contacts_cli.command('normalize')
+@click.option('--batch-size', type=int, help='Members per chunk (default CONTACTS_BATCH_SIZE).')
+@click.option('--dry-run', is_flag=True, help='Only count what would change.')
+@with_appcontext
+def normalize_command(batch_size, dry_run):
+    """Normalize the contact details of every member and compute their keys."""
+    changed, unparsed = normalize_all(batch_size or current_app.config['CONTACTS_BATCH_SIZE'], dry_run)
+    verb = 'Would update' if dry_run else 'Updated'
+    click.echo(f'{verb} {changed} members; {unparsed} values could not be normalized and are kept as typed.')
+
+
+@contacts_cli.command('duplicates')
+@click.option('--batch-size', type=int, help='Keys per lookup (default CONTACTS_BATCH_SIZE).')
+@with_appcontext
+def duplicates_command(batch_size):
+    """List members that share a phone, email or Instagram account."""
+    groups = duplicate_groups(batch_size)
+    for group in groups:
+        click.echo(', '.join(f'{m.name} [{m.list.country.name} / {m.list.name} #{m.id}]' for m in group))
+    click.echo(f'{len(groups)} groups of duplicates.')
+
+
+def init_app(app):
+    app.cli.add_command(contacts_cli)
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, CoordinationLease, SharedCacheEntry
+
+# Coordination between workers and nodes: a shared cache, named locks and
+# leader election. The 'database' backend keeps everything in two small tables
+# of the application database, so every gunicorn worker (and every node using
+# the same PostgreSQL) sees the same state; 'memory' keeps it in-process for
+# tests and single-process development.
+#
+# Locks are leases rather than connection-bound advisory locks: a row naming
+# the holder and an expiry, renewed in the background while the holder works.
+# A crashed holder simply stops renewing, and the lock frees itself once the
+# lease runs out, with no pooled connection pinned for the job's duration.
+# Expiries are compared against each node's clock, so nodes need NTP.
+
+log = logging.getLogger(__name__)
+
+
+class LockUnavailable(Exception):
+    pass
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.values = {}
+        self.leases = {}
+        self.mutex = threading.Lock()
+
+    def get(self, key):
+        with self.mutex:
+            hit = self.values.get(key)
+            if hit is None:
+                return None
+            if hit[1] is not None and hit[1] <= time.time():
+                del self.values[key]
+                return None
+            return hit[0]
+
+    def set(self, key, value, ttl=None):
+        with self.mutex:
+            self.values[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self.mutex:
+            self.values.pop(key, None)
+
+    def acquire(self, name, owner, ttl):
+        now = time.time()
+        with self.mutex:
+            held = self.leases.get(name)
+            if held and held[0] != owner and held[1] > now:
+                return False
+            self.leases[name] = (owner, now + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self.mutex:
+            if self.leases.get(name, (None,))[0] == owner:
+                del self.leases[name]
+
+    def holder(self, name):
+        with self.mutex:
+            held = self.leases.get(name)
+        return held[0] if held and held[1] > time.time() else None
+
+    def purge(self):
+        now = time.time()
+        with self.mutex:
+            for key in [k for k, (_, expires) in self.values.items() if expires is not None and expires <= now]:
+                del self.values[key]
+            for name in [n for n, (_, expires) in self.leases.items() if expires <= now]:
+                del self.leases[name]
+
+
+class DatabaseBackend:
+    def __init__(self, app):
+        self.app = app
+        self._engine = None
+
+    @property
+    def engine(self):
+        # Used from background threads, outside any app context
+        if self._engine is None:
+            with self.app.app_context():
+                self._engine = db.engine
+        return self._engine
+
+    def get(self, key):
+        table = SharedCacheEntry.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(select(table.c.value, table.c.expires_at).where(table.c.key == key)).first()
+        if row is None or (row.expires_at is not None and row.expires_at <= datetime.utcnow()):
+            return None
+        return row.value
+
+    def set(self, key, value, ttl=None):
+        table = SharedCacheEntry.__table__
+        values = {'value': value, 'expires_at': datetime.utcnow() + timedelta(seconds=ttl) if ttl else None}
+        with self.engine.begin() as conn:
+            dialect = conn.dialect.name
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            elif dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            else:
+                if not conn.execute(update(table).where(table.c.key == key).values(**values)).rowcount:
+                    conn.execute(insert(table).values(key=key, **values))
+                return
+            stmt = upsert(table).values(key=key, **values)
+            conn.execute(stmt.on_conflict_do_update(index_elements=[table.c.key], set_=values))
+
+    def delete(self, key):
+        table = SharedCacheEntry.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.key == key))
+
+    def acquire(self, name, owner, ttl):
+        """Take or renew the lease on `name`; False while someone else holds it."""
+        table = CoordinationLease.__table__
+        now = datetime.utcnow()
+        values = {'owner': owner, 'expires_at': now + timedelta(seconds=ttl)}
+        try:
+            with self.engine.begin() as conn:
+                taken = conn.execute(
+                    update(table)
+                    .where(table.c.name == name, or_(table.c.owner == owner, table.c.expires_at <= now))
+                    .values(**values)
+                ).rowcount
+                if not taken:
+                    conn.execute(insert(table).values(name=name, **values))
+        except IntegrityError:
+            return False
+        except OperationalError:
+            # e.g. SQLite still locked by another writer after its busy timeout
+            log.warning('Could not acquire lease %s', name, exc_info=True)
+            return False
+        return True
+
+    def release(self, name, owner):
+        table = CoordinationLease.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.name == name, table.c.owner == owner))
+
+    def holder(self, name):
+        table = CoordinationLease.__table__
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(table.c.owner).where(table.c.name == name, table.c.expires_at > datetime.utcnow())
+            ).scalar()
+
+    def purge(self):
+        now = datetime.utcnow()
+        cache, leases = SharedCacheEntry.__table__, CoordinationLease.__table__
+        with self.engine.begin() as conn:
+            conn.execute(delete(cache).where(cache.c.expires_at <= now))
+            conn.execute(delete(leases).where(leases.c.expires_at <= now))
+
+
+class _Renewer(threading.Thread):
+    # Keeps a lease alive while its holder is still working
+    def __init__(self, backend, name, owner, ttl):
+        super().__init__(name=f'lease-{name}', daemon=True)
+        self.backend, self.lease, self.owner, self.ttl = backend, name, owner, ttl
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.ttl / 3):
+            try:
+                if not self.backend.acquire(self.lease, self.owner, self.ttl):
+                    log.error('Lost lease %s', self.lease)
+                    return
+            except Exception:
+                log.warning('Could not renew lease %s', self.lease, exc_info=True)
+
+
+class _Election(threading.Thread):
+    def __init__(self, backend, name, owner, ttl):
+        super().__init__(name=f'election-{name}', daemon=True)
+        self.backend, self.lease, self.owner, self.ttl = backend, name, owner, ttl
+        self.valid_until = 0.0
+
+    @property
+    def is_leader(self):
+        # Only trust leadership up to the expiry of the last successful renewal
+        return time.monotonic() < self.valid_until
+
+    def campaign(self):
+        started = time.monotonic()
+        try:
+            won = self.backend.acquire(self.lease, self.owner, self.ttl)
+        except Exception:
+            log.warning('Leader election for %s failed', self.lease, exc_info=True)
+            won = False
+        was_leader = self.is_leader
+        self.valid_until = started + self.ttl if won else 0.0
+        if won != was_leader:
+            log.info('%s leadership of %s', 'Took' if won else 'Lost', self.lease)
+
+    def run(self):
+        while True:
+            time.sleep(self.ttl / 3)
+            self.campaign()
+
+
+class Coordinator:
+    def __init__(self, app, backend):
+        self.app = app
+        self.backend = backend
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.lock_ttl = app.config['COORDINATION_LOCK_TTL']
+        self.leader_ttl = app.config['COORDINATION_LEADER_TTL']
+        self.elections = {}
+        self.mutex = threading.Lock()
+        self.jobs = []
+        self.started = False
+
+    # Shared cache; values must be JSON-serializable
+
+    def get(self, key, default=None):
+        raw = self.backend.get(key)
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, json.dumps(value), ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    # Locks
+
+    @contextmanager
+    def lock(self, name, ttl=None, wait=0):
+        """Hold the lock `name` for the duration of the block.
+
+        Raises LockUnavailable when another holder still has it after `wait`
+        seconds. The lease is renewed while the block runs, so `ttl` only
+        bounds how long a crashed holder keeps others out.
+        """
+        ttl = ttl or self.lock_ttl
+        token = f'{self.owner}:{uuid.uuid4().hex[:8]}'
+        deadline = time.monotonic() + wait
+        delay = 0.05
+        while not self.backend.acquire(name, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockUnavailable(name)
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, 2)
+
+        renewer = _Renewer(self.backend, name, token, ttl)
+        renewer.start()
+        try:
+            yield
+        finally:
+            renewer.stopped.set()
+            self.backend.release(name, token)
+
+    def holder(self, name):
+        return self.backend.holder(name)
+
+    # Leader election
+
+    def is_leader(self, name):
+        """Whether this process currently leads `name`; the first call enters the election."""
+        with self.mutex:
+            election = self.elections.get(name)
+            if election is None:
+                election = self.elections[name] = _Election(self.backend, name, self.owner, self.leader_ttl)
+                election.campaign()
+                election.start()
+        return election.is_leader
+
+    def periodic(self, name, interval, func):
+        """Run func() every `interval` seconds on whichever process leads `name`.
+
+        Jobs only run once start() is called, which the serving entry points
+        do (wsgi.py, asgi.py, `python app.py`); the flask CLI, init_db.py and
+        other scripts build the same app without background threads.
+        """
+        with self.mutex:
+            self.jobs.append((name, interval, func))
+            started = self.started
+        if started:
+            self._spawn(name, interval, func)
+
+    def start(self):
+        with self.mutex:
+            if self.started:
+                return
+            self.started = True
+            jobs = list(self.jobs)
+        for job in jobs:
+            self._spawn(*job)
+
+    def _spawn(self, name, interval, func):
+        def loop():
+            while True:
+                time.sleep(interval)
+                if not self.is_leader(name):
+                    continue
+                with self.app.app_context():
+                    try:
+                        func()
+                    except Exception:
+                        log.exception('Periodic job %s failed', name)
+                    finally:
+                        db.session.remove()
+
+        threading.Thread(target=loop, name=f'periodic-{name}', daemon=True).start()
+
+
+def coordinator():
+    return current_app.extensions['coordination']
+
+
+def start_background_jobs(app):
+    """Start the periodic jobs (and so their leader elections) of a serving process."""
+    app.extensions['coordination'].start()
+
+
+def _housekeeping():
+    from utils.uploads import purge_stale_uploads
+    coordinator().backend.purge()
+    purge_stale_uploads()
+
+
+def init_app(app):
+    if app.config['COORDINATION_BACKEND'] == 'memory':
+        backend = MemoryBackend()
+    else:
+        backend = DatabaseBackend(app)
+    app.extensions['coordination'] = Coordinator(app, backend)
+    if app.config['HOUSEKEEPING_INTERVAL']:
+        app.extensions['coordination'].periodic('housekeeping', app.config['HOUSEKEEPING_INTERVAL'], _housekeeping)
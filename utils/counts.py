@@ -0,0 +1,94 @@
+import hashlib
+import json
+import uuid
+from flask import current_app
+from sqlalchemy import event, func, select, text
+from models import db
+from utils.coordination import coordinator
+
+# Row totals for paginated listings. A COUNT(*) over a large filtered table
+# costs about as much as the page itself, so totals are cached per filter
+# combination for COUNT_CACHE_TTL seconds and dropped whenever a row of the
+# counted table is written through the session. Totals live in the shared
+# cache under a per-table generation, so a write in one worker invalidates
+# the counts every other worker cached.
+
+# Below this many rows an exact count is cheap enough
+ESTIMATE_THRESHOLD = 10000
+
+# Tables with cached totals; commits touching only other tables leave the
+# shared cache alone. Listings register their model when imported (counted())
+# so every worker invalidates a table's totals, not only those that counted it.
+COUNTED_TABLES = set()
+
+
+def counted(model):
+    COUNTED_TABLES.add(model.__table__.name)
+    return model
+
+
+def _estimated_rows(table_name):
+    # Planner statistics; only PostgreSQL keeps a usable one
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    value = db.session.execute(
+        text('SELECT reltuples::bigint FROM pg_class WHERE relname = :name'), {'name': table_name}
+    ).scalar()
+    return value if value and value >= ESTIMATE_THRESHOLD else None
+
+
+def cached_count(model, stmt, key, unfiltered=False):
+    """Total rows of `stmt` (a select of `model`), cached under `key`.
+
+    For the unfiltered listing on PostgreSQL the planner's row estimate is used
+    once the table is large; the UI only needs the order of magnitude there.
+    """
+    table_name = counted(model).__table__.name
+    cache = coordinator()
+    generation = cache.get(f'count-generation:{table_name}')
+    if generation is None:
+        generation = _new_generation(table_name)
+    digest = hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()
+    cache_key = f'count:{table_name}:{generation}:{digest}'
+    total = cache.get(cache_key)
+    if total is not None:
+        return total
+
+    total = _estimated_rows(table_name) if unfiltered else None
+    if total is None:
+        total = db.session.execute(
+            select(func.count()).select_from(stmt.order_by(None).subquery())
+        ).scalar()
+
+    cache.set(cache_key, total, ttl=current_app.config['COUNT_CACHE_TTL'])
+    return total
+
+
+def _new_generation(table_name):
+    generation = uuid.uuid4().hex[:12]
+    coordinator().set(f'count-generation:{table_name}', generation)
+    return generation
+
+
+def invalidate(table_name):
+    # Counts cached under the previous generation are never read again and simply expire
+    _new_generation(table_name)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_changed_tables(session, flush_context):
+    changed = {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)}
+    changed &= COUNTED_TABLES
+    if changed:
+        session.info.setdefault('counted_tables_changed', set()).update(changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _drop_stale_counts(session):
+    for table_name in session.info.pop('counted_tables_changed', ()):
+        invalidate(table_name)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop('counted_tables_changed', None)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+# iCalendar (RFC 5545) rendering for the per-user calendar feed.
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+PRODID = '-//AMICI Magazine//CRM Calendar//ES'
+
+
+def sync_token(dt):
+    """Opaque token for a point in the events' updated_at history."""
+    return str((dt - EPOCH) // _MICROSECOND) if dt else '0'
+
+
+def parse_sync_token(token):
+    try:
+        return EPOCH + int(token) * _MICROSECOND
+    except (TypeError, ValueError):
+        return None
+
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _fold(line):
+    # Content lines are limited to 75 octets; continuation lines start with a space
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    while data:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1  # don't split a UTF-8 sequence
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _local(dt):
+    # Event times are entered as local wall-clock times, so they are emitted floating
+    return dt.strftime('%Y%m%dT%H%M%S')
+
+
+def _utc(dt):
+    return dt.strftime('%Y%m%dT%H%M%SZ')
+
+
+def header(name, token):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN',
+             f'X-WR-CALNAME:{_escape(name)}', f'X-AMICI-SYNC-TOKEN:{token}']
+    return ''.join(_fold(line) for line in lines)
+
+
+def footer():
+    return _fold('END:VCALENDAR')
+
+
+def _vevent(uid, stamp, start, end, title, description, location, extra=()):
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{_utc(stamp)}', f'DTSTART:{_local(start)}']
+    if end:
+        lines.append(f'DTEND:{_local(end)}')
+    lines.append(f'SUMMARY:{_escape(title)}')
+    if description:
+        lines.append(f'DESCRIPTION:{_escape(description)}')
+    if location:
+        lines.append(f'LOCATION:{_escape(location)}')
+    lines.extend(extra)
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def event_to_ics(event, exceptions=()):
+    """VEVENT(s) for an event: the master, plus one per overridden occurrence."""
+    uid = f'event-{event.id}@amici'
+    stamp = event.updated_at or event.start_time
+
+    if event.deleted_at:
+        # Tombstone: clients drop the event when they see it cancelled
+        return _vevent(uid, event.deleted_at, event.start_time, event.end_time, event.title,
+                       None, None, ['STATUS:CANCELLED'])
+
+    extra = []
+    if event.rrule:
+        extra.append(f'RRULE:{event.rrule}')
+        cancelled = [e.original_start for e in exceptions if e.is_cancelled]
+        if cancelled:
+            extra.append('EXDATE:' + ','.join(_local(dt) for dt in cancelled))
+
+    text = _vevent(uid, stamp, event.start_time, event.end_time, event.title,
+                   event.description, event.location, extra)
+
+    duration = (event.end_time - event.start_time) if event.end_time else None
+    for exception in exceptions:
+        if exception.is_cancelled:
+            continue
+        start = exception.start_time or exception.original_start
+        end = exception.end_time or ((start + duration) if duration else None)
+        text += _vevent(uid, stamp, start, end, exception.title or event.title,
+                        exception.description or event.description, exception.location or event.location,
+                        [f'RECURRENCE-ID:{_local(exception.original_start)}'])
+    return text
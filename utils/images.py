@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import functools
+import hmac
+import io
+import os
+import threading
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+from utils.coordination import coordinator, LockUnavailable
+
+# Resized copies of uploaded photos. Templates ask for an image at a given
+# display width through responsive_img(); the URLs it emits carry an HMAC of
+# (source, path, width, format) so only sizes the app itself generated can be
+# requested. Results are cached on disk under IMAGE_CACHE_FOLDER; a cache hit
+# touches the file's mtime and, once the folder grows past
+# IMAGE_CACHE_MAX_BYTES, the least recently used files are evicted.
+
+# Widths the endpoint will produce; requested sizes snap up to one of these
+WIDTHS = (64, 128, 192, 256, 384, 512, 800, 1200, 1600)
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+QUALITY = 80
+# Eviction brings the cache down to this fraction of the limit
+EVICT_TO = 0.8
+
+
+def sources():
+    # name -> folder the stored filenames are relative to
+    return {
+        'users': current_app.config['USERS_FOLDER'],
+        'embassies': current_app.config['EMBASSIES_FOLDER'],
+        # ArticleImage.filename is relative to static/ ('uploads/articles/...')
+        'static': os.path.join(current_app.root_path, 'static'),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def default_format():
+    from PIL import features
+    return 'webp' if features.check('webp') else 'jpeg'
+
+
+def sign(source, filename, width, fmt):
+    message = f'{source}/{filename}:{width}:{fmt}'.encode('utf-8')
+    digest = hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:12]).decode('ascii')
+
+
+def verify(source, filename, width, fmt, signature):
+    return hmac.compare_digest(sign(source, filename, width, fmt), signature or '')
+
+
+def _snap(width):
+    for candidate in WIDTHS:
+        if candidate >= width:
+            return candidate
+    return WIDTHS[-1]
+
+
+def image_url(source, filename, width, fmt=None):
+    fmt = fmt or default_format()
+    width = _snap(width)
+    return url_for('images.resized', source=source, width=width, fmt=fmt, filename=filename,
+                   s=sign(source, filename, width, fmt))
+
+
+def responsive_img(source, filename, width, sizes=None, alt='', lazy=True, **attrs):
+    """An <img> with a 1x/2x/3x srcset for an image shown `width` CSS pixels wide."""
+    widths = sorted({_snap(width * density) for density in (1, 2, 3)})
+    srcset = ', '.join(f'{image_url(source, filename, w)} {w}w' for w in widths)
+    html_attrs = {
+        'src': image_url(source, filename, width),
+        'srcset': srcset,
+        'sizes': sizes or f'{width}px',
+        'alt': alt,
+    }
+    if lazy:
+        html_attrs['loading'] = 'lazy'
+        html_attrs['decoding'] = 'async'
+    for key, value in attrs.items():
+        html_attrs[key.rstrip('_').replace('_', '-')] = value
+    rendered = ' '.join(f'{key}="{escape(value)}"' for key, value in html_attrs.items() if value is not None)
+    return Markup(f'<img {rendered}>')
+
+
+class ResizeCache:
+    def __init__(self, app):
+        self.folder = app.config['IMAGE_CACHE_FOLDER']
+        self.max_bytes = app.config['IMAGE_CACHE_MAX_BYTES']
+        self.size = None  # bytes on disk, as last counted by this process
+        self.lock = threading.Lock()
+
+    def path(self, source_path, stat, width, fmt):
+        # The source's size and mtime are part of the key, so a replaced file is re-rendered
+        key = hashlib.sha1(f'{source_path}:{stat.st_size}:{stat.st_mtime_ns}:{width}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, key[:2], f'{key}.{fmt}')
+
+    def get(self, source_path, width, fmt):
+        """Path of the resized file, rendering it on a miss."""
+        stat = os.stat(source_path)
+        path = self.path(source_path, stat, width, fmt)
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+            return path
+        except FileNotFoundError:
+            pass
+
+        data = _render(source_path, width, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._added(len(data), path)
+        return path
+
+    def _added(self, nbytes, path):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(entry.stat().st_size for entry in _files(self.folder))
+            else:
+                self.size += nbytes
+            over = self.size > self.max_bytes
+        if over:
+            self.evict(keep=path)
+
+    def evict(self, keep=None):
+        # One worker evicts at a time; the others keep serving
+        try:
+            with coordinator().lock('image-cache-evict'):
+                entries = []
+                for entry in _files(self.folder):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total = sum(size for _, size, _ in entries)
+                target = self.max_bytes * EVICT_TO
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    if path == keep:  # about to be served
+                        continue
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                with self.lock:
+                    self.size = total
+        except LockUnavailable:
+            pass
+
+
+def _files(folder):
+    try:
+        shards = list(os.scandir(folder))
+    except FileNotFoundError:
+        return
+    for shard in shards:
+        if not shard.is_dir():
+            continue
+        with os.scandir(shard.path) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    yield entry
+
+
+def _render(source_path, width, fmt):
+    from PIL import Image, ImageOps
+    pil_format = FORMATS[fmt][0]
+    with Image.open(source_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img.thumbnail((width, width * 10))
+        if pil_format == 'JPEG':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        buffer = io.BytesIO()
+        img.save(buffer, pil_format, quality=QUALITY, optimize=pil_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def resolve(source, filename):
+    folder = sources().get(source)
+    if folder is None:
+        return None
+    path = safe_join(folder, filename)
+    return path if path and os.path.isfile(path) else None
+
+
+def init_app(app):
+    app.extensions['image_cache'] = ResizeCache(app)
+    app.jinja_env.globals.update(image_url=image_url, responsive_img=responsive_img)
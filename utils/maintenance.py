@@ -0,0 +1,252 @@
+import functools
+import os
+import time
+from contextlib import closing
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, text
+from models import db
+from utils.coordination import coordinator, LockUnavailable
+
+# `flask db-maint ...`: online backup, incremental vacuum, statistics and
+# integrity checks. Everything that can run in small steps does, committing
+# between steps, so live requests only ever wait for one step:
+#   backup   the SQLite backup API, BACKUP_STEP_PAGES pages at a time
+#   vacuum   PRAGMA incremental_vacuum in VACUUM_STEP_PAGES chunks
+#   analyze  PRAGMA optimize (ANALYZE with --full, and on PostgreSQL)
+#   check    PRAGMA quick_check (integrity_check with --full) + foreign_key_check
+# The leader worker also runs `analyze` and one vacuum step every
+# DB_OPTIMIZE_INTERVAL seconds.
+
+BACKUP_STEP_PAGES = 1024
+BACKUP_STEP_SLEEP = 0.05
+VACUUM_STEP_PAGES = 512
+VACUUM_STEP_SLEEP = 0.05
+INCREMENTAL = 2  # PRAGMA auto_vacuum value
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _require_sqlite(command):
+    if _dialect() != 'sqlite':
+        raise click.ClickException(f'{command} is only implemented for SQLite; use the PostgreSQL tools (pg_dump, VACUUM) instead.')
+
+
+def _database_path():
+    return db.engine.url.database
+
+
+def _file_size(path):
+    # The WAL holds committed pages that are not in the main file yet
+    total = 0
+    for suffix in ('', '-wal'):
+        try:
+            total += os.path.getsize(path + suffix)
+        except (OSError, TypeError):
+            pass
+    return total
+
+
+def _raw_connection():
+    # The DB-API connection underneath SQLAlchemy's pool, for PRAGMAs and backup()
+    return db.engine.raw_connection()
+
+
+def _pragma(connection, name):
+    return connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def _human(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def _report(label, started, before=None, after=None):
+    line = f'{label}: {time.monotonic() - started:.2f}s'
+    if before is not None and after is not None:
+        line += f', {_human(before)} -> {_human(after)}'
+    click.echo(line)
+
+
+def run_backup(target, verify=False):
+    """Copy the live database to `target` with the SQLite online backup API."""
+    import sqlite3
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    tmp = f'{target}.tmp'
+    source = _raw_connection()
+    try:
+        with closing(sqlite3.connect(tmp)) as dest:
+            # Between steps the source is unlocked; pages written meanwhile are re-copied
+            source.driver_connection.backup(dest, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+            if verify:
+                result = _pragma(dest, 'quick_check')
+                if result != 'ok':
+                    raise click.ClickException(f'Backup failed verification: {result}')
+    finally:
+        source.close()
+    os.replace(tmp, target)
+    _report(f'backup {target}', started, _file_size(_database_path()), os.path.getsize(target))
+
+
+def run_vacuum(max_pages=None, full=False):
+    started = time.monotonic()
+    path = _database_path()
+    before = _file_size(path)
+    connection = _raw_connection()
+    try:
+        driver = connection.driver_connection
+        if full:
+            # Rewrites the whole file and holds the write lock throughout; also
+            # switches the database to incremental auto-vacuum for next time
+            driver.execute(f'PRAGMA auto_vacuum = {INCREMENTAL}')
+            driver.execute('VACUUM')
+        elif _pragma(driver, 'auto_vacuum') != INCREMENTAL:
+            raise click.ClickException(
+                'This database was created without incremental auto-vacuum; run `flask db-maint vacuum --full` once '
+                '(it locks the database while it rewrites the file).')
+        else:
+            freed = 0
+            while max_pages is None or freed < max_pages:
+                free = _pragma(driver, 'freelist_count')
+                if not free:
+                    break
+                step = min(free, VACUUM_STEP_PAGES)
+                if max_pages is not None:
+                    step = min(step, max_pages - freed)
+                # executescript steps the pragma to completion (execute() frees one page)
+                driver.executescript(f'PRAGMA incremental_vacuum({step});')
+                freed += step
+                time.sleep(VACUUM_STEP_SLEEP)
+        driver.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    finally:
+        connection.close()
+    _report('vacuum', started, before, _file_size(path))
+
+
+def run_analyze(full=False):
+    started = time.monotonic()
+    if _dialect() == 'sqlite':
+        connection = _raw_connection()
+        try:
+            connection.driver_connection.execute('ANALYZE' if full else 'PRAGMA optimize')
+            connection.driver_connection.commit()
+        finally:
+            connection.close()
+    else:
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('ANALYZE'))
+    _report('analyze' if full or _dialect() != 'sqlite' else 'optimize', started)
+
+
+def run_check(full=False):
+    started = time.monotonic()
+    connection = _raw_connection()
+    try:
+        driver = connection.driver_connection
+        problems = [row[0] for row in driver.execute('PRAGMA integrity_check' if full else 'PRAGMA quick_check')]
+        problems = [] if problems == ['ok'] else problems
+        for table, rowid, parent, _ in driver.execute('PRAGMA foreign_key_check'):
+            problems.append(f'{table} row {rowid}: missing {parent}')
+    finally:
+        connection.close()
+    _report('integrity check', started)
+    return problems
+
+
+def _scheduled_optimize():
+    with coordinator().lock('db-maint'):
+        run_analyze()
+        if _dialect() == 'sqlite':
+            try:
+                run_vacuum(max_pages=VACUUM_STEP_PAGES)
+            except click.ClickException:
+                pass  # not in incremental mode; left to an operator
+
+
+@click.group('db-maint')
+def db_maint():
+    """Database maintenance that is safe to run while the app is serving."""
+
+
+def _exclusive(func):
+    # Overlapping runs (cron plus the scheduled job) would only slow each other down
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            with coordinator().lock('db-maint', wait=5):
+                return func(*args, **kwargs)
+        except LockUnavailable:
+            raise click.ClickException('Another db-maint run is in progress.')
+    return wrapper
+
+
+@db_maint.command('backup')
+@click.argument('target', required=False)
+@click.option('--verify', is_flag=True, help='Run PRAGMA quick_check on the copy.')
+@with_appcontext
+@_exclusive
+def backup_command(target, verify):
+    """Online backup to TARGET (default: instance/backups/amici-<timestamp>.db)."""
+    _require_sqlite('backup')
+    if not target:
+        target = os.path.join(current_app.instance_path, 'backups', f'amici-{datetime.utcnow():%Y%m%d-%H%M%S}.db')
+    run_backup(target, verify=verify)
+
+
+@db_maint.command('vacuum')
+@click.option('--pages', type=int, help='Free at most this many pages.')
+@click.option('--full', is_flag=True, help='Full VACUUM (locks the database); enables incremental mode.')
+@with_appcontext
+@_exclusive
+def vacuum_command(pages, full):
+    """Return free pages to the filesystem."""
+    _require_sqlite('vacuum')
+    run_vacuum(max_pages=pages, full=full)
+
+
+@db_maint.command('analyze')
+@click.option('--full', is_flag=True, help='Full ANALYZE instead of PRAGMA optimize.')
+@with_appcontext
+@_exclusive
+def analyze_command(full):
+    """Refresh the query planner's statistics."""
+    run_analyze(full=full)
+
+
+@db_maint.command('check')
+@click.option('--full', is_flag=True, help='PRAGMA integrity_check instead of quick_check.')
+@with_appcontext
+@_exclusive
+def check_command(full):
+    """Check the database file and foreign keys."""
+    _require_sqlite('check')
+    problems = run_check(full=full)
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        raise click.ClickException(f'{len(problems)} problems found.')
+    click.echo('ok')
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # Only takes effect for a new database file (before its first table);
+    # existing files switch with `db-maint vacuum --full`
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA auto_vacuum = {INCREMENTAL}')
+    cursor.close()
+
+
+def init_app(app):
+    app.cli.add_command(db_maint)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _sqlite_pragmas)
+    if app.config['DB_OPTIMIZE_INTERVAL']:
+        app.extensions['coordination'].periodic('db-optimize', app.config['DB_OPTIMIZE_INTERVAL'], _scheduled_optimize)
@@ -0,0 +1,211 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import date
+from flask import current_app
+from sqlalchemy import event, func, insert, select, update
+from models import db, Manual, ManualDownloadStat
+from utils.coordination import coordinator
+
+# The manuals page and PDF downloads read a per-role catalog instead of
+# querying Manual on every request. Catalogs are built once per process and
+# catalog generation; any commit that touches a manual (including the
+# background previewer's) starts a new generation in the shared cache. Workers
+# re-read the generation at most every GENERATION_CHECK_INTERVAL seconds, so
+# the others rebuild within that long of the change (the committing one at once).
+#
+# Downloads are counted in a per-process buffer, (manual, day, role) -> n, and
+# added to ManualDownloadStat by a background thread every
+# MANUAL_STATS_FLUSH_INTERVAL seconds, so serving a PDF never writes.
+
+log = logging.getLogger(__name__)
+
+GENERATION_KEY = 'manual-catalog-generation'
+# Seconds a worker trusts the generation it last read from the shared cache
+GENERATION_CHECK_INTERVAL = 5
+
+CatalogEntry = namedtuple('CatalogEntry', 'id name filename target_role uploaded_at page_count thumbnail preview_status')
+
+_catalogs = {}  # generation -> {'all': [entries], 'ids': {...}, 'files': {...}, role: [entries]}
+_catalogs_lock = threading.Lock()
+
+
+def _generation():
+    generation, checked_at = current_app.extensions['manual_catalog_generation']
+    if generation is None or time.monotonic() - checked_at >= GENERATION_CHECK_INTERVAL:
+        generation = coordinator().get(GENERATION_KEY)
+        if generation is None:
+            return invalidate()
+        current_app.extensions['manual_catalog_generation'] = (generation, time.monotonic())
+    return generation
+
+
+def invalidate():
+    generation = uuid.uuid4().hex[:12]
+    coordinator().set(GENERATION_KEY, generation)
+    current_app.extensions['manual_catalog_generation'] = (generation, time.monotonic())
+    return generation
+
+
+def _build():
+    # Plain columns only: text_content stays deferred
+    table = Manual.__table__
+    rows = db.session.execute(
+        select(table.c.id, table.c.name, table.c.filename, table.c.target_role, table.c.uploaded_at,
+               table.c.page_count, table.c.thumbnail, table.c.preview_status)
+        .order_by(table.c.name.asc())
+    ).all()
+    entries = [CatalogEntry(*row) for row in rows]
+    return {'all': entries, 'ids': {entry.id: entry for entry in entries},
+            'files': {entry.filename: entry for entry in entries}}
+
+
+def _current():
+    generation = _generation()
+    catalog = _catalogs.get(generation)
+    if catalog is None:
+        catalog = _build()
+        with _catalogs_lock:
+            # Older generations are never read again
+            _catalogs.clear()
+            _catalogs[generation] = catalog
+    return catalog
+
+
+def visible_to(entry, role):
+    return role == 'admin' or entry.target_role in ('all', role)
+
+
+def catalog_for(role):
+    """Manuals `role` can see, ordered by name."""
+    catalog = _current()
+    entries = catalog.get(role)
+    if entries is None:
+        entries = catalog[role] = [entry for entry in catalog['all'] if visible_to(entry, role)]
+    return entries
+
+
+def by_id(manual_id):
+    return _current()['ids'].get(manual_id)
+
+
+def by_filename(filename):
+    return _current()['files'].get(filename)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_manual_changes(session, flush_context):
+    if any(isinstance(obj, Manual) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info['manual_catalog_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _drop_catalog(session):
+    if session.info.pop('manual_catalog_changed', False):
+        invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_manual_changes(session):
+    session.info.pop('manual_catalog_changed', None)
+
+
+class DownloadCounter:
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['MANUAL_STATS_FLUSH_INTERVAL']
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='manual-download-stats', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, manual_id, role):
+        key = (manual_id, date.today(), role or 'unknown')
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + 1
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        try:
+            with self.app.app_context():
+                self._write(batch)
+        except Exception:
+            log.exception('Failed to write %d manual download counters', len(batch))
+            # Put them back for the next attempt
+            with self.lock:
+                for key, count in batch.items():
+                    self.pending[key] = self.pending.get(key, 0) + count
+
+    def _write(self, batch):
+        table = ManualDownloadStat.__table__
+        with db.engine.begin() as conn:
+            # Counts for manuals deleted since the download are dropped
+            existing = set(conn.execute(
+                select(Manual.__table__.c.id).where(Manual.__table__.c.id.in_({key[0] for key in batch}))
+            ).scalars())
+            rows = [{'manual_id': manual_id, 'day': day, 'role': role, 'count': count}
+                    for (manual_id, day, role), count in batch.items() if manual_id in existing]
+            if not rows:
+                return
+            dialect = conn.dialect.name
+            if dialect in ('postgresql', 'sqlite'):
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert as upsert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert as upsert
+                stmt = upsert(table)
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=[table.c.manual_id, table.c.day, table.c.role],
+                    set_={'count': table.c.count + stmt.excluded.count}), rows)
+                return
+            for row in rows:
+                match = ((table.c.manual_id == row['manual_id']) & (table.c.day == row['day'])
+                         & (table.c.role == row['role']))
+                if not conn.execute(update(table).where(match).values(count=table.c.count + row['count'])).rowcount:
+                    conn.execute(insert(table).values(**row))
+
+
+def record_download(manual_id, role):
+    current_app.extensions['manual_downloads'].record(manual_id, role)
+
+
+def usage_report(since):
+    """[(entry, total, {role: count}, last_day)] for every manual, most downloaded first."""
+    table = ManualDownloadStat.__table__
+    rows = db.session.execute(
+        select(table.c.manual_id, table.c.role, func.sum(table.c.count), func.max(table.c.day))
+        .where(table.c.day >= since)
+        .group_by(table.c.manual_id, table.c.role)
+    ).all()
+    usage = {}
+    for manual_id, role, count, last_day in rows:
+        by_role, last = usage.get(manual_id, ({}, None))
+        by_role[role] = count
+        usage[manual_id] = (by_role, max(filter(None, (last, last_day))))
+    report = []
+    for entry in _current()['all']:
+        by_role, last_day = usage.get(entry.id, ({}, None))
+        report.append((entry, sum(by_role.values()), by_role, last_day))
+    report.sort(key=lambda row: (-row[1], row[0].name))
+    return report
+
+
+def init_app(app):
+    app.extensions['manual_catalog_generation'] = (None, 0)
+    app.extensions['manual_downloads'] = DownloadCounter(app)
@@ -0,0 +1,195 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Manual
+from utils.coordination import coordinator, LockUnavailable
+from utils.storage import remove_stored_file
+
+# Manual previews: page count, a thumbnail and the text content of each PDF,
+# extracted with pypdf (pure Python, so parsing is CPU-bound and runs in a
+# process pool instead of the request thread). pypdf can't rasterize pages;
+# the thumbnail is the largest image embedded in the first page (the cover
+# of most manuals), scaled down with Pillow when it is installed.
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTH = 320
+
+
+def manuals_folder():
+    return os.path.join(current_app.root_path, 'static', 'manuals')
+
+
+def thumbnails_folder():
+    return os.path.join(manuals_folder(), 'thumbnails')
+
+
+def _first_page_thumbnail(page, thumbnail_path):
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+
+    images = []
+    try:
+        images = list(page.images)
+    except Exception:
+        log.debug('Could not read images of %s', thumbnail_path, exc_info=True)
+    if not images:
+        return False
+
+    try:
+        cover = max(images, key=lambda image: len(image.data))
+        with Image.open(io.BytesIO(cover.data)) as img:
+            img = img.convert('RGB')
+            img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 2))
+            img.save(thumbnail_path, 'JPEG', quality=80)
+    except Exception:
+        log.debug('Could not build thumbnail %s', thumbnail_path, exc_info=True)
+        return False
+    return True
+
+
+def extract_preview(pdf_path, thumbnail_path, max_pages, max_chars):
+    """Worker-process entry point; returns a dict of Manual column values."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    pages = reader.pages
+    result = {'page_count': len(pages), 'thumbnail': None, 'text_content': None}
+    if not pages:
+        return result
+
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    if _first_page_thumbnail(pages[0], thumbnail_path):
+        result['thumbnail'] = os.path.basename(thumbnail_path)
+
+    chunks, size = [], 0
+    for page in pages[:max_pages]:
+        try:
+            text = page.extract_text() or ''
+        except Exception:
+            continue
+        text = ' '.join(text.split())
+        if not text:
+            continue
+        chunks.append(text)
+        size += len(text) + 1
+        if size >= max_chars:
+            break
+    result['text_content'] = '\n'.join(chunks)[:max_chars] or None
+    return result
+
+
+class ManualPreviewer:
+    def __init__(self, app):
+        self.app = app
+        self.pool = None
+
+    def _executor(self):
+        # Created on first use; spawn so workers don't inherit the app's
+        # threads (audit writer) or open database connections
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.app.config['MANUAL_PREVIEW_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self.pool
+
+    def submit(self, manual):
+        manual_id = manual.id
+        args = (
+            extract_preview,
+            os.path.join(manuals_folder(), manual.filename),
+            os.path.join(thumbnails_folder(), f'{manual_id}.jpg'),
+            self.app.config['MANUAL_TEXT_MAX_PAGES'],
+            self.app.config['MANUAL_TEXT_MAX_CHARS'],
+        )
+        try:
+            future = self._executor().submit(*args)
+        except BrokenProcessPool:
+            # A worker died (e.g. a malformed PDF exhausted memory); start a fresh pool
+            self.pool = None
+            future = self._executor().submit(*args)
+        future.add_done_callback(lambda f: self._store(manual_id, f))
+        return future
+
+    def _store(self, manual_id, future):
+        with self.app.app_context():
+            try:
+                manual = db.session.get(Manual, manual_id)
+                if manual is None:
+                    return
+                try:
+                    values = future.result()
+                except Exception:
+                    log.exception('Preview extraction failed for manual %s', manual_id)
+                    manual.preview_status = 'failed'
+                else:
+                    for key, value in values.items():
+                        setattr(manual, key, value)
+                    manual.preview_status = 'done'
+                manual.processed_at = datetime.utcnow()
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
+            self.pool = None
+
+
+def queue_preview(manual):
+    manual.preview_status = 'pending'
+    db.session.commit()
+    current_app.extensions['manual_previewer'].submit(manual)
+
+
+def remove_thumbnail(manual):
+    if manual.thumbnail:
+        remove_stored_file(os.path.join(thumbnails_folder(), manual.thumbnail))
+
+
+@click.command('manuals-preview')
+@click.option('--all', 'everything', is_flag=True, help='Reprocess manuals that already have a preview.')
+@with_appcontext
+def preview_manuals_command(everything):
+    """Extract previews for manuals uploaded before processing existed."""
+    try:
+        with coordinator().lock('manuals-preview'):
+            _preview_manuals(everything)
+    except LockUnavailable:
+        raise click.ClickException('Ya hay otra ejecución de manuals-preview en curso.')
+
+
+def _preview_manuals(everything):
+    query = Manual.query
+    if not everything:
+        query = query.filter(db.or_(Manual.preview_status.is_(None), Manual.preview_status != 'done'))
+    manuals = query.all()
+    for manual in manuals:
+        manual.preview_status = 'pending'
+    db.session.commit()
+
+    previewer = current_app.extensions['manual_previewer']
+    futures = [previewer.submit(manual) for manual in manuals]
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass
+    previewer.shutdown()
+    click.echo(f'{len(futures)} manuales procesados.')
+
+
+def init_app(app):
+    app.extensions['manual_previewer'] = ManualPreviewer(app)
+    app.cli.add_command(preview_manuals_command)
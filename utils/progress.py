@@ -0,0 +1,137 @@
+from datetime import datetime
+from sqlalchemy import event, select, delete, insert, func, case, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Article, ArticleImage, Edition, EditionProgress, ARTICLE_STATUSES
+from utils.coordination import coordinator, LockUnavailable
+from utils import sharding
+
+# Seconds a request waits for another worker's rollup refresh before showing what it has
+REFRESH_LOCK_WAIT = 10
+
+
+def refresh_edition_progress(connection, edition_ids):
+    """Recompute the rollup rows for the given editions with two grouped queries."""
+    ids = sorted({int(i) for i in edition_ids if i})
+    if not ids:
+        return
+
+    now = datetime.utcnow()
+    pending = and_(Article.status != 'done', Article.deadline.isnot(None))
+
+    rollups = {}
+    for edition_id in ids:
+        row = {'edition_id': edition_id, 'total_articles': 0, 'overdue_count': 0,
+               'image_count': 0, 'next_deadline': None, 'updated_at': now}
+        for status in ARTICLE_STATUSES:
+            row[f'{status}_count'] = 0
+        rollups[edition_id] = row
+
+    status_rows = connection.execute(
+        select(
+            Article.edition_id,
+            Article.status,
+            func.count(Article.id),
+            func.sum(case((and_(pending, Article.deadline < now), 1), else_=0)),
+            func.min(case((and_(pending, Article.deadline >= now), Article.deadline))),
+        )
+        .where(Article.edition_id.in_(ids))
+        .group_by(Article.edition_id, Article.status)
+    )
+    for edition_id, status, count, overdue, next_deadline in status_rows:
+        row = rollups[edition_id]
+        row['total_articles'] += count
+        row['overdue_count'] += overdue or 0
+        if status in ARTICLE_STATUSES:
+            row[f'{status}_count'] += count
+        if next_deadline and (row['next_deadline'] is None or next_deadline < row['next_deadline']):
+            row['next_deadline'] = next_deadline
+
+    image_rows = connection.execute(
+        select(Article.edition_id, func.count(ArticleImage.id))
+        .join(ArticleImage, ArticleImage.article_id == Article.id)
+        .where(Article.edition_id.in_(ids))
+        .group_by(Article.edition_id)
+    )
+    for edition_id, count in image_rows:
+        rollups[edition_id]['image_count'] = count
+
+    _upsert(connection, EditionProgress.__table__, list(rollups.values()))
+
+
+def _upsert(connection, table, rows):
+    # Two workers refreshing the same edition must not both insert its row
+    dialect = {'postgresql': postgresql, 'sqlite': sqlite}.get(connection.dialect.name)
+    if dialect is None:
+        connection.execute(delete(table).where(table.c.edition_id.in_([row['edition_id'] for row in rows])))
+        connection.execute(insert(table), rows)
+        return
+    statement = dialect.insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.edition_id],
+        set_={column.name: statement.excluded[column.name] for column in table.columns if not column.primary_key},
+    )
+    connection.execute(statement, rows)
+
+
+def _touched_editions(session):
+    edition_ids = set()
+    image_article_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Article):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            history = db.inspect(obj).attrs.edition_id.history
+            edition_ids.update(history.added or ())
+            edition_ids.update(history.unchanged or ())
+            edition_ids.update(history.deleted or ())
+        elif isinstance(obj, ArticleImage):
+            if obj.article_id:
+                image_article_ids.add(obj.article_id)
+
+    if image_article_ids:
+        rows = session.connection(bind_arguments={'mapper': Article}).execute(
+            select(Article.edition_id).where(Article.id.in_(image_article_ids))
+        )
+        edition_ids.update(r[0] for r in rows)
+
+    return edition_ids
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_progress_after_flush(session, flush_context):
+    edition_ids = _touched_editions(session)
+    if edition_ids:
+        refresh_edition_progress(session.connection(bind_arguments={'mapper': EditionProgress}), edition_ids)
+
+
+def _refresh_lock_name():
+    # Countries with their own database (utils.sharding) refresh independently
+    if sharding.enabled():
+        return f'edition-progress-refresh:{sharding.current_shard()}'
+    return 'edition-progress-refresh'
+
+
+def editions_with_progress(query):
+    """Run an Edition query joined to its rollups, filling in any missing or stale ones."""
+    query = query.outerjoin(EditionProgress, EditionProgress.edition_id == Edition.id).add_entity(EditionProgress)
+    rows = query.all()
+
+    if not _stale_ids(rows):
+        return rows
+
+    # One worker rescans at a time; the others wait and reuse its result
+    try:
+        with coordinator().lock(_refresh_lock_name(), wait=REFRESH_LOCK_WAIT):
+            rows = query.populate_existing().all()
+            stale = _stale_ids(rows)
+            if stale:
+                refresh_edition_progress(db.session.connection(bind_arguments={'mapper': EditionProgress}), stale)
+                db.session.commit()
+    except LockUnavailable:
+        return rows
+    return query.all()
+
+
+def _stale_ids(rows):
+    return [edition.id for edition, progress in rows if progress is None or progress.is_stale]
@@ -0,0 +1,219 @@
+import csv
+import io
+import json
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from models import db, User, Country, USER_ROLES
+
+# Bulk user provisioning (onboarding a whole country team at once). A batch is
+# validated in memory, checked against the database with one IN query per
+# unique column, hashed in parallel and written in a single transaction.
+# Every input row gets an entry in the returned report.
+
+FIELDS = ('username', 'email', 'password', 'role', 'country', 'is_active')
+TRUE_VALUES = {'1', 'true', 'yes', 'si', 'sí', 'y'}
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def parse_rows(data, filename=''):
+    """Rows from CSV or JSON text (a list of objects, or {"users": [...]})."""
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if filename.lower().endswith('.json') or text.lstrip().startswith(('[', '{')):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise ProvisioningError(f'JSON inválido: {e}')
+        if isinstance(rows, dict):
+            rows = rows.get('users')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ProvisioningError('Se esperaba una lista de usuarios.')
+        return rows
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'username' not in reader.fieldnames:
+        raise ProvisioningError('El CSV debe tener cabecera con al menos username y email.')
+    return list(reader)
+
+
+def _clean(row):
+    return {key: str(row[key]).strip() if row.get(key) is not None else '' for key in FIELDS}
+
+
+def _country_lookup(values):
+    # Countries may be given by id, code or name; resolved with one query
+    values = {value for value in values if value}
+    if not values:
+        return {}
+    ids = [int(value) for value in values if value.isdigit()]
+    upper = [value.upper() for value in values]
+    countries = Country.query.filter(or_(
+        Country.id.in_(ids), Country.code.in_(upper), Country.name.in_(values)
+    )).all()
+    lookup = {}
+    for country in countries:
+        lookup[str(country.id)] = country.id
+        lookup[(country.code or '').upper()] = country.id
+        lookup[country.name] = country.id
+    return {value: lookup.get(value) or lookup.get(value.upper()) for value in values}
+
+
+def _hash_passwords(passwords, workers):
+    # hashlib's scrypt/pbkdf2 release the GIL, so threads hash in parallel
+    # without the cost of starting worker processes for each request
+    if len(passwords) < 2 or workers < 2:
+        return [generate_password_hash(password) for password in passwords]
+    with ThreadPoolExecutor(max_workers=min(workers, len(passwords))) as pool:
+        return list(pool.map(generate_password_hash, passwords))
+
+
+def provision_users(rows, update_existing=False, dry_run=False, all_or_nothing=False):
+    """Create (or, with update_existing, re-role) users; returns the per-row report.
+
+    Report entries: row (1-based), username, status ('created', 'updated',
+    'valid' on dry runs, 'error' or 'skipped'), message, id and, when one was
+    generated, the initial password.
+    """
+    max_rows = current_app.config['PROVISIONING_MAX_ROWS']
+    if len(rows) > max_rows:
+        raise ProvisioningError(f'Máximo {max_rows} usuarios por lote.')
+
+    rows = [_clean(row) for row in rows]
+    report = [{'row': n, 'username': row['username'], 'status': 'error', 'message': None, 'id': None}
+              for n, row in enumerate(rows, start=1)]
+    countries = _country_lookup(row['country'] for row in rows)
+
+    existing_by_username = {}
+    existing_by_email = {}
+    usernames = [row['username'] for row in rows if row['username']]
+    emails = [row['email'] for row in rows if row['email']]
+    if usernames or emails:
+        for user in User.query.filter(or_(User.username.in_(usernames), User.email.in_(emails))):
+            existing_by_username[user.username] = user
+            existing_by_email[user.email] = user
+
+    seen_usernames, seen_emails = set(), set()
+    to_create, to_update = [], []
+    for row, entry in zip(rows, report):
+        username, email, role = row['username'], row['email'], row['role'] or 'journalist'
+        if not username or not email:
+            entry['message'] = 'Faltan username o email.'
+            continue
+        if role not in USER_ROLES:
+            entry['message'] = f'Rol desconocido: {role}.'
+            continue
+        if username in seen_usernames:
+            entry['message'] = 'Nombre de usuario repetido en el lote.'
+            continue
+        if email in seen_emails:
+            entry['message'] = 'Email repetido en el lote.'
+            continue
+        country_id = None
+        if row['country']:
+            country_id = countries.get(row['country'])
+            if country_id is None:
+                entry['message'] = f"País desconocido: {row['country']}."
+                continue
+        seen_usernames.add(username)
+        seen_emails.add(email)
+
+        existing = existing_by_username.get(username)
+        email_owner = existing_by_email.get(email)
+        if existing:
+            if not update_existing:
+                entry['status'], entry['message'], entry['id'] = 'skipped', 'El nombre de usuario ya existe.', existing.id
+            elif email_owner and email_owner is not existing:
+                entry['message'] = 'El email ya está registrado.'
+            else:
+                to_update.append((entry, existing, row, role, country_id))
+            continue
+        if email_owner:
+            entry['message'] = 'El email ya está registrado.'
+            continue
+        to_create.append((entry, row, role, country_id))
+
+    failed = any(entry['status'] == 'error' for entry in report)
+    if dry_run or (all_or_nothing and failed):
+        for entry, *_ in to_create + to_update:
+            entry['status'] = 'valid' if dry_run else 'skipped'
+            if not dry_run:
+                entry['message'] = 'Lote rechazado por errores en otras filas.'
+        return report
+
+    passwords = []
+    for entry, row, role, country_id in to_create:
+        password = row['password']
+        if not password:
+            password = entry['password'] = secrets.token_urlsafe(9)
+        passwords.append(password)
+    hashes = _hash_passwords(passwords, current_app.config['PROVISIONING_HASH_WORKERS'])
+
+    created = []
+    for (entry, row, role, country_id), password_hash in zip(to_create, hashes):
+        user = User(username=row['username'], email=row['email'], role=role, country_id=country_id,
+                    is_active=row['is_active'].lower() in TRUE_VALUES if row['is_active'] else True,
+                    password_hash=password_hash)
+        db.session.add(user)
+        created.append((entry, user))
+
+    for entry, user, row, role, country_id in to_update:
+        if row['role']:
+            user.role = role
+        if row['country']:
+            user.country_id = country_id
+        if row['is_active']:
+            user.is_active = row['is_active'].lower() in TRUE_VALUES
+        entry['status'], entry['id'] = 'updated', user.id
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Someone created a conflicting user since the IN checks ran
+        db.session.rollback()
+        for entry, *_ in to_create + to_update:
+            entry['status'], entry['message'], entry['id'] = 'error', 'Conflicto al guardar; reintente el lote.', None
+            entry.pop('password', None)
+        return report
+
+    for entry, user in created:
+        entry['status'], entry['id'] = 'created', user.id
+    return report
+
+
+def summarize(report):
+    counts = {}
+    for entry in report:
+        counts[entry['status']] = counts.get(entry['status'], 0) + 1
+    return counts
+
+
+@click.command('users-import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--update-existing', is_flag=True, help='Update role, country and status of existing usernames.')
+@click.option('--dry-run', is_flag=True, help='Validate only; nothing is written.')
+@click.option('--all-or-nothing', is_flag=True, help='Write nothing if any row fails.')
+@with_appcontext
+def import_users_command(source, update_existing, dry_run, all_or_nothing):
+    """Provision users from a CSV or JSON file."""
+    try:
+        rows = parse_rows(source.read(), source.name)
+        report = provision_users(rows, update_existing=update_existing, dry_run=dry_run,
+                                 all_or_nothing=all_or_nothing)
+    except ProvisioningError as e:
+        raise click.ClickException(str(e))
+
+    for entry in report:
+        line = f"{entry['row']:>4}  {entry['status']:<8} {entry['username']}"
+        if entry['message']:
+            line += f"  ({entry['message']})"
+        if entry.get('password'):
+            line += f"  password: {entry['password']}"
+        click.echo(line)
+    click.echo(', '.join(f'{status}: {count}' for status, count in summarize(report).items()))
@@ -0,0 +1,218 @@
+import calendar
+from datetime import datetime, timedelta
+from functools import lru_cache
+from sqlalchemy import and_, or_, func, event
+from models import db, Event, EventException
+
+# A small RFC 5545 RRULE subset: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY with
+# INTERVAL, COUNT, UNTIL and (weekly) BYDAY. A recurring series is a single
+# Event row; cancelled or moved occurrences are sparse EventException rows.
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+
+# Upper bound on occurrences generated for a single expansion
+MAX_OCCURRENCES = 1000
+
+
+@lru_cache(maxsize=256)
+def parse_rrule(text):
+    """Parse 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE' into a dict; raises ValueError."""
+    parts = {}
+    for chunk in text.upper().strip().split(';'):
+        if not chunk:
+            continue
+        key, sep, value = chunk.partition('=')
+        if not sep:
+            raise ValueError(f'Regla de recurrencia inválida: {chunk}')
+        parts[key] = value
+
+    rule = {'freq': parts.get('FREQ'), 'interval': 1, 'count': None, 'until': None, 'byday': ()}
+    if rule['freq'] not in FREQUENCIES:
+        raise ValueError('FREQ debe ser DAILY, WEEKLY, MONTHLY o YEARLY.')
+    if 'INTERVAL' in parts:
+        rule['interval'] = int(parts['INTERVAL'])
+        if rule['interval'] < 1:
+            raise ValueError('INTERVAL debe ser positivo.')
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise ValueError('COUNT y UNTIL no pueden usarse juntos.')
+    if 'COUNT' in parts:
+        rule['count'] = int(parts['COUNT'])
+    if 'UNTIL' in parts:
+        value = parts['UNTIL'].rstrip('Z')
+        fmt = '%Y%m%dT%H%M%S' if 'T' in value else '%Y%m%d'
+        rule['until'] = datetime.strptime(value, fmt)
+        if fmt == '%Y%m%d':
+            rule['until'] += timedelta(days=1, microseconds=-1)
+    if 'BYDAY' in parts:
+        if rule['freq'] != 'WEEKLY':
+            raise ValueError('BYDAY solo se admite con FREQ=WEEKLY.')
+        try:
+            rule['byday'] = tuple(sorted({WEEKDAYS[d] for d in parts['BYDAY'].split(',')}))
+        except KeyError:
+            raise ValueError('BYDAY inválido.')
+    return rule
+
+
+def _add_months(dt, months):
+    month = dt.month - 1 + months
+    year = dt.year + month // 12
+    month = month % 12 + 1
+    if dt.day > calendar.monthrange(year, month)[1]:
+        return None  # e.g. the 31st in a 30-day month: no occurrence (RFC 5545)
+    return dt.replace(year=year, month=month)
+
+
+def _iter_starts(dtstart, rule, window_start):
+    """Yield (index, occurrence start) from the first one that can reach window_start."""
+    interval = rule['interval']
+
+    if rule['freq'] == 'DAILY' or (rule['freq'] == 'WEEKLY' and not rule['byday']):
+        step = timedelta(days=interval if rule['freq'] == 'DAILY' else 7 * interval)
+        # Jump straight to the window instead of walking from dtstart
+        index = max(0, (window_start - dtstart) // step)
+        while True:
+            yield index, dtstart + index * step
+            index += 1
+
+    elif rule['freq'] == 'WEEKLY':
+        week0 = dtstart - timedelta(days=dtstart.weekday())
+        first_week = [d for d in rule['byday'] if d >= dtstart.weekday()]
+        period = timedelta(weeks=interval)
+        week = max(0, (window_start - week0) // period)
+        index = 0 if week == 0 else len(first_week) + (week - 1) * len(rule['byday'])
+        while True:
+            days = first_week if week == 0 else rule['byday']
+            for day in days:
+                yield index, week0 + week * period + timedelta(days=day)
+                index += 1
+            week += 1
+
+    else:
+        months = interval if rule['freq'] == 'MONTHLY' else 12 * interval
+        index = 0
+        step = 0
+        while True:
+            start = _add_months(dtstart, step * months)
+            if start is not None:
+                yield index, start
+                index += 1
+            step += 1
+
+
+@lru_cache(maxsize=2048)
+def expand(dtstart, rrule, duration, window_start, window_end):
+    """Occurrence starts of a series that overlap [window_start, window_end).
+
+    Pure and memoized: the arguments include the rule and start time, so an
+    edited series gets a new cache key and popular windows stay warm.
+    """
+    rule = parse_rrule(rrule)
+    starts = []
+    for index, start in _iter_starts(dtstart, rule, window_start - duration):
+        if start >= window_end or len(starts) >= MAX_OCCURRENCES:
+            break
+        if rule['count'] is not None and index >= rule['count']:
+            break
+        if rule['until'] is not None and start > rule['until']:
+            break
+        if start + duration > window_start or (not duration and start >= window_start):
+            starts.append(start)
+    return tuple(starts)
+
+
+def series_end(dtstart, rrule, duration):
+    """End of the last occurrence, or None for an unbounded series."""
+    rule = parse_rrule(rrule)
+    if rule['until'] is not None:
+        return rule['until'] + duration
+    if rule['count'] is not None:
+        last = None
+        for index, start in _iter_starts(dtstart, rule, dtstart):
+            if index >= rule['count'] or index >= MAX_OCCURRENCES:
+                break
+            last = start
+        return (last or dtstart) + duration
+    return None
+
+
+def window_filter(window_start, window_end, model=Event):
+    """SQL predicate for events that may produce occurrences in the window.
+
+    `model` is Event or ArchivedEvent (same columns).
+    """
+    single = and_(
+        model.deleted_at.is_(None),
+        model.rrule.is_(None),
+        model.start_time < window_end,
+        func.coalesce(model.end_time, model.start_time) >= window_start,
+    )
+    recurring = and_(
+        model.deleted_at.is_(None),
+        model.rrule.isnot(None),
+        model.start_time < window_end,
+        or_(model.recurrence_end.is_(None), model.recurrence_end >= window_start),
+    )
+    return or_(single, recurring)
+
+
+def exception_filter(event_ids, window_start, window_end, model=EventException):
+    return and_(
+        model.event_id.in_(event_ids),
+        or_(
+            and_(model.original_start >= window_start, model.original_start < window_end),
+            and_(model.start_time >= window_start, model.start_time < window_end),
+        ),
+    )
+
+
+def occurrences(events, exceptions, window_start, window_end):
+    """Yield (event, start, end, exception) for every occurrence in the window.
+
+    `events` and `exceptions` can be ORM objects or plain result rows.
+    """
+    overrides = {(e.event_id, e.original_start): e for e in exceptions}
+
+    for series in events:
+        duration = (series.end_time - series.start_time) if series.end_time else timedelta(0)
+        if not series.rrule:
+            yield series, series.start_time, series.end_time, None
+            continue
+
+        seen = set()
+        for start in expand(series.start_time, series.rrule, duration, window_start, window_end):
+            seen.add(start)
+            override = overrides.get((series.id, start))
+            if override is None:
+                yield series, start, (start + duration) if series.end_time else None, None
+            elif not override.is_cancelled:
+                moved_start = override.start_time or start
+                moved_end = override.end_time or (moved_start + duration)
+                if moved_start < window_end and moved_end >= window_start:
+                    yield series, moved_start, moved_end, override
+
+        # Occurrences moved into the window from outside it
+        for (event_id, original_start), override in overrides.items():
+            if event_id == series.id and original_start not in seen and not override.is_cancelled \
+                    and override.start_time and window_start <= override.start_time < window_end:
+                yield series, override.start_time, override.end_time or (override.start_time + duration), override
+
+
+@event.listens_for(db.session, 'before_flush')
+def _touch_series(session, flush_context, instances):
+    # Changing an occurrence changes the series as far as feed sync is concerned
+    now = datetime.utcnow()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, EventException):
+            continue
+        series = obj.event or (obj.event_id and session.get(Event, obj.event_id))
+        if series is None:
+            continue
+        series.updated_at = now
+        # An occurrence moved past the last one keeps the series in later windows (window_filter)
+        if obj not in session.deleted and not obj.is_cancelled and obj.start_time \
+                and series.recurrence_end is not None:
+            duration = (series.end_time - series.start_time) if series.end_time else timedelta(0)
+            moved_end = obj.end_time or (obj.start_time + duration)
+            if moved_end > series.recurrence_end:
+                series.recurrence_end = moved_end
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import re
+from datetime import datetime
+from difflib import SequenceMatcher
+from sqlalchemy import event, select, insert, inspect
+from models import db, Article, ArticleRevision
+from utils.audit import _acting_user_id
+
+# Article revision history. Every flush that changes an article's title or
+# content appends a revision. Content is stored as a delta against the
+# previous revision: a JSON list where a positive int copies that many
+# characters of the previous text, a negative int skips that many and a
+# string is inserted, e.g. [412, -9, "nuevo", 130]. A full snapshot is stored
+# instead once the deltas since the last one add up to more than the text
+# itself (or MAX_CHAIN revisions), so storage follows the size of the edits
+# rather than edits x article length, and rebuilding any revision reads at
+# most MAX_CHAIN rows.
+
+MAX_CHAIN = 50
+
+_TOKENS = re.compile(r'\s+|\S+')
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _tokens(text):
+    return _TOKENS.findall(text)
+
+
+def _opcodes(old, new):
+    # Word-level matching (cheaper and more readable than per character),
+    # converted back to character runs
+    a, b = _tokens(old), _tokens(new)
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        yield tag, ''.join(a[i1:i2]), ''.join(b[j1:j2])
+
+
+def make_delta(old, new):
+    delta = []
+    for tag, removed, added in _opcodes(old, new):
+        if tag == 'equal':
+            delta.append(len(removed))
+            continue
+        if removed:
+            delta.append(-len(removed))
+        if added:
+            delta.append(added)
+    return delta
+
+
+def apply_delta(old, delta):
+    out, pos = [], 0
+    for op in delta:
+        if isinstance(op, str):
+            out.append(op)
+        elif op > 0:
+            out.append(old[pos:pos + op])
+            pos += op
+        else:
+            pos -= op
+    return ''.join(out)
+
+
+def diff_segments(old, new):
+    """[(kind, text)] with kind 'equal', 'delete' or 'insert', for the diff view."""
+    segments = []
+    for tag, removed, added in _opcodes(old or '', new or ''):
+        if tag == 'equal':
+            segments.append(('equal', removed))
+            continue
+        if removed:
+            segments.append(('delete', removed))
+        if added:
+            segments.append(('insert', added))
+    return segments
+
+
+def _rebuild(rows):
+    # rows: the snapshot followed by its deltas, in order
+    text = ''
+    for row in rows:
+        text = (row.data or '') if row.number == row.snapshot_number else apply_delta(text, json.loads(row.data))
+    return text
+
+
+def _chain(connection, article_id, number):
+    table = ArticleRevision.__table__
+    snapshot = (select(table.c.snapshot_number)
+                .where(table.c.article_id == article_id, table.c.number == number)
+                .scalar_subquery())
+    return connection.execute(
+        select(table).where(table.c.article_id == article_id,
+                            table.c.number <= number, table.c.number >= snapshot)
+        .order_by(table.c.number)
+    ).all()
+
+
+def get_revision(article_id, number):
+    """The revision as a dict (title, content, ...) or None."""
+    rows = _chain(db.session.connection(bind_arguments={'mapper': ArticleRevision}), article_id, number)
+    if not rows:
+        return None
+    last = rows[-1]
+    return {'number': last.number, 'title': last.title, 'content': _rebuild(rows),
+            'user_id': last.user_id, 'created_at': last.created_at,
+            'is_snapshot': last.number == last.snapshot_number}
+
+
+def list_revisions(article_id):
+    table = ArticleRevision.__table__
+    return db.session.execute(
+        select(table.c.number, table.c.snapshot_number, table.c.title, table.c.content_length,
+               table.c.user_id, table.c.created_at)
+        .where(table.c.article_id == article_id)
+        .order_by(table.c.number.desc())
+    ).all()
+
+
+def _previous_value(state, key):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+def _record(connection, obj, state, is_new, user_id, now):
+    table = ArticleRevision.__table__
+    content = obj.content or ''
+    content_hash = _hash(content)
+    last = connection.execute(
+        select(table.c.number, table.c.snapshot_number, table.c.title, table.c.content_hash, table.c.chain_size)
+        .where(table.c.article_id == obj.id)
+        .order_by(table.c.number.desc()).limit(1)
+    ).first()
+
+    rows = []
+    previous = _previous_value(state, 'content')
+    if last is None:
+        if not is_new and previous is not None:
+            # First edit since history was introduced: keep the version being replaced
+            rows.append({'number': 1, 'snapshot_number': 1, 'title': _previous_value(state, 'title'),
+                         'data': previous, 'content_hash': _hash(previous),
+                         'content_length': len(previous), 'chain_size': 0, 'user_id': None,
+                         'created_at': now})
+            base, number, snapshot_number, chain_size = previous, 2, 1, 0
+        else:
+            base, number = None, 1
+    else:
+        if last.content_hash == content_hash and last.title == obj.title:
+            return
+        number, snapshot_number, chain_size = last.number + 1, last.snapshot_number, last.chain_size
+        if previous is not None and _hash(previous) == last.content_hash:
+            base = previous
+        else:
+            base = _rebuild(_chain(connection, obj.id, last.number))
+
+    data = None
+    if base is not None and number - snapshot_number < MAX_CHAIN:
+        data = json.dumps(make_delta(base, content), ensure_ascii=False, separators=(',', ':'))
+        chain_size += len(data)
+        if chain_size > max(len(content), 1):
+            data = None
+    if data is None:
+        data, snapshot_number, chain_size = content, number, 0
+
+    rows.append({'number': number, 'snapshot_number': snapshot_number, 'title': obj.title, 'data': data,
+                 'content_hash': content_hash, 'content_length': len(content), 'chain_size': chain_size,
+                 'user_id': user_id, 'created_at': now})
+    connection.execute(insert(table), [dict(row, article_id=obj.id) for row in rows])
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_revisions(session, flush_context):
+    changed = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Article) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        is_new = obj in session.new
+        if is_new or state.attrs.title.history.has_changes() or state.attrs.content.history.has_changes():
+            changed.append((obj, state, is_new))
+    if not changed:
+        return
+
+    connection = session.connection(bind_arguments={'mapper': ArticleRevision})
+    user_id = _acting_user_id()
+    now = datetime.utcnow()
+    for obj, state, is_new in changed:
+        _record(connection, obj, state, is_new, user_id, now)
@@ -0,0 +1,101 @@
+from flask import g, has_request_context
+from sqlalchemy import event, select, update, false
+from sqlalchemy.orm import with_loader_criteria
+from models import db, Edition, Article, Event, EmbassyList, Embassy, ArchivedEdition, ArchivedArticle, ArchivedEvent
+
+# Row-level country scoping. Every ORM SELECT issued while serving a logged-in
+# user gets the country predicate of each scoped entity added to it, so routes
+# can query (or session.get) normally and rows from other countries are never
+# loaded. Roles listed here see every country for that entity.
+EXEMPT_ROLES = {
+    Edition: ('admin',),
+    Article: ('admin',),
+    Event: ('admin',),
+    EmbassyList: ('admin', 'coordinator'),
+    Embassy: ('admin', 'coordinator'),
+    ArchivedEdition: ('admin',),
+    ArchivedArticle: ('admin',),
+    ArchivedEvent: ('admin',),
+}
+
+
+def country_criteria(entity, country_id):
+    if country_id is None:
+        return false()
+    if entity is Embassy:
+        return Embassy.list_id.in_(select(EmbassyList.id).where(EmbassyList.country_id == country_id))
+    return entity.country_id == country_id
+
+
+def _scoped_user():
+    if not has_request_context():
+        return None
+    # Read what Flask-Login already loaded; touching current_user here would
+    # recurse into the user loader's own query.
+    user = g.get('_login_user')
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _apply_country_scope(state):
+    if not state.is_select or state.is_column_load or state.is_relationship_load:
+        return
+    if state.execution_options.get('skip_country_scope'):
+        return
+
+    user = _scoped_user()
+    if user is None:
+        return
+
+    options = [
+        with_loader_criteria(entity, country_criteria(entity, user.country_id), include_aliases=True)
+        for entity, roles in EXEMPT_ROLES.items()
+        if user.role not in roles
+    ]
+    if options:
+        state.statement = state.statement.options(*options)
+
+
+# Article.country_id is a denormalized copy of its edition's country so
+# scoped article queries never need to join Edition.
+
+def _edition_country(session, edition_id):
+    # Plain Core on the flush connection: no autoflush and no scoping criteria
+    table = Edition.__table__
+    return session.connection(bind_arguments={'mapper': Edition}).execute(
+        select(table.c.country_id).where(table.c.id == int(edition_id))
+    ).scalar()
+
+
+@event.listens_for(db.session, 'before_flush')
+def _sync_article_country(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Article):
+            continue
+        edition_changed = db.inspect(obj).attrs.edition_id.history.has_changes()
+        if obj.country_id is not None and not edition_changed:
+            continue
+
+        edition = obj.__dict__.get('edition')
+        if obj.edition_id and (edition_changed or edition is None):
+            obj.country_id = _edition_country(session, obj.edition_id)
+        elif edition is not None:
+            # Assigned through the relationship; edition_id is only filled in during the flush
+            obj.country_id = edition.country_id
+
+
+@event.listens_for(db.session, 'after_flush')
+def _propagate_edition_country(session, flush_context):
+    for obj in session.dirty:
+        if not isinstance(obj, Edition):
+            continue
+        if not db.inspect(obj).attrs.country_id.history.has_changes():
+            continue
+        session.connection(bind_arguments={'mapper': Article}).execute(
+            update(Article.__table__)
+            .where(Article.__table__.c.edition_id == obj.id)
+            .values(country_id=obj.country_id)
+        )
+
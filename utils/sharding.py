@@ -0,0 +1,304 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import click
+from flask import abort, current_app, g, has_app_context, request, session
+from flask.cli import with_appcontext
+from flask_login import current_user
+from sqlalchemy import create_engine, delete, event, func, insert, inspect, select, text, update
+from sqlalchemy.sql.util import find_tables
+from models import (db, Country, Edition, Article, ArticleImage, ArticleRevision, EditionProgress, Event,
+                    EventException, ArchivedEdition, ArchivedArticle, ArchivedArticleImage,
+                    ArchivedArticleRevision, ArchivedEvent, ArchivedEventException, AuditLog)
+
+# Optional per-country databases (SHARD_BY_COUNTRY). Editions, articles and
+# events (with their children, rollups and archive tables) live in one
+# database per country: a SQLite file under SHARDS_FOLDER, or a `country_<id>`
+# schema when the main database is PostgreSQL. Users, countries, manuals,
+# embassies, the audit log and the coordination tables stay in the main
+# database, which every shard can also read (ATTACHed as `global` on SQLite,
+# `public` on the search_path on PostgreSQL), so joins to users keep working.
+#
+# RoutingSession (models.py) asks the router for an engine on every
+# statement. A request uses the logged-in user's country; admins work in one
+# country at a time (picked with ?shard=<country id> and kept in the session)
+# and cross-country listings call fan_out(), which queries every shard on a
+# thread pool of SHARD_QUERY_WORKERS and returns the per-country results.
+#
+# Ids are per shard, so an admin link into another country carries its shard.
+# Commits touching both a shard and the main database are not atomic across
+# the two. The async API (asgi.py) has no shard engines, so with sharding on
+# it hands the calendar API to the Flask app like every other path.
+
+log = logging.getLogger(__name__)
+
+SHARDED_MODELS = (Edition, Article, ArticleImage, ArticleRevision, EditionProgress, Event, EventException,
+                  ArchivedEdition, ArchivedArticle, ArchivedArticleImage, ArchivedArticleRevision,
+                  ArchivedEvent, ArchivedEventException)
+SHARDED_TABLES = frozenset(model.__table__ for model in SHARDED_MODELS)
+
+
+class ShardRequired(RuntimeError):
+    """A per-country table was queried with no country selected."""
+
+
+class UnknownShard(LookupError):
+    """A database was asked for a country id that is not in Country."""
+
+
+def _country_rows(table, country_id):
+    # Predicate selecting one country's rows, for `flask shards split`
+    if 'country_id' in table.c:
+        return table.c.country_id == country_id
+    parents = {
+        'article_id': (Article.__table__, ArchivedArticle.__table__),
+        'edition_id': (Edition.__table__, ArchivedEdition.__table__),
+        'event_id': (Event.__table__, ArchivedEvent.__table__),
+    }
+    for column, (hot, archived) in parents.items():
+        if column in table.c:
+            parent = archived if table.name.startswith('archived_') else hot
+            return table.c[column].in_(select(parent.c.id).where(parent.c.country_id == country_id))
+    raise ValueError(f'No country predicate for {table.name}')
+
+
+class ShardRouter:
+    def __init__(self, app):
+        self.app = app
+        self.folder = app.config['SHARDS_FOLDER']
+        self.workers = app.config['SHARD_QUERY_WORKERS']
+        self.engines = {}
+        self.mutex = threading.Lock()
+        self.pool = None
+        with app.app_context():
+            self.main = db.engine
+
+    def bind_for(self, mapper, clause):
+        tables = set()
+        if mapper is not None:
+            tables.update(inspect(mapper).tables)
+        if clause is not None:
+            tables.update(find_tables(clause, include_crud=True))
+        if tables.isdisjoint(SHARDED_TABLES):
+            return None
+        return self.engine(current_shard())
+
+    def engine(self, country_id):
+        engine = self.engines.get(country_id)
+        if engine is None:
+            with self.mutex:
+                engine = self.engines.get(country_id)
+                if engine is None:
+                    engine = self.engines[country_id] = self._create(country_id)
+        return engine
+
+    def _create(self, country_id):
+        # Never create a database for an id that arrived in a request but names no country
+        with self.main.connect() as conn:
+            table = Country.__table__
+            if conn.execute(select(table.c.id).where(table.c.id == int(country_id))).first() is None:
+                raise UnknownShard(country_id)
+        if self.main.dialect.name == 'postgresql':
+            schema = f'country_{int(country_id)}'
+            with self.main.begin() as conn:
+                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {schema}'))
+            engine = create_engine(self.main.url, connect_args={'options': f'-csearch_path={schema},public'})
+        else:
+            os.makedirs(self.folder, exist_ok=True)
+            engine = create_engine('sqlite:///' + os.path.join(self.folder, f'country_{int(country_id)}.db'))
+            main_path = self.main.url.database
+
+            @event.listens_for(engine, 'connect')
+            def _attach_main(dbapi_connection, connection_record):
+                # Unqualified names fall through to attached databases, so `user` resolves here
+                dbapi_connection.execute('ATTACH DATABASE ? AS global', (main_path,))
+
+        db.metadata.create_all(engine, tables=[model.__table__ for model in SHARDED_MODELS])
+        return engine
+
+    def fan_out(self, func, country_ids=None):
+        """{country_id: func()} with func run once per shard, concurrently."""
+        if country_ids is None:
+            with self.main.connect() as conn:
+                country_ids = conn.execute(select(Country.__table__.c.id).order_by(Country.__table__.c.id)).scalars().all()
+        if self.pool is None:
+            with self.mutex:
+                if self.pool is None:
+                    self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard-query')
+
+        def run(country_id):
+            with self.app.app_context():
+                g._shard = country_id
+                try:
+                    return func()
+                finally:
+                    db.session.remove()
+
+        futures = {country_id: self.pool.submit(run, country_id) for country_id in country_ids}
+        return {country_id: future.result() for country_id, future in futures.items()}
+
+
+def enabled():
+    return has_app_context() and 'shard_router' in current_app.extensions
+
+
+def current_shard():
+    country_id = g.get('_shard') if has_app_context() else None
+    if country_id is None:
+        raise ShardRequired('No country selected for a per-country table')
+    return country_id
+
+
+@contextmanager
+def use(country_id):
+    """Route per-country tables to `country_id` inside the block (no-op without sharding)."""
+    previous = g.get('_shard')
+    g._shard = int(country_id) if country_id is not None else None
+    try:
+        yield
+    finally:
+        g._shard = previous
+
+
+def each_shard():
+    """Run the loop body once per country database (just once without sharding)."""
+    if not enabled():
+        yield None
+        return
+    for country_id in db.session.execute(select(Country.id).order_by(Country.id)).scalars().all():
+        with use(country_id):
+            yield country_id
+
+
+def fan_out(func, country_ids=None):
+    """Run func() once per country and return {country_id: result}.
+
+    Without sharding func() just runs once here, and the result is keyed by None.
+    """
+    if not enabled():
+        return {None: func()}
+    return current_app.extensions['shard_router'].fan_out(func, country_ids)
+
+
+def shard_args(obj):
+    """url_for() arguments that select `obj`'s country, for admin links out of fan_out() listings."""
+    return {'shard': obj.country_id} if enabled() else {}
+
+
+def route_to(country_id):
+    """Use `country_id`'s database for the rest of the request (the first country's when None)."""
+    if country_id is None:
+        country_id = db.session.execute(select(func.min(Country.id))).scalar()
+    g._shard = country_id
+
+
+def _select_shard():
+    if not current_user.is_authenticated:
+        return
+    country_id = current_user.country_id
+    if current_user.role == 'admin':
+        requested = request.args.get('shard', type=int)
+        if requested:
+            # Only existing countries: the router creates a database for any id it is given
+            if db.session.get(Country, requested) is None:
+                abort(404)
+            session['shard'] = requested
+        country_id = session.get('shard') or country_id
+    route_to(country_id)
+
+
+@click.group('shards')
+def shards_cli():
+    """Per-country databases (SHARD_BY_COUNTRY)."""
+
+
+@shards_cli.command('init')
+@with_appcontext
+def init_command():
+    """Create the database of every country."""
+    router = _router()
+    for country in Country.query.order_by(Country.id):
+        router.engine(country.id)
+        click.echo(f'{country.name}: ok')
+
+
+@shards_cli.command('split')
+@click.option('--country', 'country_id', type=int, help='Only this country.')
+@click.option('--delete', 'delete_copied', is_flag=True, help='Remove the copied rows from the main database.')
+@click.option('--batch-size', type=int, default=1000)
+@with_appcontext
+def split_command(country_id, delete_copied, batch_size):
+    """Copy each country's rows from the main database into its own."""
+    router = _router()
+    query = Country.query.order_by(Country.id)
+    if country_id:
+        query = query.filter(Country.id == country_id)
+    # Parents are copied first so the children's foreign keys resolve, and
+    # deleted last: the children's predicates look them up in the main database
+    tables = [model.__table__ for model in SHARDED_MODELS]
+    for country in query:
+        target = router.engine(country.id)
+        with router.main.connect() as source, target.begin() as dest:
+            for table in tables:
+                predicate = _country_rows(table, country.id)
+                copied = 0
+                for rows in source.execute(select(table).where(predicate)).mappings().partitions(batch_size):
+                    dest.execute(insert(table), [dict(row) for row in rows])
+                    copied += len(rows)
+                if copied:
+                    click.echo(f'{country.name}: {table.name} {copied}')
+            _advance_ids(dest)
+        with router.main.begin() as conn:
+            # History recorded before the split: tag it with the country before ids start
+            # repeating. Archived rows keep their ids, and their history its entity name
+            audit = AuditLog.__table__
+            for table in tables:
+                if 'id' in table.c:
+                    entities = {table.name, table.name.split('archived_', 1)[-1]}
+                    conn.execute(update(audit).where(
+                        audit.c.entity.in_(entities), audit.c.shard_id.is_(None),
+                        audit.c.entity_id.in_(select(table.c.id).where(_country_rows(table, country.id))),
+                    ).values(shard_id=country.id))
+            if delete_copied:
+                for table in reversed(tables):
+                    conn.execute(delete(table).where(_country_rows(table, country.id)))
+
+
+def _advance_ids(conn):
+    # Copied rows carry their ids: new rows must start above them and above the
+    # archived copies (see ARCHIVED_IDS in models.py)
+    for archived in (model.__table__ for model in SHARDED_MODELS):
+        if not archived.name.startswith('archived_'):
+            continue
+        hot = db.metadata.tables[archived.name[len('archived_'):]]
+        highest = max(conn.execute(select(func.max(table.c.id))).scalar() or 0 for table in (hot, archived))
+        if not highest:
+            continue
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text('SELECT setval(pg_get_serial_sequence(:table, \'id\'), :value)'),
+                         {'table': hot.name, 'value': highest})
+        elif conn.dialect.name == 'sqlite':
+            updated = conn.execute(text('UPDATE sqlite_sequence SET seq = max(seq, :value) WHERE name = :table'),
+                                   {'table': hot.name, 'value': highest}).rowcount
+            if not updated:
+                conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :value)'),
+                             {'table': hot.name, 'value': highest})
+
+
+def _router():
+    if not enabled():
+        raise click.ClickException('SHARD_BY_COUNTRY is off.')
+    return current_app.extensions['shard_router']
+
+
+def init_app(app):
+    app.cli.add_command(shards_cli)
+    app.jinja_env.globals.update(shard_args=shard_args)
+    if not app.config['SHARD_BY_COUNTRY']:
+        return
+    app.extensions['shard_router'] = ShardRouter(app)
+    app.before_request(_select_shard)
+    app.context_processor(lambda: {'shard_countries': Country.query.order_by(Country.name).all()
+                                   if current_user.is_authenticated and current_user.role == 'admin' else []})
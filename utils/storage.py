@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from models import db, ArticleImage, ArchivedArticleImage, Embassy, User, Manual
+from utils.coordination import coordinator, LockUnavailable
+from utils import sharding
+
+# Reconciliation between upload folders and the rows that reference them.
+# Folders are streamed with os.scandir and the referenced filenames are read
+# from the database in keyset chunks into a scratch SQLite index on disk, so
+# memory stays flat whether a folder holds a thousand files or millions.
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+SCAN_BATCH = 1000
+
+
+def _static(*parts):
+    return os.path.join(current_app.root_path, 'static', *parts)
+
+
+# name -> (folder, column, prefix stored in the DB before the folder-relative path, subfolders to skip)
+def stores():
+    return {
+        # ArticleImage.filename is relative to static/ ('uploads/articles/YYYY/M/...')
+        'articles': (_static('uploads'), ArticleImage.filename, 'uploads/', ()),
+        'embassies': (current_app.config['EMBASSIES_FOLDER'], Embassy.photo_filename, '', ()),
+        'users': (current_app.config['USERS_FOLDER'], User.profile_photo, '', ()),
+        'manuals': (_static('manuals'), Manual.filename, '', ('thumbnails',)),
+        'manual_thumbnails': (_static('manuals', 'thumbnails'), Manual.thumbnail, '', ()),
+    }
+
+
+# Archived rows (utils.archive) still own their files
+ARCHIVED_REFERENCES = {'articles': ArchivedArticleImage.filename}
+
+
+def remove_stored_file(path):
+    """Delete an uploaded file; a file that is already gone is not an error."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        log.warning('Could not delete %s', path, exc_info=True)
+        return False
+    return True
+
+
+def _scan(folder, skip=()):
+    # Iterative walk: yields (path relative to folder, DirEntry) for every file
+    stack = ['']
+    while stack:
+        relative = stack.pop()
+        try:
+            iterator = os.scandir(os.path.join(folder, relative) if relative else folder)
+        except FileNotFoundError:
+            continue
+        with iterator:
+            for entry in iterator:
+                if entry.name.startswith('.'):
+                    continue
+                path = f'{relative}/{entry.name}' if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if path not in skip:
+                        stack.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield path, entry
+
+
+def _load_references(scratch, column, prefix):
+    # Keyset over the primary key so no chunk holds more than CHUNK_SIZE rows
+    model = column.class_
+    table = model.__table__.name
+    pk = model.__mapper__.primary_key[0]
+    last_id = None
+    while True:
+        stmt = select(pk, column).where(column.isnot(None)).order_by(pk).limit(CHUNK_SIZE)
+        if last_id is not None:
+            stmt = stmt.where(pk > last_id)
+        rows = db.session.execute(stmt, execution_options={'skip_country_scope': True}).all()
+        if not rows:
+            return
+        scratch.executemany(
+            'INSERT OR IGNORE INTO known (name, row_id, source) VALUES (?, ?, ?)',
+            [(value[len(prefix):] if prefix and value.startswith(prefix) else value, row_id, table)
+             for row_id, value in rows if value],
+        )
+        last_id = rows[-1][0]
+
+
+def reconcile(name, delete=False, min_age=3600):
+    """Yield findings for one store: dicts with kind 'orphan' or 'missing'.
+
+    Orphans younger than min_age seconds are skipped: uploads are written to
+    disk before the row that references them is committed.
+    """
+    folder, column, prefix, skip = stores()[name]
+    cutoff = time.time() - min_age
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        scratch = sqlite3.connect(os.path.join(scratch_dir, 'reconcile.db'))
+        try:
+            scratch.execute('CREATE TABLE known (name TEXT PRIMARY KEY, row_id INTEGER, source TEXT)')
+            scratch.execute('CREATE TABLE seen (name TEXT PRIMARY KEY)')
+            for source in [column] + ([ARCHIVED_REFERENCES[name]] if name in ARCHIVED_REFERENCES else []):
+                # Per-country tables are read from every country's database (utils.sharding)
+                for _ in sharding.each_shard() if source.class_.__table__ in sharding.SHARDED_TABLES else [None]:
+                    _load_references(scratch, source, prefix)
+
+            def check(batch):
+                names = [path for path, _ in batch]
+                placeholders = ','.join('?' * len(names))
+                found = {row[0] for row in scratch.execute(
+                    f'SELECT name FROM known WHERE name IN ({placeholders})', names)}
+                scratch.executemany('INSERT OR IGNORE INTO seen (name) VALUES (?)', [(n,) for n in found])
+                for path, entry in batch:
+                    if path in found:
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_mtime > cutoff:
+                        continue
+                    deleted = delete and remove_stored_file(entry.path)
+                    yield {'store': name, 'kind': 'orphan', 'path': entry.path, 'size': stat.st_size,
+                           'deleted': bool(deleted)}
+
+            batch = []
+            for item in _scan(folder, skip):
+                batch.append(item)
+                if len(batch) >= SCAN_BATCH:
+                    yield from check(batch)
+                    batch = []
+            if batch:
+                yield from check(batch)
+
+            missing = scratch.execute(
+                'SELECT known.name, known.row_id, known.source FROM known LEFT JOIN seen ON seen.name = known.name '
+                'WHERE seen.name IS NULL ORDER BY known.source, known.row_id')
+            for filename, row_id, table in missing:
+                yield {'store': name, 'kind': 'missing', 'table': table, 'id': row_id,
+                       'path': os.path.join(folder, filename)}
+        finally:
+            scratch.close()
+
+
+@click.command('storage-reconcile')
+@click.option('--store', 'names', multiple=True, help='Only these stores (articles, embassies, users, manuals, manual_thumbnails).')
+@click.option('--delete', is_flag=True, help='Delete orphaned files.')
+@click.option('--min-age', default=3600, show_default=True, help='Ignore orphans modified less than this many seconds ago.')
+@click.option('--json', 'as_json', is_flag=True, help='One JSON object per finding.')
+@with_appcontext
+def reconcile_command(names, delete, min_age, as_json):
+    """Report (and optionally delete) orphaned uploads and rows whose file is missing."""
+    available = stores()
+    for name in names:
+        if name not in available:
+            raise click.BadParameter(f'unknown store {name}', param_hint='--store')
+
+    try:
+        with coordinator().lock('storage-reconcile'):
+            _reconcile_stores(names or available, delete, min_age, as_json)
+    except LockUnavailable:
+        raise click.ClickException('Another storage-reconcile run is in progress.')
+
+
+def _reconcile_stores(names, delete, min_age, as_json):
+    for name in names:
+        orphans = missing = freed = 0
+        for finding in reconcile(name, delete=delete, min_age=min_age):
+            if as_json:
+                click.echo(json.dumps(finding))
+            elif finding['kind'] == 'orphan':
+                action = 'deleted' if finding['deleted'] else 'orphan'
+                click.echo(f"{action:<8} {finding['path']} ({finding['size']} bytes)")
+            else:
+                click.echo(f"missing  {finding['table']} #{finding['id']}: {finding['path']}")
+            if finding['kind'] == 'orphan':
+                orphans += 1
+                freed += finding['size'] if finding['deleted'] else 0
+            else:
+                missing += 1
+        if not as_json:
+            summary = f'[{name}] {orphans} orphaned files, {missing} rows with missing files'
+            if delete:
+                summary += f', {freed} bytes freed'
+            click.echo(summary)
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_command)
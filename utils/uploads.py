@@ -0,0 +1,201 @@
+import errno
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+from flask import current_app, flash, redirect, request
+from flask_login import current_user
+from models import db
+
+# Resumable (tus-like) uploads are staged as <id>.part next to an <id>.json
+# sidecar. The current offset is simply the size of the .part file, so any
+# worker can resume an upload another worker started. Writers take an flock
+# on the .part file, which the kernel drops if the worker dies mid-chunk.
+
+STREAM_BLOCK_SIZE = 64 * 1024
+STALE_UPLOAD_SECONDS = 24 * 3600
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _staging_dir():
+    path = current_app.config['CHUNKED_UPLOAD_FOLDER']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _paths(upload_id):
+    # ids are generated by us; reject anything else before touching the filesystem
+    try:
+        upload_id = uuid.UUID(upload_id).hex
+    except (ValueError, TypeError, AttributeError):
+        raise UploadError('Subida no encontrada.', 404)
+    base = os.path.join(_staging_dir(), upload_id)
+    return base + '.part', base + '.json'
+
+
+def _load_meta(upload_id, user_id):
+    part_path, meta_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise UploadError('Subida no encontrada.', 404)
+    if meta['user_id'] != user_id:
+        raise UploadError('Subida no encontrada.', 404)
+    meta['offset'] = os.path.getsize(part_path)
+    return meta
+
+
+def create_upload(filename, length, user_id):
+    max_length = current_app.config['CHUNKED_UPLOAD_MAX_LENGTH']
+    if length is None or length < 0:
+        raise UploadError('Tamaño de archivo inválido.')
+    if max_length and length > max_length:
+        raise UploadError('El archivo excede el tamaño máximo permitido.', 413)
+
+    purge_stale_uploads()
+
+    upload_id = uuid.uuid4().hex
+    part_path, meta_path = _paths(upload_id)
+    open(part_path, 'wb').close()
+    meta = {'id': upload_id, 'filename': filename, 'length': length,
+            'user_id': user_id, 'created_at': time.time()}
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return upload_id
+
+
+def upload_status(upload_id, user_id):
+    return _load_meta(upload_id, user_id)
+
+
+def append_chunk(upload_id, user_id, offset, stream):
+    """Stream a chunk to the end of the staged file in fixed-size blocks."""
+    meta = _load_meta(upload_id, user_id)
+    part_path, _ = _paths(upload_id)
+
+    with open(part_path, 'ab') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Otra parte de este archivo se está subiendo.', 409)
+        # Re-read under the lock: a writer may have finished since _load_meta
+        if offset != os.fstat(f.fileno()).st_size:
+            raise UploadError('El offset no coincide con el estado de la subida.', 409)
+
+        remaining = meta['length'] - offset
+        while True:
+            block = stream.read(STREAM_BLOCK_SIZE)
+            if not block:
+                break
+            if len(block) > remaining:
+                # Keep what fits; the client sent more than it declared
+                f.write(block[:remaining])
+                raise UploadError('Los datos exceden el tamaño declarado.', 413)
+            f.write(block)
+            remaining -= len(block)
+        # Closing the file releases the lock
+
+    return os.path.getsize(part_path)
+
+
+def cancel_upload(upload_id, user_id):
+    _load_meta(upload_id, user_id)
+    for path in _paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_stale_uploads(max_age=STALE_UPLOAD_SECONDS):
+    # The .part grows with every chunk while the .json sidecar is written once,
+    # so an upload is stale only when the newer of the pair is past max_age.
+    cutoff = time.time() - max_age
+    uploads = {}
+    with os.scandir(_staging_dir()) as entries:
+        for entry in entries:
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            stem = os.path.splitext(entry.name)[0]
+            newest, paths = uploads.get(stem, (0, []))
+            uploads[stem] = (max(newest, mtime), paths + [entry.path])
+    for newest, paths in uploads.values():
+        if newest >= cutoff:
+            continue
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def move_into_place(src, dst):
+    """Atomically move src to dst, copying through a temp file when crossing filesystems."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = dst + '.part'
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        os.remove(src)
+
+
+class StagedUpload:
+    """A completed chunked upload that quacks like werkzeug's FileStorage."""
+
+    def __init__(self, upload_id, filename):
+        self.upload_id = upload_id
+        self.filename = filename
+
+    def save(self, dst):
+        part_path, meta_path = _paths(self.upload_id)
+        move_into_place(part_path, dst)
+        os.remove(meta_path)
+
+
+def _staged(upload_id, user_id):
+    meta = _load_meta(upload_id, user_id)
+    if meta['offset'] != meta['length']:
+        raise UploadError('La subida del archivo no se completó.')
+    return StagedUpload(meta['id'], meta['filename'])
+
+
+def incoming_files(field):
+    """Files posted directly under `field` plus any staged through /uploads as `<field>_upload`.
+
+    Raises UploadError when a staged upload is missing, incomplete or not the
+    user's; call it before saving anything so the form can be sent back.
+    """
+    files = [f for f in request.files.getlist(field) if f and f.filename]
+    for upload_id in request.form.getlist(f'{field}_upload'):
+        files.append(_staged(upload_id, current_user.id))
+    return files
+
+
+def incoming_file(field):
+    files = incoming_files(field)
+    return files[0] if files else None
+
+
+def _form_upload_error(e):
+    # A form named a staged upload it can't use: drop the form's changes and
+    # send the user back to it (the /uploads API answers in JSON instead)
+    db.session.rollback()
+    flash(str(e))
+    return redirect(request.url)
+
+
+def init_app(app):
+    app.register_error_handler(UploadError, _form_upload_error)
@@ -0,0 +1,62 @@
+import os
+import zipfile
+
+# ZIP archives written straight into a streaming response. zipfile works on
+# non-seekable outputs (it emits data descriptors instead of seeking back), so
+# each entry is compressed into a small spool that is drained after every
+# block; no more than one block plus headers is ever held in memory.
+
+BLOCK_SIZE = 64 * 1024
+
+# Already-compressed formats are stored as-is
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.pdf', '.mp4'}
+
+
+class _Spool:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _drain(spool):
+    data = spool.drain()
+    if data:
+        yield data
+
+
+def stream_zip(entries):
+    """Yield the bytes of a ZIP of `entries`.
+
+    `entries` yields (arcname, data) pairs where data is bytes/str content or
+    ('file', path) to copy a file from disk block by block.
+    """
+    spool = _Spool()
+    with zipfile.ZipFile(spool, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for arcname, data in entries:
+            if isinstance(data, tuple):
+                path = data[1]
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                stored = os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+                info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                    while True:
+                        block = source.read(BLOCK_SIZE)
+                        if not block:
+                            break
+                        target.write(block)
+                        yield from _drain(spool)
+            else:
+                archive.writestr(arcname, data)
+            yield from _drain(spool)
+    yield from _drain(spool)
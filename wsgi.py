@@ -0,0 +1,14 @@
+"""WSGI entry point for gunicorn.
+
+    gunicorn wsgi:app
+
+Besides building the app, this starts the background jobs (housekeeping,
+archive, db-optimize; see utils.coordination), which create_app() alone
+leaves stopped for the flask CLI and scripts. Don't combine with --preload:
+the job threads must start in each worker, not in the master.
+"""
+from app import create_app
+from utils.coordination import start_background_jobs
+
+app = create_app()
+start_background_jobs(app)